@@ -0,0 +1,32 @@
+import argparse
+import time
+import numpy
+from nutils import mesh
+from . import log
+
+parser = argparse.ArgumentParser(description='benchmark the construction of a hierarchical basis on an adaptively refined mesh')
+parser.add_argument('--nelems', type=int, default=100000, help='the approximate number of elements; defaults to 100000')
+parser.add_argument('--nrefine', type=int, default=3, help='the number of refinement levels; defaults to 3')
+parser.add_argument('--basis', default='th-spline', help='the hierarchical basis type; defaults to th-spline')
+parser.add_argument('--degree', type=int, default=2, help='the degree of the basis; defaults to 2')
+args = parser.parse_args()
+
+# Refine the elements of a unit square that are close to a circle, halving the
+# width of the refined band with every level. The band of level l, of width
+# 2^-(l+2) and length π/2, covers about π/8 2^l n^2 elements of that level,
+# with n the number of elements per dimension of the base mesh. Refining them
+# adds three times as many elements, such that the mesh has about
+# (1 + 3π/8 (2^L - 1)) n^2 elements after L levels.
+n = max(4, round((args.nelems / (1 + 3 * numpy.pi / 8 * (2**args.nrefine - 1)))**.5))
+topo, geom = mesh.rectilinear([numpy.linspace(0, 1, n+1)]*2)
+for level in range(args.nrefine):
+    centers = topo.sample('gauss', 1).eval(geom)
+    distance = abs(numpy.linalg.norm(centers - .5, axis=1) - .25)
+    topo = topo.refined_by(numpy.where(distance < .125 / 2**level)[0])
+
+log.info(f'constructing a {args.basis} basis of degree {args.degree} on {len(topo)} elements in {args.nrefine+1} levels')
+
+t0 = time.perf_counter()
+basis = topo.basis(args.basis, degree=args.degree)
+t1 = time.perf_counter()
+log.info(f'{args.basis} basis with {len(basis)} dofs: {t1-t0:.2f}s')
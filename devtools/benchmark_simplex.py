@@ -0,0 +1,43 @@
+import argparse
+import itertools
+import time
+import numpy
+from nutils import mesh
+from . import log
+
+parser = argparse.ArgumentParser(description='benchmark the import of a tetrahedral mesh via `mesh.simplex`')
+parser.add_argument('--nelems', type=int, default=1000000, help='the approximate number of tetrahedra; defaults to 1000000')
+args = parser.parse_args()
+
+# Kuhn triangulation of a cube of n^3 unit cells, each of which is split in
+# six tetrahedra along the paths from its lowest to its highest vertex. As
+# vertex numbers increase along every path, the nodes are sorted per simplex.
+n = max(2, round((args.nelems / 6)**(1/3)))
+strides = numpy.array([(n+1)**2, n+1, 1])
+cells = numpy.arange(n**3)
+cellorigin = (cells[:, numpy.newaxis] // (n**2, n, 1) % n) @ strides
+paths = numpy.array([numpy.cumsum([0, *strides[list(perm)]]) for perm in itertools.permutations(range(3))])
+nodes = (cellorigin[:, numpy.newaxis, numpy.newaxis] + paths).reshape(-1, 4)
+coords = numpy.stack(numpy.meshgrid(*[numpy.arange(n+1.)]*3, indexing='ij'), axis=-1).reshape(-1, 3)
+
+# Volume groups of the left and right halves, a boundary group of the left
+# face and an interface group of the midplane, the latter two given as
+# (element, edge) pairs where edge i is opposite to vertex i.
+x = coords[nodes, 0]
+edgex = numpy.stack([numpy.delete(x, i, axis=1) for i in range(4)], axis=1)
+left = x.mean(axis=1) < n // 2
+tags = dict(left=numpy.where(left)[0], right=numpy.where(~left)[0])
+btags = dict(leftface=numpy.argwhere((edgex == 0).all(axis=2)), midplane=numpy.argwhere((edgex == n // 2).all(axis=2) & left[:, numpy.newaxis]))
+ptags = dict(origin=numpy.array([0]))
+
+log.info(f'importing {len(nodes)} tetrahedra with {len(btags["leftface"])} boundary and {len(btags["midplane"])} interface edges')
+
+t0 = time.perf_counter()
+arrays = mesh._simplex_arrays(nodes, nodes, coords, tags, btags, ptags)
+t1 = time.perf_counter()
+log.info(f'connectivity and groups: {t1-t0:.2f}s')
+
+topo, geom = mesh.simplex(nodes, nodes, coords, tags, btags, ptags)
+t2 = time.perf_counter()
+log.info(f'simplex total: {t2-t1:.2f}s')
+assert len(topo) == len(nodes) and len(topo['left'].boundary['midplane']) == len(btags['midplane'])
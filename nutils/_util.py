@@ -14,6 +14,7 @@ import functools
 import operator
 import numbers
 import pathlib
+import hashlib
 import ctypes
 import io
 import contextlib
@@ -312,6 +313,27 @@ def binaryfile(path):
     raise TypeError('binaryfile requires a path-like or file-like argument')
 
 
+@functools.lru_cache(maxsize=None)
+def source_hash():
+    '''Hash of the source of the Nutils package.
+
+    Returns the sha1 digest of the relative paths and contents of all Python
+    modules of the package, or an empty byte string if the source is not
+    available. Persistent caches include this hash in their keys such that any
+    modification of a development version invalidates their entries.
+    '''
+
+    root = pathlib.Path(__file__).parent
+    h = hashlib.sha1()
+    try:
+        for path in sorted(root.rglob('*.py')):
+            h.update(path.relative_to(root).as_posix().encode() + b'\0')
+            h.update(path.read_bytes())
+    except OSError:
+        return b''
+    return h.digest()
+
+
 def set_current(f):
     '''Decorator for setting global state.
 
@@ -7,6 +7,7 @@ _all = _env.pop('all', False)
 sparse = _env.pop('sparse', _all or __debug__)  # check sparse chunks in evaluable
 lower = _env.pop('lower', _all or __debug__)  # check lowered shape, dtype in function
 evalf = _env.pop('evalf', _all)  # check evaluated arrays in evaluable
+rewrites = _env.pop('rewrites', False)  # record statistics of rewrite rules in evaluable; not implied by 'all'
 
 if _env:
     warnings.warn('unused debug flags: {}'.format(', '.join(_env)))
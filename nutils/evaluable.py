@@ -28,7 +28,7 @@ if typing.TYPE_CHECKING:
 else:
     Protocol = object
 
-from . import debug_flags, _util as util, types, numeric, cache, warnings, parallel, sparse
+from . import debug_flags, _util as util, types, numeric, cache, warnings, parallel, sparse, version
 from ._backports import cached_property
 from ._graph import Node, RegularNode, DuplicatedLeafNode, InvisibleNode, Subgraph
 import nutils_poly as poly
@@ -43,16 +43,27 @@ import builtins
 import re
 import types as builtin_types
 import abc
+import collections
 import collections.abc
 import math
 import treelog as log
 import weakref
 import time
+import tracemalloc
 import contextlib
 import subprocess
 import os
+import hashlib
+import json
+import pickle
+import tempfile
 
 graphviz = os.environ.get('NUTILS_GRAPHVIZ')
+try:
+    trace = builtins.max(0, int(os.environ.get('NUTILS_TRACE') or 0))  # maximum number of traced iterations per loop
+except ValueError as e:
+    warnings.warn(f'ignoring environment variable NUTILS_TRACE: {e}')
+    trace = 0
 
 isevaluable = lambda arg: isinstance(arg, Evaluable)
 
@@ -285,8 +296,8 @@ class Evaluable(types.Singleton):
         raise NotImplementedError('Evaluable derivatives should implement the evalf method')
 
     def evalf_withtimes(self, times, *args):
-        with times[self]:
-            return self.evalf(*args)
+        with times[self] as stats:
+            return stats.allocated(self.evalf(*args), args)
 
     @cached_property
     def dependencies(self):
@@ -391,24 +402,37 @@ class Evaluable(types.Singleton):
             return values[-1]
 
     @contextlib.contextmanager
-    def session(self, graphviz):
-        if graphviz is None:
+    def session(self, graphviz, trace=0):
+        if graphviz is None and not trace:
             yield self.eval
             return
         stats = collections.defaultdict(_Stats)
 
         def eval(**args):
             return self.eval_withtimes(stats, **args)
-        with log.context('eval'):
+        with log.context('eval'), (_Trace(trace) if trace else contextlib.nullcontext()) as tracer:
             yield eval
+            if tracer:
+                with log.infofile('trace.json', 'w') as f:
+                    json.dump(tracer.as_dict(stats), f)
+            if graphviz is None:
+                return
             node = self._node({}, None, stats)
             maxtime = builtins.max(n.metadata[1].time for n in node.walk(set()))
             tottime = builtins.sum(n.metadata[1].time for n in node.walk(set()))
-            aggstats = tuple((key, builtins.sum(v.time for v in values), builtins.sum(v.ncalls for v in values)) for key, values in util.gather(n.metadata for n in node.walk(set())))
+            maxbytes = builtins.max(n.metadata[1].maxbytes for n in node.walk(set()))
+            totbytes = builtins.sum(n.metadata[1].nbytes for n in node.walk(set()))
+            aggstats = tuple((key, builtins.sum(values, _Stats())) for key, values in util.gather(n.metadata for n in node.walk(set())))
             fill_color = (lambda node: '0,{:.2f},1'.format(node.metadata[1].time/maxtime)) if maxtime else None
             node.export_graphviz(fill_color=fill_color, dot_path=graphviz)
-            log.info('total time: {:.0f}ms\n'.format(tottime/1e6) + '\n'.join('{:4.0f} {} ({} calls, avg {:.3f} per call)'.format(t / 1e6, k, n, t / (1e6*n))
-                                                                              for k, t, n in sorted(aggstats, reverse=True, key=lambda item: item[1]) if n))
+            fill_color = (lambda node: '0.6,{:.2f},1'.format(node.metadata[1].maxbytes/maxbytes)) if maxbytes else None
+            node.export_graphviz(fill_color=fill_color, dot_path=graphviz, name='memory')
+            log.info('total time: {:.0f}ms\n'.format(tottime/1e6) + '\n'.join('{:4.0f} {} ({} calls, avg {:.3f} per call)'.format(v.time / 1e6, k, v.ncalls, v.time / (1e6*v.ncalls))
+                                                                              for k, v in sorted(aggstats, reverse=True, key=lambda item: item[1].time) if v.ncalls))
+            log.info('total allocated: {:.0f}kB\n'.format(totbytes/1e3) + '\n'.join('{:6.0f} {} (peak {:.1f}kB{})'.format(v.nbytes / 1e3, k, builtins.max(v.maxbytes, v.peakbytes) / 1e3, ' traced' if v.peakbytes else '')
+                                                                                   for k, v in sorted(aggstats, reverse=True, key=lambda item: item[1].nbytes) if v.nbytes))
+            with log.infofile('evalstats.json', 'w') as f:
+                json.dump(dict(total=dict(time=tottime, nbytes=totbytes), types={k: v.as_dict() for k, v in aggstats}), f)
 
     def _iter_stack(self):
         yield '%0 = EVALARGS'
@@ -448,8 +472,62 @@ class Evaluable(types.Singleton):
 
     @cached_property
     def optimized_for_numpy(self):
+        return self._optimized_for_numpy_uncached()
+
+    @cached_property
+    def _optimized_for_numpy_persistent(self):
+        # Persistent caching of the optimized graph, keyed by the hash of this
+        # graph, the nutils version and the source of the nutils package, such
+        # that modifications of a development version invalidate the cache.
+        # The file is written atomically, rather than locked, such that
+        # concurrent processes at worst optimize the same graph twice. Failure
+        # to store the graph is not fatal. This is reserved for top-level entry
+        # points such as `eval_sparse`: the many small graphs that are
+        # evaluated during optimization or per element are not worth a hash
+        # and a disk round trip.
+        cachedir = cache.caching.current
+        if cachedir is None:
+            return self.optimized_for_numpy
+        h = hashlib.sha1('nutils.evaluable.optimized_for_numpy:{}\0'.format(version).encode())
+        h.update(util.source_hash())
+        try:
+            h.update(types.nutils_hash(self))
+        except TypeError:
+            return self.optimized_for_numpy
+        cachefile = cachedir / 'evaluable' / h.hexdigest()
+        try:
+            with cachefile.open('rb') as f:
+                retval = pickle.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.debug('[optimized_for_numpy {}] failed to load: {}'.format(cachefile.name, e))
+        else:
+            log.debug('[optimized_for_numpy {}] load'.format(cachefile.name))
+            return retval
+        retval = self.optimized_for_numpy
+        try:
+            data = pickle.dumps(retval)
+        except Exception as e:
+            log.debug('[optimized_for_numpy {}] failed to store: {}'.format(cachefile.name, e))
+        else:
+            tmpfile = cachefile.with_name('{}.{}.tmp'.format(cachefile.name, os.getpid()))
+            try:
+                cachefile.parent.mkdir(parents=True, exist_ok=True)
+                tmpfile.write_bytes(data)
+                os.replace(tmpfile, cachefile)
+            except OSError as e:
+                log.debug('[optimized_for_numpy {}] failed to store: {}'.format(cachefile.name, e))
+                with contextlib.suppress(OSError):
+                    tmpfile.unlink()
+            else:
+                log.debug('[optimized_for_numpy {}] store'.format(cachefile.name))
+        return retval
+
+    def _optimized_for_numpy_uncached(self):
         retval = self.simplified._optimized_for_numpy1() or self
-        return retval._combine_loop_concatenates(frozenset())
+        retval = retval._combine_loop_concatenates(frozenset())
+        return _fuse_pointwise(retval)
 
     @replace(depthfirst=True, recursive=True)
     def _optimized_for_numpy1(obj):
@@ -809,6 +887,133 @@ if debug_flags.evalf:
             return super().__new__(mcls, name, bases, namespace)
 
 
+class RewriteStats:
+    '''Statistics of the rewrite rules that are applied to evaluables.
+
+    The statistics are gathered only if Nutils runs with the ``rewrites`` debug
+    flag, e.g. via environment variable ``NUTILS_DEBUG=rewrites``. For every
+    :class:`Array` type and rewrite method (``_simplified``, ``_take``,
+    ``_multiply`` etc.) the number of invocations, the number of successful
+    rewrites and the cumulative time in nanoseconds are recorded. Nested
+    invocations are included in the time of the invoking rule. For every
+    top-level pass (``simplified``, ``optimized_for_numpy``) the number of
+    calls, the cumulative time and the graph sizes before and after are
+    recorded.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        'Discard all recorded statistics.'
+
+        self.rules = collections.defaultdict(lambda: [0, 0, 0])  # (type, method) -> ncalls, nrewrites, time
+        self.passes = collections.defaultdict(lambda: [0, 0, 0, 0])  # name -> ncalls, time, nodes before, nodes after
+        self._active = set()
+
+    def _record_rule(self, typename, methodname, func, *args, **kwargs):
+        stats = self.rules[typename, methodname]
+        t0 = time.perf_counter_ns()
+        try:
+            retval = func(*args, **kwargs)
+        finally:
+            stats[0] += 1
+            stats[2] += time.perf_counter_ns() - t0
+        if retval is not None:
+            stats[1] += 1
+        return retval
+
+    def _record_pass(self, name, func, value):
+        if name in self._active:  # only record the outermost invocation of a pass
+            return func(value)
+        before = _graphsize(value)
+        t0 = time.perf_counter_ns()
+        self._active.add(name)
+        try:
+            retval = func(value)
+        finally:
+            self._active.discard(name)
+        stats = self.passes[name]
+        stats[0] += 1
+        stats[1] += time.perf_counter_ns() - t0
+        stats[2] += before
+        stats[3] += _graphsize(retval)
+        return retval
+
+    def as_dict(self):
+        'Return the statistics as a JSON serializable dictionary.'
+
+        return dict(
+            rules=[dict(type=typename, method=methodname, ncalls=ncalls, nrewrites=nrewrites, time=t)
+                   for (typename, methodname), (ncalls, nrewrites, t) in sorted(self.rules.items(), key=lambda item: -item[1][2])],
+            passes=[dict(name=name, ncalls=ncalls, time=t, nodes_before=before, nodes_after=after)
+                    for name, (ncalls, t, before, after) in self.passes.items()])
+
+    def log(self, limit: int = 20):
+        '''Log the passes and the ``limit`` most expensive rewrite rules.'''
+
+        for name, (ncalls, t, before, after) in self.passes.items():
+            log.info('{}: {:.0f}ms in {} calls, {} -> {} nodes'.format(name, t/1e6, ncalls, before, after))
+        rules = sorted(self.rules.items(), key=lambda item: -item[1][2])[:limit]
+        if rules:
+            log.info('rewrite rules by cumulative time:\n' + '\n'.join('{:6.0f}ms {}.{} ({} calls, {} rewrites)'.format(t/1e6, typename, methodname, ncalls, nrewrites)
+                                                                         for (typename, methodname), (ncalls, nrewrites, t) in rules))
+
+    def write_json(self, path):
+        '''Write the statistics as JSON to ``path``.'''
+
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+rewrite_stats = RewriteStats()
+
+
+def _graphsize(value):
+    return len(value.dependencies) + 1 if isinstance(value, Evaluable) else 0
+
+
+if debug_flags.rewrites:
+    _rewrite_methods = frozenset(['_simplified', '_optimized_for_numpy', '_add', '_multiply', '_sum', '_product', '_power', '_sign', '_take', '_rtake',
+                                  '_takediag', '_transpose', '_insertaxis', '_inflate', '_rinflate', '_diagonalize', '_unravel', '_ravel', '_loopsum',
+                                  '_determinant', '_inverse', '_eig', '_real', '_imag', '_conjugate'])
+
+    def _rewrite_recorder(typename, methodname, orig):
+
+        @functools.wraps(orig)
+        def rewrite_with_stats(*args, **kwargs):
+            return rewrite_stats._record_rule(typename, methodname, orig, *args, **kwargs)
+        return rewrite_with_stats
+
+    def _pass_recorder(name, orig):
+
+        @functools.wraps(orig)
+        def pass_with_stats(self):
+            return rewrite_stats._record_pass(name, orig, self)
+        return pass_with_stats
+
+    Evaluable.simplified = property(_pass_recorder('simplified', Evaluable.simplified.fget))
+    Evaluable._optimized_for_numpy_uncached = _pass_recorder('optimized_for_numpy', Evaluable._optimized_for_numpy_uncached)
+
+    class _ArrayMeta(_ArrayMeta):
+        def __new__(mcls, name, bases, namespace):
+            for methodname in _rewrite_methods.intersection(namespace):
+                if inspect.isfunction(namespace[methodname]):
+                    namespace[methodname] = _rewrite_recorder(name, methodname, namespace[methodname])
+            return super().__new__(mcls, name, bases, namespace)
+
+
+class _ArrayMeta(_ArrayMeta):
+    # Record the numpy ufunc that implements evalf, if any, as attribute
+    # `_ufunc` for the fusion of pointwise operations. Being the outermost
+    # metaclass, it inspects evalf before it is wrapped by the evalf checker.
+    def __new__(mcls, name, bases, namespace):
+        if 'evalf' in namespace:
+            evalf = namespace['evalf']
+            namespace.setdefault('_ufunc', evalf.__func__ if isinstance(evalf, staticmethod) and isinstance(evalf.__func__, numpy.ufunc) else None)
+        return super().__new__(mcls, name, bases, namespace)
+
+
 class AsEvaluableArray(Protocol):
     'Protocol for conversion into an :class:`Array`.'
 
@@ -1930,13 +2135,60 @@ class Einsum(Array):
 
     def evalf(self, *args):
         if self._has_summed_axes:
+            if self._contraction_path:
+                return numpy.einsum(self._einsumfmt, *args, optimize=self._contraction_path)
             args = tuple(numpy.asarray(arg, order='F') for arg in args)
         return numpy.core.multiarray.c_einsum(self._einsumfmt, *args)
 
+    @cached_property
+    def _contraction_path(self):
+        # Returns the contraction path of the arguments, or `None` if the
+        # contraction is too small to outweigh the overhead of `numpy.einsum`.
+        # A path orders the contraction of many arguments such as to avoid
+        # large intermediates, and allows `numpy.einsum` to dispatch pairwise
+        # contractions to BLAS via `numpy.tensordot`. The path is computed for
+        # the upper bounds of the argument shapes, which are finite for
+        # practically all contractions inside element loops; the path itself is
+        # valid for any shape.
+        if not self._has_summed_axes:
+            return None
+        shapes = tuple(tuple(n._intbounds[1] for n in arg.shape) for arg in self.args)
+        if any(n == float('inf') for shape in shapes for n in shape):
+            return None
+        lengths = {}
+        for idx, shape in zip(self.args_idx, shapes):
+            lengths.update(zip(idx, shape))
+        if util.product(lengths.values(), 1) * len(shapes) < _einsum_path_threshold:
+            return None
+        path, info = numpy.einsum_path(self._einsumfmt, *[numpy.broadcast_to(numpy.zeros((), self.dtype), shape) for shape in shapes], optimize='optimal' if len(shapes) <= 4 else 'greedy')
+        return path
+
     @property
     def _node_details(self):
         return self._einsumfmt
 
+    def _optimized_for_numpy(self):
+        # Absorb arguments that are products without summed axes, such as the
+        # outer products that form tensorial bases at tensorial points, provided
+        # that the result is evaluated via a contraction path. The path then
+        # contracts the factors of the products one by one, which for tensorial
+        # bases amounts to sum factorization: a contraction per dimension.
+        if not self._has_summed_axes or not any(isinstance(arg, Einsum) and not arg._has_summed_axes for arg in self.args):
+            return
+        args = []
+        args_idx = []
+        for arg, idx in zip(self.args, self.args_idx):
+            if isinstance(arg, Einsum) and not arg._has_summed_axes:
+                renumber = dict(zip(arg.out_idx, idx))
+                args.extend(arg.args)
+                args_idx.extend(tuple(map(renumber.__getitem__, arg_idx)) for arg_idx in arg.args_idx)
+            else:
+                args.append(arg)
+                args_idx.append(idx)
+        absorbed = Einsum(tuple(args), tuple(args_idx), self.out_idx)
+        if absorbed._contraction_path is not None:
+            return absorbed
+
     def _simplified(self):
         for i, arg in enumerate(self.args):
             if isinstance(arg, Transpose):  # absorb `Transpose`
@@ -1956,6 +2208,9 @@ class Einsum(Array):
         return Einsum(self.args, args_idx, self.out_idx[:axis1] + self.out_idx[axis1+1:axis2] + self.out_idx[axis2+1:] + (ikeep,))
 
 
+_einsum_path_threshold = 2**18
+
+
 class Sum(Array):
 
     def __init__(self, func: Array):
@@ -2172,6 +2427,7 @@ class Pointwise(Array):
     deriv = None
     complex_deriv = None
     return_type = None
+    _ufunc = None  # the numpy ufunc that implements evalf, if any
 
     def __init__(self, *args: Array):
         assert all(isinstance(arg, Array) for arg in args), f'args={args!r}'
@@ -2584,6 +2840,142 @@ class FloatToComplex(Cast):
         return FloatToComplex(derivative(arg, var, seen))
 
 
+class _FusedPointwise(Array):
+    '''Fused evaluation of a subgraph of pointwise operations.
+
+    Evaluates the subgraph of ``func`` that is bounded by ``args`` in a single
+    step, writing intermediate results in place into the buffers of operands
+    that are no longer needed rather than allocating a new array per
+    operation. All operations in the subgraph must be numpy ufuncs operating
+    on arrays of equal shape, and every intermediate result must be used only
+    once.
+
+    Args
+    ----
+    func : :class:`Array`
+        The root of the pointwise subgraph.
+    args : :class:`tuple` of :class:`Array`
+        The arguments of the subgraph.
+    '''
+
+    def __init__(self, func: Array, args: typing.Tuple[Array, ...]):
+        assert isinstance(func, Array) and _pointwise_ufunc(func), f'func={func!r}'
+        assert isinstance(args, tuple) and all(isinstance(arg, Array) for arg in args), f'args={args!r}'
+        self.func = func
+        self._fused_args = args
+        indices = {arg: i for i, arg in enumerate(args)}
+        dtypes = [arg.dtype for arg in args]
+        program = []
+        for node in _postorder(func, indices):
+            operands = tuple(indices[arg] for arg in node._Evaluable__args)
+            # Write the result in the buffer of the first intermediate operand of
+            # matching dtype, if any.
+            out = next((i for i in operands if i >= len(args) and dtypes[i] == node.dtype), None)
+            program.append((_pointwise_ufunc(node), operands, out))
+            indices[node] = len(dtypes)
+            dtypes.append(node.dtype)
+        self._program = tuple(program)
+        self.ntemporaries = builtins.sum(out is not None for ufunc, operands, out in program)
+        super().__init__(args=args, shape=func.shape, dtype=func.dtype)
+
+    def evalf(self, *args):
+        values = list(args)
+        for ufunc, operands, out in self._program:
+            values.append(ufunc(*[values[i] for i in operands], out=None if out is None else values[out]))
+        return values[-1]
+
+    @property
+    def _node_details(self):
+        return ','.join(ufunc.__name__ for ufunc, operands, out in self._program)
+
+
+def _pointwise_ufunc(value):
+    # Returns the numpy ufunc that evaluates `value` if it is a pointwise
+    # operation on floating point arrays of equal shape, or `None` otherwise.
+    if not isinstance(value, Array) or value.ndim == 0 or value.dtype not in (float, complex):
+        return
+    if isinstance(value, Einsum) and len(value.args) == 2 and all(idx == value.out_idx for idx in value.args_idx):
+        return numpy.multiply
+    if isinstance(value, (Pointwise, Multiply, Add, Power)):
+        return value._ufunc
+
+
+def _postorder(func, stop):
+    # Returns the evaluables in the subgraph of `func` bounded by the
+    # collection `stop` in an order such that every evaluable comes after its
+    # arguments.
+    order = []
+    seen = set(stop)
+    stack = [(func, False)]
+    while stack:
+        value, expanded = stack.pop()
+        if expanded:
+            order.append(value)
+        elif value not in seen:
+            seen.add(value)
+            stack.append((value, True))
+            stack.extend((arg, False) for arg in reversed(value._Evaluable__args))
+    return order
+
+
+def _fuse_pointwise(target):
+    # Replaces connected subgraphs of pointwise operations of equal shape in
+    # `target` by `_FusedPointwise` instances. An intermediate result is
+    # included in a subgraph only if it has no other consumers.
+    references = collections.Counter()
+    consumers = {}
+    order = []
+    seen = set()
+    stack = [(target, None, False)]
+    while stack:
+        obj, owner, expanded = stack.pop()
+        if expanded:
+            order.append(obj)
+            continue
+        if isinstance(obj, Evaluable):
+            if owner is not None:
+                references[obj] += 1
+                consumers[obj] = owner
+            if obj in seen:
+                continue
+            seen.add(obj)
+            stack.append((obj, None, True))
+            owner = obj
+            children = obj.__reduce__()[1]
+        elif isinstance(obj, (tuple, list, frozenset, types.frozenmultiset)):
+            children = obj
+        else:
+            continue
+        stack.extend((child, owner, False) for child in children)
+    isinternal = lambda value: _pointwise_ufunc(value) and references[value] == 1 and _pointwise_ufunc(consumers[value])
+    replacements = {}
+    nops = ntemporaries = 0
+    for value in order:
+        if not _pointwise_ufunc(value) or isinternal(value):
+            continue
+        args = []
+        stack = [value]
+        size = 0
+        while stack:
+            node = stack.pop()
+            size += 1
+            for arg in node._Evaluable__args:
+                if isinternal(arg) and consumers[arg] == node:
+                    stack.append(arg)
+                elif arg not in args:
+                    args.append(arg)
+        if size < 2:
+            continue
+        fused = _FusedPointwise(*_replace_evaluables((value, tuple(args)), dict(replacements)))
+        replacements[value] = fused
+        nops += size
+        ntemporaries += fused.ntemporaries
+    if not replacements:
+        return target
+    log.debug(f'fused {nops} pointwise operations in {len(replacements)} kernels, eliminating {ntemporaries} temporaries')
+    return _replace_evaluables(target, replacements)
+
+
 def astype(arg, dtype):
     arg = asarray(arg)
     i = _type_order.index(arg.dtype)
@@ -3580,6 +3972,96 @@ class Polyval(Array):
         if len(where_points) + len(where_coeffs) < self.ndim:
             where = *where_points, *(axis + self.points.ndim - 1 for axis in where_coeffs)
             return align(Polyval(coeffs, points), where, self.shape)
+        if isinstance(self.coeffs, Transpose) and isinstance(self.coeffs.func, Ravel) and self.coeffs.axes[-1] != self.coeffs.ndim - 1:
+            # Move a ravel of pointwise coefficient axes, as formed by tensorial
+            # bases, out of the polyval, in order to expose the polynomial
+            # products below.
+            axis = self.coeffs.axes.index(self.coeffs.ndim - 1)
+            coeffs = unravel(self.coeffs, axis, self.coeffs.func.func.shape[-2:])
+            return ravel(Polyval(coeffs, self.points), self.points.ndim - 1 + axis)
+
+    def _optimized_for_numpy(self):
+        return self._tabulated() or self._factorized()
+
+    def _tabulated(self):
+        # If the coefficients and points are (compositions of) selections from
+        # small constant tables, as is the case for most bases sampled on a
+        # uniform points sequence, we tabulate the polynomial for all
+        # combinations of selections once and replace this polyval by a
+        # selection from the tabulation.
+        if not all(n.isconstant for n in self.shape):
+            return
+        selections = _constant_selections(Tuple((self.coeffs, self.points)))
+        if selections is None:
+            return
+        lengths = tuple(int(take.func.shape[-1]) for take in selections)
+        if util.product(lengths, 1) > _max_polyval_tabulations:
+            return
+        names = tuple(f'_tabulate{i}' for i in range(len(selections)))
+        replaced = _replace_evaluables(Tuple((self.coeffs, self.points)), {take: Take(take.func, Argument(name, (), int)) for take, name in zip(selections, names)})
+        table = numpy.empty(lengths + tuple(int(n) for n in self.shape))
+        for indices in numpy.ndindex(*lengths):
+            coeffs, points = replaced.eval(**{name: numpy.array(i) for name, i in zip(names, indices)})
+            table[indices] = poly.eval_outer(coeffs, points)
+        tabulated = constant(table)
+        for take in selections:
+            tabulated = get(tabulated, 0, take.indices)
+        return tabulated
+
+    def _factorized(self):
+        # If the coefficients form a product of polynomials in disjoint
+        # variables, as is the case for tensorial bases, we evaluate the factors
+        # separately and multiply the results, applying the product rule for
+        # gradients. This avoids forming the coefficients of the product
+        # polynomial. The resulting outer product is absorbed by contractions
+        # in `Einsum._optimized_for_numpy`, which factorizes the sum.
+        if isinstance(self.coeffs, PolyMul) and self.coeffs._separable:
+            (coeffs_left, points_left), (coeffs_right, points_right) = self._factors(self.coeffs)
+            return Polyval(coeffs_left, points_left) * Polyval(coeffs_right, points_right)
+        if isinstance(self.coeffs, PolyGrad) and isinstance(self.coeffs.coeffs, PolyMul) and self.coeffs.coeffs._separable:
+            (coeffs_left, points_left), (coeffs_right, points_right) = self._factors(self.coeffs.coeffs)
+            nleft = points_left.shape[-1]
+            nright = points_right.shape[-1]
+            grad_left = Polyval(PolyGrad(coeffs_left, int(nleft)), points_left) * InsertAxis(Polyval(coeffs_right, points_right), nleft)
+            grad_right = InsertAxis(Polyval(coeffs_left, points_left), nright) * Polyval(PolyGrad(coeffs_right, int(nright)), points_right)
+            grad = concatenate([grad_left, grad_right], axis=-1)
+            left, right = self.coeffs.coeffs._var_indices
+            order = numpy.argsort(left + right)
+            if not numpy.equal(order, numpy.arange(len(order))).all():
+                grad = Take(grad, constant(order))
+            return grad
+
+    def _factors(self, polymul):
+        return tuple((coeffs, _take(self.points, constant(indices), self.points.ndim - 1)) for coeffs, indices in zip((polymul.coeffs_left, polymul.coeffs_right), polymul._var_indices))
+
+
+_max_polyval_tabulations = 1024
+
+
+def _constant_selections(func):
+    # Returns the outermost scalar takes from constant arrays on which `func`
+    # depends, provided that `func` is constant otherwise, or `None`.
+    selections = []
+    seen = set()
+    stack = [func]
+    while stack:
+        value = stack.pop()
+        if value in seen:
+            continue
+        seen.add(value)
+        if value is EVALARGS or isinstance(value, DerivativeTargetBase):
+            return
+        if isinstance(value, Take) and value.indices.ndim == 0 and value.func.isconstant and value.func.shape[-1].isconstant:
+            if not value.indices.isconstant:
+                selections.append(value)
+        elif not value.isconstant:
+            stack.extend(value._Evaluable__args)
+    return tuple(selections)
+
+
+@replace
+def _replace_evaluables(value, mapping):
+    return mapping.get(value)
 
 
 class PolyDegree(Array):
@@ -3708,6 +4190,17 @@ class PolyMul(Array):
         else:
             return poly.MulPlan(self.vars, degree_left, degree_right)
 
+    @property
+    def _var_indices(self):
+        left = tuple(i for i, var in enumerate(self.vars) if var == poly.MulVar.Left)
+        right = tuple(i for i, var in enumerate(self.vars) if var == poly.MulVar.Right)
+        return left, right
+
+    @property
+    def _separable(self):
+        left, right = self._var_indices
+        return left and right and len(left) + len(right) == len(self.vars)
+
     def _simplified(self):
         if iszero(self.coeffs_left) or iszero(self.coeffs_right):
             return zeros_like(self)
@@ -3771,6 +4264,12 @@ class PolyGrad(Array):
             return zeros_like(self)
         elif _equals_scalar_constant(self.degree, 1):
             return InsertAxis(Take(self.coeffs, constant(self.nvars - 1) - Range(constant(self.nvars))), constant(1))
+        elif isinstance(self.coeffs, Transpose) and isinstance(self.coeffs.func, Ravel) and self.coeffs.axes[-1] != self.coeffs.ndim - 1:
+            axis = self.coeffs.axes.index(self.coeffs.ndim - 1)
+            return ravel(PolyGrad(unravel(self.coeffs, axis, self.coeffs.func.func.shape[-2:]), self.nvars), axis)
+        coeffs, where = unalign(self.coeffs, naxes=self.coeffs.ndim - 1)
+        if len(where) < self.coeffs.ndim - 1:
+            return align(PolyGrad(coeffs, self.nvars), (*where, self.ndim - 2, self.ndim - 1), self.shape)
 
     def _takediag(self, axis1, axis2):
         if axis1 < self.ndim - 2 and axis2 < self.ndim - 2:
@@ -3970,10 +4469,8 @@ class TransformCoords(Array):
         super().__init__(args=(index, coords), shape=(*coords.shape[:-1], constant(target_dim)), dtype=float)
 
     def evalf(self, index, coords):
-        chain = self._source[index.__index__()]
-        if self._target is not None:
-            _, chain = self._target.index_with_tail(chain)
-        return functools.reduce(lambda c, t: t.apply(c), reversed(chain), coords)
+        _, linear, offset = self._source.affine(self._target)[index.__index__()]
+        return numpy.einsum('ij,...j->...i', linear, coords) + offset
 
     def _derivative(self, var, seen):
         linear = TransformLinear(self._target, self._source, self._index)
@@ -4012,10 +4509,7 @@ class TransformIndex(Array):
         super().__init__(args=(index,), shape=(), dtype=int)
 
     def evalf(self, index):
-        if self._target is not None:
-            index, _ = self._target.index_with_tail(self._source[index.__index__()])
-        else:
-            index = 0
+        index, _, _ = self._source.affine(self._target)[index.__index__()]
         return numpy.array(index)
 
     def _intbounds_impl(self):
@@ -4052,13 +4546,8 @@ class TransformLinear(Array):
         super().__init__(args=(index,), shape=(constant(target_dim), constant(source.fromdims)), dtype=float)
 
     def evalf(self, index):
-        chain = self._source[index.__index__()]
-        if self._target is not None:
-            _, chain = self._target.index_with_tail(chain)
-        if chain:
-            return functools.reduce(lambda r, i: i @ r, (item.linear for item in reversed(chain)))
-        else:
-            return numpy.eye(self._source.fromdims)
+        _, linear, _ = self._source.affine(self._target)[index.__index__()]
+        return linear
 
     def _simplified(self):
         if self._target == self._source:
@@ -4187,12 +4676,14 @@ class LoopSum(Array):
     def evalf_withtimes(self, times, shape, length, *args):
         serialized = self._serialized_loop
         subtimes = times.setdefault(self, collections.defaultdict(_Stats))
-        result = numpy.zeros(shape, self.dtype)
+        result = subtimes['sum'].allocated(numpy.zeros(shape, self.dtype))
         for index in range(length):
-            values = [numpy.array(index)]
-            values.extend(args)
-            values.extend(op.evalf_withtimes(subtimes, *[values[i] for i in indices]) for op, indices in serialized)
-            result += values[-1]
+            with _traced_iteration('LoopSum {}'.format(self.index._name), index, length):
+                values = [numpy.array(index)]
+                values.extend(args)
+                values.extend(op.evalf_withtimes(subtimes, *[values[i] for i in indices]) for op, indices in serialized)
+                with subtimes['sum']:
+                    result += values[-1]
         return result
 
     def _derivative(self, var, seen):
@@ -4421,14 +4912,16 @@ class LoopConcatenateCombined(Evaluable):
     def evalf_withtimes(self, times, shapes, length, *args):
         serialized = self._serialized_loop
         subtimes = times.setdefault(self, collections.defaultdict(_Stats))
-        results = [parallel.shempty(tuple(map(int, shape)), dtype=func.dtype) for func, shape in zip(self._funcs, shapes)]
-        for index in range(length):
-            values = [numpy.array(index)]
-            values.extend(args)
-            values.extend(op.evalf_withtimes(subtimes, *[values[i] for i in indices]) for op, indices in serialized)
-            for func, result, (start, stop, block) in zip(self._funcs, results, values[-1]):
-                with subtimes['concat', func]:
-                    result[..., start:stop] = block
+        results = [subtimes['concat', func].allocated(parallel.shempty(tuple(map(int, shape)), dtype=func.dtype)) for func, shape in zip(self._funcs, shapes)]
+        with _timed_ctxrange('loop {}'.format(self._index_name), int(length), subtimes, self) as iiters:
+            for index in iiters:
+                with _traced_iteration('LoopConcatenate {}'.format(self._index_name), index, length):
+                    values = [numpy.array(index)]
+                    values.extend(args)
+                    values.extend(op.evalf_withtimes(subtimes, *[values[i] for i in indices]) for op, indices in serialized)
+                    for func, result, (start, stop, block) in zip(self._funcs, results, values[-1]):
+                        with subtimes['concat', func]:
+                            result[..., start:stop] = block
         return tuple(results)
 
     def _node_tuple(self, cache, subgraph, times):
@@ -4553,27 +5046,246 @@ def _populate_dependencies_sans_invariants(func, arg, invariants, dependencies,
         invariants.append(func)
 
 
+# The traced peak can only be confined to a single evaluation if it can be
+# reset, which requires Python 3.9 or newer. Otherwise the peak is not tracked.
+_can_reset_peak = hasattr(tracemalloc, 'reset_peak')
+
+
 class _Stats:
 
-    def __init__(self, ncalls: int = 0, time: int = 0) -> None:
+    # If tracemalloc is tracing, the peak traced memory during evaluation is
+    # recorded as well. Since the peak is reset upon entering, the peaks of
+    # nested evaluations (e.g. inside a LoopSum) are propagated to the
+    # enclosing evaluation via this stack.
+    _peakstack = []
+
+    def __init__(self, ncalls: int = 0, time: int = 0, nbytes: int = 0, maxbytes: int = 0, peakbytes: int = 0) -> None:
         self.ncalls = ncalls
         self.time = time
+        self.nbytes = nbytes  # total number of bytes allocated by the returned arrays
+        self.maxbytes = maxbytes  # maximum number of bytes of a single return value
+        self.peakbytes = peakbytes  # maximum traced memory increase during evaluation
         self._start = None
+        self._startmemory = None
 
     def __repr__(self):
-        return '_Stats(ncalls={}, time={})'.format(self.ncalls, self.time)
+        return '_Stats(ncalls={}, time={}, nbytes={}, maxbytes={}, peakbytes={})'.format(self.ncalls, self.time, self.nbytes, self.maxbytes, self.peakbytes)
 
     def __add__(self, other):
         if not isinstance(other, _Stats):
             return NotImplemented
-        return _Stats(self.ncalls+other.ncalls, self.time+other.time)
-
-    def __enter__(self) -> None:
+        return _Stats(self.ncalls+other.ncalls, self.time+other.time, self.nbytes+other.nbytes, builtins.max(self.maxbytes, other.maxbytes), builtins.max(self.peakbytes, other.peakbytes))
+
+    def __enter__(self) -> '_Stats':
+        if _can_reset_peak and tracemalloc.is_tracing():
+            self._startmemory, peak = tracemalloc.get_traced_memory()
+            if self._peakstack:
+                self._peakstack[-1] = builtins.max(self._peakstack[-1], peak)
+            self._peakstack.append(0)
+            tracemalloc.reset_peak()
         self._start = time.perf_counter_ns()
+        return self
 
     def __exit__(self, *exc_info) -> None:
-        self.time += time.perf_counter_ns() - self._start
+        end = time.perf_counter_ns()
+        self.time += end - self._start
         self.ncalls += 1
+        if _Trace.current is not None:
+            _Trace.current.record(self, self._start, end)
+        if self._startmemory is not None:
+            peak = builtins.max(tracemalloc.get_traced_memory()[1], self._peakstack.pop())
+            if self._peakstack:
+                self._peakstack[-1] = builtins.max(self._peakstack[-1], peak)
+            self.peakbytes = builtins.max(self.peakbytes, peak - self._startmemory)
+            self._startmemory = None
+
+    def allocated(self, value, args=()):
+        '''Record the memory footprint of an evaluated value and return it.
+
+        Arrays that share memory with any of the arguments ``args``, or with an
+        earlier array of the value, are not counted as allocated.'''
+
+        nbytes = _allocated_nbytes(value, _flat_arrays(args))
+        self.nbytes += nbytes
+        self.maxbytes = builtins.max(self.maxbytes, nbytes)
+        return value
+
+    def as_dict(self):
+        return dict(ncalls=self.ncalls, time=self.time, nbytes=self.nbytes, maxbytes=self.maxbytes, peakbytes=self.peakbytes)
+
+
+def _flat_arrays(value):
+    if isinstance(value, numpy.ndarray):
+        return [value]
+    if isinstance(value, tuple):
+        return [array for item in value for array in _flat_arrays(item)]
+    return []
+
+
+def _allocated_nbytes(value, buffers):
+    nbytes = 0
+    for array in _flat_arrays(value):
+        if not any(numpy.may_share_memory(array, buffer) for buffer in buffers):
+            nbytes += array.nbytes
+        buffers.append(array)
+    return nbytes
+
+
+class _Trace:
+    '''Recorder of evaluation events in the Chrome trace event format.
+
+    While active, every evaluation that is timed via :class:`_Stats` is
+    recorded as a complete event, as are the iterations of loops. To bound the
+    size of the trace, at most ``maxiterations`` evenly spaced iterations are
+    recorded per loop; evaluations inside skipped iterations are not recorded.
+    The resulting trace can be loaded in ``chrome://tracing`` or Perfetto.
+
+    Tracing is enabled by the ``NUTILS_TRACE`` environment variable for all
+    evaluations via :func:`eval_sparse`, which include integration and the
+    evaluation of functions and samples. As in untimed evaluations, the
+    iterations of concatenation loops are distributed over forked workers if
+    :func:`nutils.parallel.maxprocs` allows for more than one process. Every
+    worker records its own events, tagged with its process id, which are
+    merged into the trace of the main process when the loop is done.
+    '''
+
+    current = None
+
+    def __init__(self, maxiterations: int) -> None:
+        self.maxiterations = maxiterations
+        self.events = []  # list of (stats or name, start, end, args, pid)
+        self.enabled = True
+        self.pid = os.getpid()  # id of the recording process
+
+    def __enter__(self) -> '_Trace':
+        self._previous = _Trace.current
+        self._t0 = time.perf_counter_ns()
+        _Trace.current = self
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        _Trace.current = self._previous
+
+    def record(self, key, start: int, end: int, args=None) -> None:
+        if self.enabled:
+            self.events.append((key, start, end, args, self.pid))
+
+    @contextlib.contextmanager
+    def iteration(self, name: str, index: int, length: int):
+        enabled = self.enabled
+        self.enabled = enabled and index % builtins.max(1, -(-length // self.maxiterations)) == 0
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.enabled, sampled = enabled, self.enabled
+            if sampled:
+                self.record(name, start, time.perf_counter_ns(), dict(index=index))
+
+    def as_dict(self, times) -> dict:
+        '''Return the trace as a JSON serializable dictionary, naming the
+        recorded statistics after their keys in ``times``.'''
+
+        names = {}
+        todo = [times]
+        while todo:
+            for key, value in todo.pop().items():
+                if isinstance(value, _Stats):
+                    names[id(value)] = type(key).__name__ if isinstance(key, Evaluable) else key if isinstance(key, str) else key[0]
+                else:
+                    todo.append(value)
+        events = []
+        for key, start, end, args, pid in self.events:
+            event = dict(name=key if isinstance(key, str) else names.get(id(key), '?'), ph='X', ts=(start - self._t0) / 1e3, dur=(end - start) / 1e3, pid=pid, tid=0)
+            if args:
+                event['args'] = args
+            events.append(event)
+        pids = sorted({event['pid'] for event in events})
+        for pid in pids if len(pids) > 1 else ():  # name the processes of a parallel trace
+            events.append(dict(name='process_name', ph='M', pid=pid, tid=0, args=dict(name='main' if pid == self.pid else 'worker {}'.format(pid))))
+        return dict(traceEvents=events, displayTimeUnit='ms')
+
+
+def _traced_iteration(name: str, index: int, length: int):
+    return _Trace.current.iteration(name, index, length) if _Trace.current is not None else contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def _timed_ctxrange(name: str, length: int, times, loop: Evaluable):
+    '''Timed counterpart of :func:`nutils.parallel.ctxrange`.
+
+    The statistics that forked workers record in ``times``, and their events if
+    tracing, are written to a stream per worker and merged into those of the
+    main process when all workers are done. In the streams, the evaluables of
+    ``loop`` that key the statistics are identified by their ids, which forked
+    workers share with the main process.'''
+
+    if min(length, parallel.maxprocs.current) <= 1:
+        yield range(length)
+        return
+    mainpid = os.getpid()
+    initial = {id(stats): stats.as_dict() for path, stats in _iter_stats(times)}
+    trace = _Trace.current
+    nevents = len(trace.events) if trace is not None else 0
+    with tempfile.TemporaryDirectory(prefix='nutils-stats-') as tmpdir:
+        with parallel.ctxrange(name, length) as indices:
+            if os.getpid() != mainpid and trace is not None:
+                trace.pid = os.getpid()
+            yield indices
+            if os.getpid() != mainpid:  # forked worker
+                paths = {}
+                stats = []
+                for path, value in _iter_stats(times):
+                    paths[id(value)] = path
+                    start = initial.get(id(value), dict(ncalls=0, time=0, nbytes=0))
+                    stats.append((path, value.ncalls - start['ncalls'], value.time - start['time'], value.nbytes - start['nbytes'], value.maxbytes, value.peakbytes))
+                events = [(key if isinstance(key, str) else paths[id(key)], *event) for key, *event in trace.events[nevents:] if isinstance(key, str) or id(key) in paths] if trace is not None else []
+                with open(os.path.join(tmpdir, str(os.getpid())), 'wb') as f:
+                    pickler = pickle.Pickler(f)
+                    pickler.persistent_id = lambda obj: id(obj) if isinstance(obj, Evaluable) else None
+                    pickler.dump((stats, events))
+        streams = sorted(os.listdir(tmpdir))
+        if not streams:
+            return
+        evaluables = {}
+        todo = [loop]
+        while todo:
+            func = todo.pop()
+            if id(func) not in evaluables:
+                evaluables[id(func)] = func
+                todo.extend(func._Evaluable__args)
+                todo.extend(getattr(func, '_dependencies', ()))  # bodies of nested loops
+        for stream in streams:
+            with open(os.path.join(tmpdir, stream), 'rb') as f:
+                unpickler = pickle.Unpickler(f)
+                unpickler.persistent_load = evaluables.__getitem__
+                stats, events = unpickler.load()
+            for path, ncalls, time_, nbytes, maxbytes, peakbytes in stats:
+                value = _get_stats(times, path)
+                value.ncalls += ncalls
+                value.time += time_
+                value.nbytes += nbytes
+                value.maxbytes = builtins.max(value.maxbytes, maxbytes)
+                value.peakbytes = builtins.max(value.peakbytes, peakbytes)
+            if trace is not None:
+                trace.events.extend((key if isinstance(key, str) else _get_stats(times, key), *event) for key, *event in events)
+
+
+def _iter_stats(times, path=()):
+    # Yield all statistics in a (nested) dictionary of statistics, together
+    # with the path of keys that leads to them.
+    for key, value in times.items():
+        if isinstance(value, _Stats):
+            yield path + (key,), value
+        else:
+            yield from _iter_stats(value, path + (key,))
+
+
+def _get_stats(times, path):
+    *keys, key = path
+    for k in keys:
+        times = times.setdefault(k, collections.defaultdict(_Stats))
+    return times[key]
 
 # FUNCTIONS
 
@@ -4787,6 +5499,19 @@ def derivative(func, var, seen=None):
     return result
 
 
+def derivative_blocks(funcs, vars):
+    '''Differentiate several functions to several targets.
+
+    Returns the same tuple of derivatives as
+    ``tuple(derivative(func, var) for func in funcs for var in vars)``, but
+    subexpressions that are shared between the functions are differentiated
+    only once per target, such that the blocks share their common sub-graphs.
+    '''
+
+    seens = [{} for var in vars]
+    return tuple(derivative(func, var, seen) for func in funcs for var, seen in zip(vars, seens))
+
+
 def diagonalize(arg, axis=-1, newaxis=-1):
     arg = asarray(arg)
     axis = numeric.normdim(arg.ndim, axis)
@@ -5075,6 +5800,11 @@ def einsum(fmt, *args, **dims):
     return ret
 
 
+# Minimum number of sparse entries per process for `eval_sparse` to sort the
+# data in parallel, below which forking costs more than sorting saves.
+_min_sort_block = 1 << 16
+
+
 @util.single_or_multiple
 def eval_sparse(funcs: AsEvaluableArray, **arguments: typing.Mapping[str, numpy.ndarray]) -> typing.Tuple[numpy.ndarray, ...]:
     '''Evaluate one or several Array objects as sparse data.
@@ -5089,24 +5819,56 @@ def eval_sparse(funcs: AsEvaluableArray, **arguments: typing.Mapping[str, numpy.
     Returns
     -------
     results : :class:`tuple` of sparse data arrays
+
+    If multiple processes are available and the data is sufficiently large,
+    it is divided in contiguous blocks, one for every process, that are sorted
+    in parallel. Every block gathers the same fraction of the last axis of
+    every sparse chunk, which is the axis along which loops concatenate their
+    iterations. As parallel loops hand every process a contiguous block of
+    iterations, the sorted blocks approximately correspond to the data that
+    the processes produced. For integrals over partitioned elements (see
+    :meth:`nutils.topology.Topology.partition`) these blocks touch largely
+    separate index ranges, such that :func:`nutils.sparse.dedup` merges them
+    at little cost.
     '''
 
     funcs = [func.as_evaluable_array for func in funcs]
     shape_chunks = Tuple(tuple(Tuple(builtins.sum(func.simplified._assparse, func.shape)) for func in funcs))
-    with shape_chunks.optimized_for_numpy.session(graphviz=graphviz) as eval:
+    with shape_chunks._optimized_for_numpy_persistent.session(graphviz=graphviz, trace=trace) as eval:
         for func, args in zip(funcs, eval(**arguments)):
             shape = tuple(map(int, args[:func.ndim]))
             chunks = [args[i:i+func.ndim+1] for i in range(func.ndim, len(args), func.ndim+1)]
             length = builtins.sum(values.size for *indices, values in chunks)
-            data = numpy.empty((length,), dtype=sparse.dtype(shape, func.dtype))
-            start = 0
-            for *indices, values in chunks:
-                stop = start + values.size
-                d = data[start:stop].reshape(values.shape)
-                d['value'] = values
-                for idim, ii in enumerate(indices):
-                    d['index']['i'+str(idim)] = ii
-                start = stop
+            data = parallel.shempty((length,), dtype=sparse.dtype(shape, func.dtype))
+            nblocks = builtins.min(parallel.maxprocs.current, length // _min_sort_block) if func.ndim else 1
+            if nblocks <= 1:
+                start = 0
+                for *indices, values in chunks:
+                    stop = start + values.size
+                    d = data[start:stop].reshape(values.shape)
+                    d['value'] = values
+                    for idim, ii in enumerate(indices):
+                        d['index']['i'+str(idim)] = ii
+                    start = stop
+            else:
+                # Move the last axis of every chunk to the front and gather the
+                # same fraction of this axis of all chunks in every block.
+                chunks = [[numpy.moveaxis(numpy.broadcast_to(array, values.shape), -1, 0).reshape(values.shape[-1], -1) if values.ndim else numpy.reshape(array, (1, 1)) for array in (*indices, values)] for *indices, values in chunks]
+                bounds = [0]
+                for iblock in range(nblocks):
+                    start = bounds[-1]
+                    for *indices, values in chunks:
+                        s = slice(len(values) * iblock // nblocks, len(values) * (iblock+1) // nblocks)
+                        stop = start + values[s].size
+                        d = data[start:stop].reshape(values[s].shape)
+                        d['value'] = values[s]
+                        for idim, ii in enumerate(indices):
+                            d['index']['i'+str(idim)] = ii[s]
+                        start = stop
+                    bounds.append(start)
+                with parallel.ctxrange('sorting', nblocks) as iblocks:
+                    for iblock in iblocks:
+                        data[bounds[iblock]:bounds[iblock+1]].view(numpy.void).sort(kind='stable')
             yield data
 
 
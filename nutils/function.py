@@ -9,6 +9,7 @@ from . import evaluable, numeric, _util as util, types, warnings, debug_flags, s
 from ._backports import cached_property
 from .transformseq import Transforms
 import nutils_poly as poly
+import treelog
 import builtins
 import numpy
 import functools
@@ -3563,7 +3564,7 @@ def dotarg(__argname: str, *arrays: IntoArray, shape: Tuple[int, ...] = (), dtyp
 # BASES
 
 
-def _int_or_vec(f, arg, argname, nargs, nvals):
+def _int_or_vec(f, arg, argname, nargs, nvals, fvec=None):
     if isinstance(arg, numbers.Integral):
         return f(int(numeric.normdim(nargs, arg)))
     if numeric.isboolarray(arg):
@@ -3578,6 +3579,8 @@ def _int_or_vec(f, arg, argname, nargs, nvals):
         arg = numpy.unique(arg)
         if arg[0] < 0 or arg[-1] >= nargs:
             raise IndexError('{} out of bounds'.format(argname))
+        if fvec is not None:
+            return fvec(arg)
         return functools.reduce(numpy.union1d, map(f, arg))
     raise IndexError('invalid {}'.format(argname))
 
@@ -3612,8 +3615,9 @@ class Basis(Array):
 
     Notes
     -----
-    Subclasses must implement :meth:`get_dofs` and :meth:`get_coefficients` and
-    if possible should redefine :meth:`get_support`.
+    Subclasses must implement :meth:`f_dofs_coeffs` and if possible should
+    redefine :attr:`_elem_dofs`, the compressed sparse row table of dofs per
+    element from which :meth:`get_dofs` and :meth:`get_support` are served.
     '''
 
     def __init__(self, ndofs: int, nelems: int, index: Array, coords: Array) -> None:
@@ -3629,7 +3633,6 @@ class Basis(Array):
         assert self._arg_dofs.ndim == 1
         assert self._arg_coeffs.ndim == 2
         assert evaluable._equals_simplified(self._arg_dofs.shape[0], self._arg_coeffs.shape[0])
-        self._arg_ndofs = evaluable.asarray(self._arg_dofs.shape[0])
 
     def lower(self, args: LowerArgs) -> evaluable.Array:
         index = _WithoutPoints(self.index).lower(args)
@@ -3638,14 +3641,74 @@ class Basis(Array):
         return evaluable.Inflate(evaluable.Polyval(coeffs, coords), dofs, evaluable.constant(self.ndofs))
 
     @cached_property
-    def _computed_support(self) -> Tuple[numpy.ndarray, ...]:
-        support = [[] for i in range(self.ndofs)]  # type: List[List[int]]
-        for ielem in range(self.nelems):
-            for dof in numpy.unique(self.get_dofs(ielem)):
-                support[dof].append(ielem)
-        return tuple(types.frozenarray(ielems, dtype=int) for ielems in support)
+    def _elem_dofs(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        dofs = [self._arg_dofs.eval(_index=ielem) for ielem in range(self.nelems)]
+        indptr = numpy.cumsum([0, *map(len, dofs)])
+        indices = numpy.concatenate(dofs) if dofs else numpy.zeros((0,), dtype=int)
+        return types.frozenarray(indptr, dtype=int, copy=False), types.frozenarray(indices, dtype=int, copy=False)
+
+    @cached_property
+    def _dof_elems(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        indptr, indices = self._elem_dofs
+        ielems = numpy.repeat(numpy.arange(self.nelems), numpy.diff(indptr))
+        dofs, ielems = numpy.divmod(numpy.unique(indices * self.nelems + ielems), self.nelems)
+        return types.frozenarray(numpy.searchsorted(dofs, numpy.arange(self.ndofs+1)), copy=False), types.frozenarray(ielems, copy=False)
+
+    @cached_property
+    def _coeff_classes(self) -> Tuple[numpy.ndarray, Tuple[numpy.ndarray, ...]]:
+        return _number_coefficients([types.arraydata(numpy.asarray(self.get_coefficients(ielem), dtype=float)) for ielem in range(self.nelems)])
+
+    @property
+    def coefficient_classes(self) -> numpy.ndarray:
+        '''Index in :attr:`unique_coefficients` of the coefficients per element.
+
+        Elements with the same class have equal coefficients, as returned by
+        :meth:`get_coefficients`.
+        '''
+
+        return self._coeff_classes[0]
+
+    @property
+    def unique_coefficients(self) -> Tuple[numpy.ndarray, ...]:
+        '''The distinct coefficient arrays of all elements.'''
+
+        return self._coeff_classes[1]
+
+    @property
+    def elem_dofs_indptr(self) -> numpy.ndarray:
+        '''Row pointers of the compressed sparse row table of dofs per element.
+
+        The dofs of element ``ielem`` are
+        ``elem_dofs_indices[elem_dofs_indptr[ielem]:elem_dofs_indptr[ielem+1]]``,
+        in the order of :meth:`get_dofs`.
+        '''
+
+        return self._elem_dofs[0]
+
+    @property
+    def elem_dofs_indices(self) -> numpy.ndarray:
+        '''Dofs of the compressed sparse row table of dofs per element.'''
+
+        return self._elem_dofs[1]
+
+    @property
+    def dof_elems_indptr(self) -> numpy.ndarray:
+        '''Row pointers of the compressed sparse row table of elements per dof.
+
+        This is the transpose of the table of dofs per element: the support of
+        ``dof`` is
+        ``dof_elems_indices[dof_elems_indptr[dof]:dof_elems_indptr[dof+1]]``,
+        strictly monotonic increasing.
+        '''
+
+        return self._dof_elems[0]
+
+    @property
+    def dof_elems_indices(self) -> numpy.ndarray:
+        '''Elements of the compressed sparse row table of elements per dof.'''
+
+        return self._dof_elems[1]
 
-    @_int_or_vec_dof
     def get_support(self, dof: Union[numbers.Integral, numpy.ndarray]) -> numpy.ndarray:
         '''Return the support of basis function ``dof``.
 
@@ -3665,9 +3728,10 @@ class Basis(Array):
             The elements (as indices) where function ``dof`` has support.
         '''
 
-        return self._computed_support[dof]
+        indptr, indices = self._dof_elems
+        return _int_or_vec(lambda dof: indices[indptr[dof]:indptr[dof+1]], arg=dof, argname='dof', nargs=self.ndofs, nvals=self.nelems,
+                           fvec=lambda dofs: numpy.unique(numeric.csr_rows(indptr, indices, dofs)))
 
-    @_int_or_vec_ielem
     def get_dofs(self, ielem: Union[int, numpy.ndarray]) -> numpy.ndarray:
         '''Return an array of indices of basis functions with support on element ``ielem``.
 
@@ -3687,12 +3751,15 @@ class Basis(Array):
             A 1D Array of indices.
         '''
 
-        return self._arg_dofs.eval(_index=ielem)
+        indptr, indices = self._elem_dofs
+        return _int_or_vec(lambda ielem: indices[indptr[ielem]:indptr[ielem+1]], arg=ielem, argname='ielem', nargs=self.nelems, nvals=self.ndofs,
+                           fvec=lambda ielems: numpy.unique(numeric.csr_rows(indptr, indices, ielems)))
 
     def get_ndofs(self, ielem: int) -> int:
         '''Return the number of basis functions with support on element ``ielem``.'''
 
-        return int(self._arg_ndofs.eval(_index=numeric.normdim(self.nelems, ielem)))
+        ielem = numeric.normdim(self.nelems, ielem)
+        return int(self._elem_dofs[0][ielem+1] - self._elem_dofs[0][ielem])
 
     def get_coefficients(self, ielem: int) -> numpy.ndarray:
         '''Return an array of coefficients for all basis functions with support on element ``ielem``.
@@ -3715,6 +3782,38 @@ class Basis(Array):
     def f_dofs_coeffs(self, index: evaluable.Array) -> Tuple[evaluable.Array, evaluable.Array]:
         raise NotImplementedError('{} must implement f_dofs_coeffs'.format(self.__class__.__name__))
 
+    def renumbered(self, method: str = 'rcm') -> 'Basis':
+        '''Return this basis with a bandwidth reducing dof numbering.
+
+        The permutation is computed from the graph of dofs that share an
+        element, such that matrices assembled with the returned basis have a
+        narrow band, which benefits the cache behaviour of matrix-vector
+        products and reduces fill in direct factorizations. The bandwidth and
+        profile before and after renumbering are logged.
+
+        Parameters
+        ----------
+        method : :class:`str`
+            The renumbering method. Currently only ``'rcm'`` (reverse
+            Cuthill-McKee) is supported.
+
+        Returns
+        -------
+        :class:`PermutedBasis`
+            The renumbered basis, whose dof ``i`` equals dof ``basis.permutation[i]``
+            of the original.
+        '''
+
+        if method != 'rcm':
+            raise ValueError('unknown renumbering method {!r}'.format(method))
+        rows, cols = _dof_pairs(*self._elem_dofs, self.ndofs)
+        permutation = numeric.reverse_cuthill_mckee(rows.searchsorted(numpy.arange(self.ndofs+1)), cols)
+        renumber = numeric.invmap(permutation, length=self.ndofs)
+        bandwidth, profile = _bandwidth_profile(rows, cols, self.ndofs)
+        newbandwidth, newprofile = _bandwidth_profile(renumber[rows], renumber[cols], self.ndofs)
+        treelog.info('renumbering changed bandwidth from {} to {} and profile from {} to {}'.format(bandwidth, newbandwidth, profile, newprofile))
+        return PermutedBasis(self, permutation)
+
     def __getitem__(self, index: Any) -> Array:
         if numeric.isintarray(index) and index.ndim == 1 and numpy.all(numpy.greater(numpy.diff(index), 0)):
             return MaskedBasis(self, index)
@@ -3759,6 +3858,16 @@ class PlainBasis(Basis):
         assert all(c.shape[0] == d.shape[0] for c, d in zip(self._coeffs, self._dofs))
         super().__init__(ndofs, len(coefficients), index, coords)
 
+    @cached_property
+    def _elem_dofs(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        indptr = numpy.cumsum([0, *(d.shape[0] for d in self._dofs)])
+        indices = numpy.concatenate([numpy.asarray(d) for d in self._dofs]) if self._dofs else numpy.zeros((0,), dtype=int)
+        return types.frozenarray(indptr, dtype=int, copy=False), types.frozenarray(indices, dtype=int, copy=False)
+
+    @cached_property
+    def _coeff_classes(self) -> Tuple[numpy.ndarray, Tuple[numpy.ndarray, ...]]:
+        return _number_coefficients(self._coeffs)
+
     def f_dofs_coeffs(self, index: evaluable.Array) -> Tuple[evaluable.Array, evaluable.Array]:
         dofs = evaluable.Elemwise(self._dofs, index, dtype=int)
         coeffs = evaluable.Elemwise(self._coeffs, index, dtype=float)
@@ -3785,6 +3894,14 @@ class DiscontBasis(Basis):
         self._offsets = numpy.cumsum([0] + [c.shape[0] for c in self._coeffs])
         super().__init__(self._offsets[-1], len(coefficients), index, coords)
 
+    @cached_property
+    def _elem_dofs(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        return types.frozenarray(self._offsets, dtype=int), types.frozenarray(numpy.arange(self.ndofs), copy=False)
+
+    @cached_property
+    def _coeff_classes(self) -> Tuple[numpy.ndarray, Tuple[numpy.ndarray, ...]]:
+        return _number_coefficients(self._coeffs)
+
     @_int_or_vec_dof
     def get_support(self, dof: Union[int, numpy.ndarray]) -> numpy.ndarray:
         ielem = numpy.searchsorted(self._offsets[:-1], numeric.normdim(self.ndofs, dof), side='right')-1
@@ -3817,6 +3934,10 @@ class LegendreBasis(Basis):
         self._degree = degree
         super().__init__(nelems * (degree+1), nelems, index, coords)
 
+    @cached_property
+    def _elem_dofs(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        return types.frozenarray(numpy.arange(self.nelems+1) * (self._degree+1), copy=False), types.frozenarray(numpy.arange(self.ndofs), copy=False)
+
     @_int_or_vec_dof
     def get_support(self, dof: Union[int, numpy.ndarray]) -> numpy.ndarray:
         if isinstance(dof, int):
@@ -3864,10 +3985,19 @@ class MaskedBasis(Basis):
         self._renumber = evaluable.constant(numeric.invmap(indices, length=parent.ndofs, missing=len(indices)))
         super().__init__(len(indices), parent.nelems, parent.index, parent.coords)
 
-    def get_support(self, dof: Union[int, numpy.ndarray]) -> numpy.ndarray:
-        if numeric.isintarray(dof) and dof.ndim == 1 and numpy.any(numpy.less(dof, 0)):
-            raise IndexError('dof out of bounds')
-        return self._parent.get_support(self._indices[dof])
+    @cached_property
+    def _elem_dofs(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        indptr, indices = self._parent._elem_dofs
+        indices = numeric.invmap(self._indices, length=self._parent.ndofs, missing=self.ndofs)[indices]
+        keep = numpy.less(indices, self.ndofs)
+        indptr = numpy.concatenate([[0], numpy.cumsum(keep)])[indptr]
+        return types.frozenarray(indptr, dtype=int, copy=False), types.frozenarray(indices[keep], copy=False)
+
+    @cached_property
+    def _dof_elems(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        indptr, indices = self._parent._dof_elems
+        counts = numpy.diff(indptr)[self._indices]
+        return types.frozenarray(numpy.cumsum([0, *counts]), dtype=int, copy=False), types.frozenarray(numeric.csr_rows(indptr, indices, self._indices), copy=False)
 
     def f_dofs_coeffs(self, index: evaluable.Array) -> Tuple[evaluable.Array, evaluable.Array]:
         p_dofs, p_coeffs = self._parent.f_dofs_coeffs(index)
@@ -3909,33 +4039,56 @@ class StructuredBasis(Basis):
         self._transforms_shape = tuple(map(int, transforms_shape))
         super().__init__(util.product(dofs_shape), util.product(transforms_shape), index, coords)
 
-    @_int_or_vec_dof
-    def get_support(self, dof: Union[int, numpy.ndarray]) -> numpy.ndarray:
-        dof = numeric.normdim(self.ndofs, dof)
-        ndofs = 1
-        ntrans = 1
-        supports = []
-        for start_dofs_i, stop_dofs_i, ndofs_i, ntrans_i in zip(reversed(self._start_dofs), reversed(self._stop_dofs), reversed(self._dofs_shape), reversed(self._transforms_shape)):
-            dof, dof_i = builtins.divmod(dof, ndofs_i)
-            supports_i = []
-            while dof_i < stop_dofs_i[-1]:
-                stop_ielem = numpy.searchsorted(start_dofs_i, dof_i, side='right')
-                start_ielem = numpy.searchsorted(stop_dofs_i, dof_i, side='right')
-                supports_i.append(numpy.arange(start_ielem, stop_ielem, dtype=int))
-                dof_i += ndofs_i
-            supports.append(numpy.unique(numpy.concatenate(supports_i)) * ntrans)
-            ndofs *= ndofs_i
-            ntrans *= ntrans_i
-        assert dof == 0
-        return numpy.asarray(functools.reduce(numpy.add.outer, reversed(supports)).ravel(), dtype=int)
+    @cached_property
+    def _elem_dofs(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        # The table is the tensor product of the tables per dimension, with
+        # the elements and the dofs of the first dimension varying slowest.
+        indptr = numpy.array([0, 1])
+        indices = numpy.array([0])
+        for start_dofs_i, ndofs_i, dofs_shape_i in zip(self._start_dofs, self._ndofs, self._dofs_shape):
+            indptr_i = numpy.cumsum([0, *ndofs_i])
+            indices_i = (numpy.repeat(start_dofs_i - indptr_i[:-1], ndofs_i) + numpy.arange(indptr_i[-1])) % dofs_shape_i
+            counts = numpy.multiply.outer(numpy.diff(indptr), ndofs_i).ravel()
+            rows = numpy.repeat(numpy.arange(len(counts)), counts)
+            offsets = numpy.arange(len(rows)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+            rows, rows_i = numpy.divmod(rows, len(ndofs_i))
+            offsets, offsets_i = numpy.divmod(offsets, ndofs_i[rows_i])
+            indices = indices[indptr[rows] + offsets] * dofs_shape_i + indices_i[indptr_i[rows_i] + offsets_i]
+            indptr = numpy.cumsum([0, *counts])
+        return types.frozenarray(indptr, dtype=int, copy=False), types.frozenarray(indices, dtype=int, copy=False)
 
-    def f_dofs_coeffs(self, index: evaluable.Array) -> Tuple[evaluable.Array, evaluable.Array]:
+    @cached_property
+    def _coeff_classes(self) -> Tuple[numpy.ndarray, Tuple[numpy.ndarray, ...]]:
+        # The classes follow from the classes of the (short) tables per
+        # dimension, and the coefficients of every class are formed as in
+        # `f_dofs_coeffs`.
+        classes_per_dim, coeffs_per_dim = zip(*map(_number_coefficients, self._coeffs))
+        classes = numpy.array([0])
+        for classes_i, coeffs_i in zip(classes_per_dim, coeffs_per_dim):
+            classes = numpy.add.outer(classes * len(coeffs_i), classes_i).ravel()
+        unique, classes = numpy.unique(classes, return_inverse=True)
+        coeffs = []
+        for indices in zip(*numpy.unravel_index(unique, tuple(map(len, coeffs_per_dim)))):
+            c, *cs = (coeffs_i[i] for coeffs_i, i in zip(coeffs_per_dim, indices))
+            for i, ci in enumerate(cs, 1):
+                c = poly.mul(numpy.repeat(c[:, numpy.newaxis], len(ci), axis=1), numpy.repeat(ci[numpy.newaxis], len(c), axis=0), (poly.MulVar.Left,) * i + (poly.MulVar.Right,))
+                c = c.reshape(-1, c.shape[-1])
+            coeffs.append(numpy.asarray(types.arraydata(c)))
+        return types.frozenarray(classes, dtype=int, copy=False), tuple(coeffs)
+
+    def _f_indices(self, index: evaluable.Array) -> Tuple[evaluable.Array, ...]:
+        # Unravel the element index into the element multi-index.
         indices = []
         for n in reversed(self._transforms_shape[1:]):
             index, ielem = evaluable.divmod(index, n)
             indices.append(ielem)
         indices.append(index)
         indices.reverse()
+        return tuple(indices)
+
+    def _f_dofs(self, indices: Sequence[evaluable.Array]) -> evaluable.Array:
+        # Compute the dofs from the dof multi-indices, with the first dimension
+        # varying slowest.
         ranges = [evaluable.Range(evaluable.get(evaluable.constant(lengths_i), 0, index_i)) + evaluable.get(evaluable.constant(offsets_i), 0, index_i)
                   for lengths_i, offsets_i, index_i in zip(self._ndofs, self._start_dofs, indices)]
         ndofs = self._dofs_shape[0]
@@ -3943,6 +4096,11 @@ class StructuredBasis(Basis):
         for range_i, ndofs_i in zip(ranges[1:], self._dofs_shape[1:]):
             dofs = evaluable.Ravel(evaluable.RavelIndex(dofs, range_i % ndofs_i, evaluable.constant(ndofs), evaluable.constant(ndofs_i)))
             ndofs = ndofs * ndofs_i
+        return dofs
+
+    def f_dofs_coeffs(self, index: evaluable.Array) -> Tuple[evaluable.Array, evaluable.Array]:
+        indices = self._f_indices(index)
+        dofs = self._f_dofs(indices)
         coeffs_per_dim = iter(evaluable.Elemwise(coeffs_i, index_i, float) for coeffs_i, index_i in zip(self._coeffs, indices))
         coeffs = next(coeffs_per_dim)
         for i, c in enumerate(coeffs_per_dim, 1):
@@ -3951,6 +4109,24 @@ class StructuredBasis(Basis):
             coeffs = evaluable.ravel(coeffs, 0)
         return dofs, coeffs
 
+    def lower(self, args: LowerArgs) -> evaluable.Array:
+        # Rather than evaluating the tensor product coefficients formed by
+        # `f_dofs_coeffs`, we evaluate the one-dimensional polynomials per
+        # dimension and form the outer product of the values. This keeps the
+        # tables of coefficients, and their tabulations on a points sequence,
+        # factored per dimension.
+        indices = self._f_indices(_WithoutPoints(self.index).lower(args))
+        coords = self.coords.lower(args)
+        values = None
+        for i, (coeffs_i, index_i) in enumerate(zip(self._coeffs, indices)):
+            values_i = evaluable.Polyval(evaluable.Elemwise(coeffs_i, index_i, float), coords[..., i:i+1])
+            if values is None:
+                values = values_i
+            else:
+                values = evaluable.insertaxis(values, values.ndim, values_i.shape[-1]) * evaluable.insertaxis(values_i, values_i.ndim-1, values.shape[-1])
+                values = evaluable.ravel(values, values.ndim-2)
+        return evaluable.Inflate(values, self._f_dofs(indices), evaluable.constant(self.ndofs))
+
 
 class PrunedBasis(Basis):
     '''A subset of another :class:`Basis`.
@@ -3974,10 +4150,16 @@ class PrunedBasis(Basis):
         self._renumber = types.frozenarray(numeric.invmap(self._dofmap, length=parent.ndofs, missing=len(self._dofmap)), copy=False)
         super().__init__(len(self._dofmap), len(transmap), index, coords)
 
-    def get_support(self, dof: Union[int, numpy.ndarray]) -> numpy.ndarray:
-        if numeric.isintarray(dof) and dof.ndim == 1 and numpy.any(numpy.less(dof, 0)):
-            raise IndexError('dof out of bounds')
-        return numeric.sorted_index(self._transmap, self._parent.get_support(self._dofmap[dof]), missing='mask')
+    @cached_property
+    def _elem_dofs(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        indptr, indices = self._parent._elem_dofs
+        counts = indptr[self._transmap+1] - indptr[self._transmap]
+        return types.frozenarray(numpy.cumsum([0, *counts]), dtype=int, copy=False), types.frozenarray(self._renumber[numeric.csr_rows(indptr, indices, self._transmap)], copy=False)
+
+    @cached_property
+    def _coeff_classes(self) -> Tuple[numpy.ndarray, Tuple[numpy.ndarray, ...]]:
+        classes, coeffs = self._parent._coeff_classes
+        return types.frozenarray(classes[self._transmap], copy=False), coeffs
 
     def f_dofs_coeffs(self, index: evaluable.Array) -> Tuple[evaluable.Array, evaluable.Array]:
         p_dofs, p_coeffs = self._parent.f_dofs_coeffs(evaluable.get(evaluable.constant(self._transmap), 0, index))
@@ -3985,6 +4167,99 @@ class PrunedBasis(Basis):
         return dofs, p_coeffs
 
 
+class PermutedBasis(Basis):
+    '''A renumbering of another :class:`Basis`.
+
+    Parameters
+    ----------
+    parent : :class:`Basis`
+        The basis to renumber.
+    permutation : array of :class:`int`\\s
+        The indices of ``parent`` basis functions in their new order, such that
+        dof ``i`` of this basis equals dof ``permutation[i]`` of ``parent``.
+    '''
+
+    def __init__(self, parent: Basis, permutation: numpy.ndarray) -> None:
+        permutation = types.frozenarray(permutation, dtype=int)
+        if permutation.shape != (parent.ndofs,) or not numpy.equal(numpy.sort(permutation), numpy.arange(parent.ndofs)).all():
+            raise ValueError('`permutation` is not a permutation of range({})'.format(parent.ndofs))
+        self._parent = parent
+        self.permutation = permutation
+        self._renumber = types.frozenarray(numeric.invmap(permutation, length=parent.ndofs), copy=False)
+        super().__init__(parent.ndofs, parent.nelems, parent.index, parent.coords)
+
+    @cached_property
+    def _elem_dofs(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        indptr, indices = self._parent._elem_dofs
+        return indptr, types.frozenarray(self._renumber[indices], copy=False)
+
+    @property
+    def _coeff_classes(self) -> Tuple[numpy.ndarray, Tuple[numpy.ndarray, ...]]:
+        return self._parent._coeff_classes
+
+    def f_dofs_coeffs(self, index: evaluable.Array) -> Tuple[evaluable.Array, evaluable.Array]:
+        p_dofs, p_coeffs = self._parent.f_dofs_coeffs(index)
+        dofs = evaluable.take(evaluable.constant(self._renumber), p_dofs, axis=0)
+        return dofs, p_coeffs
+
+
+def _number_coefficients(coeffs):
+    # Return the class of every coefficient array of the sequence `coeffs` of
+    # `types.arraydata`, along with the distinct coefficient arrays in order of
+    # first appearance. Since arraydata objects are unique per value, the
+    # classes follow from the identities of the objects, without hashing. The
+    # returned arrays are backed by arraydata, which makes them immutable and
+    # suitable for `types.lru_cache` (e.g. `transform_poly`).
+    numbers = {}
+    classes = types.frozenarray([numbers.setdefault(id(c), len(numbers)) for c in coeffs], dtype=int, copy=False)
+    unique = {id(c): c for c in coeffs}
+    return classes, tuple(numpy.asarray(types.arraydata(numpy.asarray(c, dtype=float))) for c in unique.values())
+
+
+def _dof_pairs(indptr, indices, ndofs):
+    # Return the sorted, unique pairs of dofs that share an element, from the
+    # element-dof table in CSR format. The pairs are formed per chunk of
+    # elements of at most `_dof_pairs_chunksize` pairs and deduplicated per
+    # chunk, such that the temporaries are bounded by the chunk size rather
+    # than by the total number of pairs of all elements. The deduplicated
+    # chunks are merged whenever they outgrow the pairs merged so far.
+    counts = numpy.diff(indptr)
+    offsets = numpy.concatenate([[0], numpy.cumsum(counts**2)])
+    merged = numpy.zeros((0,), dtype=int)
+    pending = []
+    npending = 0
+    start = 0
+    while start < len(counts):
+        stop = builtins.max(start + 1, numpy.searchsorted(offsets, offsets[start] + _dof_pairs_chunksize, side='right') - 1)
+        ielems = numpy.repeat(numpy.arange(start, stop), numpy.diff(offsets[start:stop+1]))
+        i, j = numpy.divmod(numpy.arange(offsets[start], offsets[stop]) - offsets[ielems], counts[ielems])
+        keys = numpy.unique(indices[indptr[ielems] + i] * ndofs + indices[indptr[ielems] + j])
+        del ielems, i, j
+        pending.append(keys)
+        npending += len(keys)
+        if npending > len(merged):
+            merged = numpy.unique(numpy.concatenate([merged, *pending]))
+            pending = []
+            npending = 0
+        start = stop
+    if pending:
+        merged = numpy.unique(numpy.concatenate([merged, *pending]))
+    return numpy.divmod(merged, ndofs)
+
+
+_dof_pairs_chunksize = 2**20
+
+
+def _bandwidth_profile(rows, cols, n):
+    # Return the bandwidth and the profile (envelope size) of a symmetric
+    # sparsity pattern, based on the distance of the first nonzero column of
+    # every row to the diagonal.
+    first = numpy.arange(n)
+    numpy.minimum.at(first, rows, cols)
+    distance = numpy.arange(n) - first
+    return int(distance.max(initial=0)), int(distance.sum())
+
+
 def Namespace(*args, **kwargs):
     from .expression_v1 import Namespace
     return Namespace(*args, **kwargs)
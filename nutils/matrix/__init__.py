@@ -9,6 +9,7 @@ the ``export`` method.
 from .. import _util as util, sparse, warnings
 import numpy
 import importlib
+import json
 import os
 
 from ._base import Matrix, MatrixError, BackendNotAvailable, ToleranceNotReached
@@ -37,6 +38,150 @@ def fromsparse(data, inplace=False):
     return backend.current.assemble(values, indices, shape)
 
 
+class AssemblyPlan:
+    '''Repeated assembly of matrices with a fixed sparsity pattern.
+
+    The plan analyses the (unsorted, possibly repeating) coo indices of a
+    sparse matrix once, forming the csr structure of the matrix, after which
+    matrices are formed from value arrays alone by summing values into a fresh
+    data vector. This avoids the sorting and deduplication of
+    :func:`fromsparse` in situations where the same indices are assembled many
+    times, such as the Jacobian in Newton iterations. The map from values to
+    matrix entries is stored in the smallest sufficient unsigned integer type,
+    and is omitted altogether if the indices are sorted and unique. Matrices
+    are formed using the backend that is active at the time of the call, which
+    prepares its native form of the csr structure once per plan. Assembled
+    matrices never share data with the values they are formed from, such that
+    the values may be modified in place for the next assembly.
+
+    >>> plan = AssemblyPlan(([1, 0, 1], [0, 1, 0]), shape=(2, 2))
+    >>> plan([1., 2., 3.]).export('dense')
+    array([[ 0.,  2.],
+           [ 4.,  0.]])
+
+    Args
+    ----
+    index : pair of :class:`int` arrays
+        Row and column indices of the values to be assembled.
+    shape : pair of :class:`int`
+        Shape of the matrix.
+    '''
+
+    def __init__(self, index, shape):
+        if len(index) != 2 or len(shape) != 2:
+            raise MatrixError('assembly plan requires two-dimensional indices')
+        self.shape = tuple(map(int, shape))
+        flat = numpy.ravel_multi_index(tuple(numpy.asarray(i, dtype=int) for i in index), self.shape)
+        self.nvalues = len(flat)
+        if numpy.greater(flat[1:], flat[:-1]).all():  # sorted and unique
+            self._target = None
+            unique = flat
+        else:
+            order = numpy.argsort(flat, kind='stable')
+            flat = flat[order]
+            isnew = numpy.empty(len(flat), dtype=bool)
+            isnew[:1] = True
+            numpy.not_equal(flat[1:], flat[:-1], out=isnew[1:])
+            unique = flat[isnew]
+            target = numpy.empty(len(flat), dtype=sparse._uint(len(unique)).newbyteorder('='))
+            target[order] = numpy.cumsum(isnew) - 1
+            self._target = target
+        self.nnz = len(unique)
+        rows, cols = numpy.divmod(unique, self.shape[1])
+        itype = numpy.int32 if max(self.nnz, *self.shape) < 2**31 else numpy.int64
+        self._indices = cols.astype(itype)
+        self._indptr = rows.searchsorted(numpy.arange(self.shape[0]+1)).astype(itype)
+        self._assemblers = {}
+
+    def __call__(self, values):
+        '''Assemble matrix from values.
+
+        Args
+        ----
+        values : :class:`float` or :class:`complex` array
+            Values in the order of the indices with which the plan was created.
+            Values with repeated indices are summed.
+
+        Returns
+        -------
+        :class:`Matrix`
+        '''
+
+        values = numpy.asarray(values)
+        if values.shape != (self.nvalues,):
+            raise MatrixError('expected {} values, got array of shape {}'.format(self.nvalues, values.shape))
+        if self._target is None:
+            data = values.copy()
+        elif values.dtype.kind == 'c':
+            data = numpy.bincount(self._target, values.real, self.nnz) + 1j * numpy.bincount(self._target, values.imag, self.nnz)
+        else:
+            data = numpy.bincount(self._target, values, self.nnz)
+        try:
+            assemble = self._assemblers[backend.current]
+        except KeyError:
+            assemble = self._assemblers[backend.current] = backend.current.csr_assembler(self._indices, self._indptr, self.shape)
+        return assemble(data)
+
+
+def save(path, mat):
+    '''Write matrix to disk in binary csr format.
+
+    The matrix is stored as a directory containing the csr arrays ``data``,
+    ``indices`` and ``indptr`` in Numpy's ``.npy`` format, and a small json
+    header with the matrix shape. The files can be read by any tool that
+    supports the ``.npy`` format, and are loaded without copying by
+    :func:`load`. Index arrays are stored as 32 bit integers if possible.
+
+    Args
+    ----
+    path : :class:`str` or :class:`os.PathLike`
+        Directory to write the matrix to. The directory is created if it does
+        not exist.
+    mat : :class:`Matrix`
+        The matrix to be written.
+    '''
+
+    data, indices, indptr = mat.export('csr')
+    itype = numpy.int32 if max(len(data), *mat.shape) < 2**31 else numpy.int64
+    os.makedirs(path, exist_ok=True)
+    numpy.save(os.path.join(path, 'data.npy'), data)
+    numpy.save(os.path.join(path, 'indices.npy'), numpy.asarray(indices, dtype=itype))
+    numpy.save(os.path.join(path, 'indptr.npy'), numpy.asarray(indptr, dtype=itype))
+    with open(os.path.join(path, 'header.json'), 'w') as f:
+        json.dump(dict(format='csr', version=1, shape=list(map(int, mat.shape))), f)
+
+
+def load(path, mmap=True):
+    '''Read matrix from disk.
+
+    Read a matrix that was written by :func:`save` and form a matrix with the
+    active backend. By default the arrays are memory mapped rather than read,
+    such that matrices larger than the available memory can be loaded without
+    copying to the extent that the backend supports it.
+
+    Args
+    ----
+    path : :class:`str` or :class:`os.PathLike`
+        Directory to read the matrix from.
+    mmap : :class:`bool`
+        Memory map the arrays read-only (default) or read them into memory.
+
+    Returns
+    -------
+    :class:`Matrix`
+    '''
+
+    with open(os.path.join(path, 'header.json')) as f:
+        header = json.load(f)
+    if header.get('format') != 'csr' or header.get('version') != 1:
+        raise MatrixError('{} does not contain a supported matrix format'.format(path))
+    data, indices, indptr = [numpy.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None, allow_pickle=False) for name in ('data', 'indices', 'indptr')]
+    shape = tuple(header['shape'])
+    if len(shape) != 2 or indptr.shape != (shape[0]+1,) or not len(indices) == len(data) == indptr[-1]:
+        raise MatrixError('{} contains inconsistent matrix data'.format(path))
+    return backend.current.assemble_csr(data, indices, indptr, shape)
+
+
 def empty(shape):
     return backend.current.assemble(data=numpy.empty([0], dtype=float), index=numpy.empty([len(shape), 0], dtype=int), shape=shape)
 
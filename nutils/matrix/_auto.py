@@ -1,9 +1,9 @@
 from ._base import BackendNotAvailable
 
 try:
-    from ._mkl import assemble
+    from ._mkl import assemble, assemble_csr, csr_assembler
 except BackendNotAvailable:
     try:
-        from ._scipy import assemble
+        from ._scipy import assemble, assemble_csr, csr_assembler
     except BackendNotAvailable:
-        from ._numpy import assemble
+        from ._numpy import assemble, assemble_csr, csr_assembler
@@ -4,6 +4,7 @@ import treelog
 import functools
 import numpy
 import collections
+import itertools
 
 
 class MatrixError(Exception):
@@ -39,6 +40,7 @@ class Matrix:
         self.dtype = dtype
         self._precon_args = None
         self._cached_submatrix = None
+        self._cached_lowprecision = None  # low precision matrix, or False if refinement failed
 
     def __reduce__(self):
         from . import assemble
@@ -219,26 +221,88 @@ class Matrix:
             raise ToleranceNotReached(lhs)
         return lhs
 
-    def _solver_direct(self, rhs, atol, precon='direct', preconargs={}, **args):
+    def _solver_direct(self, rhs, atol, precon='direct', preconargs={}, mixedprecision=False, **args):
+        if mixedprecision and self._cached_lowprecision is not False:
+            if self.dtype.kind != 'c' and rhs.dtype.kind == 'c':
+                # solve the real and imaginary parts as real right hand sides, as
+                # the imaginary part would otherwise be lost in the conversion to
+                # single precision
+                lhs = self._solver_direct(numpy.stack([rhs.real, rhs.imag], axis=-1), atol / numpy.sqrt(2), precon, preconargs, mixedprecision, **args)
+                return lhs[..., 0] + 1j * lhs[..., 1]
+            if self._cached_lowprecision is None:
+                self._cached_lowprecision = self._lowprecision(numpy.complex64 if self.dtype.kind == 'c' else numpy.float32)
+            try:
+                lhs = self._refine_lowprecision(rhs, atol, self._cached_lowprecision.getprecon(precon, **args, **preconargs))
+            except (MatrixError, numpy.linalg.LinAlgError) as e:
+                treelog.debug('single precision solve failed with error: {}'.format(e))
+                lhs = None
+            if lhs is not None:
+                return lhs
+            treelog.warning('mixed precision refinement failed, falling back to full precision factorization')
+            self._cached_lowprecision = False  # release the low precision factorization and skip it in subsequent solves
         solve = self.getprecon(precon, **args, **preconargs)
         return solve(rhs)
 
+    def _refine_lowprecision(self, rhs, atol, solve):
+        # Iteratively refine the solution obtained from a single precision
+        # factorization against the full precision matrix. Returns None if the
+        # residual fails to halve in an iteration without the update having
+        # dropped below single precision resolution, which signals that the
+        # matrix is too ill-conditioned for refinement to converge.
+        lowdtype = self._cached_lowprecision.dtype
+        lowres = numpy.finfo(lowdtype).eps
+        lhs = numpy.zeros(rhs.shape, dtype=self.dtype)
+        res = rhs
+        resnorm = numpy.linalg.norm(res, axis=0).max()
+        while resnorm > atol:
+            dlhs = numpy.asarray(solve(res.astype(lowdtype)), dtype=self.dtype)
+            lhs = lhs + dlhs
+            res = rhs - self @ lhs
+            newresnorm = numpy.linalg.norm(res, axis=0).max()
+            if not numpy.isfinite(newresnorm):
+                return None
+            if newresnorm > resnorm / 2:
+                if (numpy.linalg.norm(dlhs, axis=0) <= lowres * numpy.linalg.norm(lhs, axis=0)).all():
+                    break  # refinement converged to full precision
+                return None
+            if newresnorm == 0.0:
+                treelog.debug('solution is exact')
+            else:
+                treelog.debug('residual decreased by {:.1f} orders in single precision refinement'.format(numpy.log10(resnorm/newresnorm)))
+            resnorm = newresnorm
+        return lhs
+
+    def _lowprecision(self, dtype):
+        raise MatrixError('{} does not support single precision factorization'.format(self.__class__.__name__))
+
     def _solver_arnoldi(self, rhs, atol, precon='direct', truncate=None, preconargs={}, **args):
+        # Multiple right hand sides share a single Krylov space: every vector
+        # that is generated for any of the columns is used to reduce the
+        # residuals of all columns, and only the columns of the search block
+        # that are linearly dependent on the existing space are discarded.
         solve = self.getprecon(precon, **args, **preconargs)
-        lhs = numpy.zeros_like(rhs)
+        lhs = numpy.zeros(rhs.shape, dtype=numpy.result_type(self.dtype, rhs.dtype))
         res = rhs
         resnorm = numpy.linalg.norm(res, axis=0).max()
         krylov = collections.deque(maxlen=truncate)  # unlimited if truncate is None
         while resnorm > atol:
-            k = solve(res)
-            v = self @ k
-            for k_, v_, v2_ in krylov:  # orthogonolize v (modified Gramm-Schmidt)
-                c = _vdot(v, v_) / v2_
-                k -= k_ * c
-                v -= v_ * c
-            v2 = _vdot(v)
-            c = _vdot(v, res) / v2  # min_c |res - c v| => c = v.res / v.v
-            newlhs = lhs + k * c
+            K = solve(res).reshape(len(rhs), -1)
+            V = (self @ K).reshape(len(rhs), -1)
+            block = []
+            for k, v in zip(K.T, V.T):
+                v2 = _vdot(v)
+                for k_, v_, v2_ in itertools.chain(krylov, block):  # orthogonolize v (modified Gramm-Schmidt)
+                    c = _vdot(v_, v) / v2_
+                    k = k - k_ * c
+                    v = v - v_ * c
+                v2, v2orig = _vdot(v), v2
+                if v2 > v2orig * numpy.finfo(self.dtype).eps:  # skip vectors that are (nearly) contained in the krylov space
+                    block.append((k, v, v2))
+            newlhs = lhs.reshape(len(rhs), -1).copy()
+            for k, v, v2 in block:
+                c = _vdot(v[:, numpy.newaxis], res.reshape(len(rhs), -1)) / v2  # min_c |res - c v| => c = v.res / v.v
+                newlhs += k[:, numpy.newaxis] * c
+            newlhs = newlhs.reshape(rhs.shape)
             res = rhs - self @ newlhs  # recompute rather than update to avoid drift
             newresnorm = numpy.linalg.norm(res, axis=0).max()
             if not numpy.isfinite(newresnorm) or newresnorm >= resnorm:
@@ -249,7 +313,7 @@ class Matrix:
                 treelog.debug('residual decreased by {:.1f} orders using {} krylov vectors'.format(numpy.log10(resnorm/newresnorm), len(krylov)))
             lhs = newlhs
             resnorm = newresnorm
-            krylov.append((k, v, v2))
+            krylov.extend(block)
         return lhs
 
     def submatrix(self, rows, cols):
@@ -333,12 +397,31 @@ class Matrix:
         diag = self.diagonal()
         if not diag.all():
             raise MatrixError("building 'diag' preconditioner: diagonal has zero entries")
-        return numpy.reciprocal(diag).__mul__
+        return functools.partial(_scale_rows, numpy.reciprocal(diag))
 
     def __repr__(self):
         return '{}<{}x{}>'.format(type(self).__qualname__, *self.shape)
 
 
+def _scale_rows(scale, a):
+    return (a.T * scale).T
+
+
+def _columnwise(solver):
+    '''Decorator for solver methods that support only a single right hand side
+    vector, which solves a multi-dimensional right hand side column by column.'''
+
+    @functools.wraps(solver)
+    def wrapped(self, rhs, *args, **kwargs):
+        if rhs.ndim == 1:
+            return solver(self, rhs, *args, **kwargs)
+        with treelog.iter.fraction('rhs', rhs.reshape(len(rhs), -1).T) as columns:
+            lhs = [solver(self, column, *args, **kwargs) for column in columns]
+        return numpy.stack(lhs, axis=1).reshape(rhs.shape)
+
+    return wrapped
+
+
 def _vdot(a, b=None):
     # Complex dot product that uses numpy.sum rather than a direct reduction for
     # slightly higher accuracy due to partial pairwise summation, see
@@ -1,4 +1,4 @@
-from ._base import Matrix, MatrixError, BackendNotAvailable
+from ._base import Matrix, MatrixError, BackendNotAvailable, _columnwise
 from .. import numeric, _util as util, warnings
 from contextlib import contextmanager
 from ctypes import c_int, byref, CDLL
@@ -27,6 +27,18 @@ def assemble(data, index, shape):
                      colidx=numpy.add(index[1], 1, dtype=numpy.int32))
 
 
+def assemble_csr(data, indices, indptr, shape):
+    return csr_assembler(indices, indptr, shape)(data)
+
+
+def csr_assembler(indices, indptr, shape):
+    # The one-based index arrays are shared by all assembled matrices, which
+    # treat them as immutable.
+    rowptr = numpy.add(indptr, 1, dtype=numpy.int32)
+    colidx = numpy.add(indices, 1, dtype=numpy.int32)
+    return lambda data: MKLMatrix(data, rowptr=rowptr, colidx=colidx, ncols=shape[1])
+
+
 class Pardiso:
     '''Wrapper for libmkl.pardiso.
 
@@ -69,7 +81,7 @@ class Pardiso:
             self.iparm[n] = v
         self.iparm[10] = 1 # enable scaling (default for nonsymmetric matrices, recommended for highly indefinite symmetric matrices)
         self.iparm[12] = 1 # enable matching (default for nonsymmetric matrices, recommended for highly indefinite symmetric matrices)
-        self.iparm[27] = 0 # double precision data
+        self.iparm[27] = int(self.dtype.char in 'fF') # single or double precision data
         self.iparm[34] = 0 # one-based indexing
         self.iparm[36] = 0 # csr matrix format
         self._phase(12)  # analysis, numerical factorization
@@ -100,13 +112,13 @@ class MKLMatrix(Matrix):
 
     def __init__(self, data, rowptr, colidx, ncols):
         assert len(data) == len(colidx) == rowptr[-1]-1
-        self.data = numpy.ascontiguousarray(data, dtype=numpy.complex128 if data.dtype.kind == 'c' else numpy.float64)
+        self.data = numpy.ascontiguousarray(data, dtype=data.dtype if data.dtype.char in 'fF' else numpy.complex128 if data.dtype.kind == 'c' else numpy.float64)
         self.rowptr = numpy.ascontiguousarray(rowptr, dtype=numpy.int32)
         self.colidx = numpy.ascontiguousarray(colidx, dtype=numpy.int32)
         super().__init__((len(rowptr)-1, ncols), self.data.dtype)
 
     def mkl_(self, name, *args):
-        attr = 'mkl_' + dict(f='d', c='z')[self.dtype.kind] + name
+        attr = 'mkl_' + dict(f='s', d='d', F='c', D='z')[self.dtype.char] + name
         return getattr(libmkl, attr)(*args)
 
     def convert(self, mat):
@@ -151,6 +163,8 @@ class MKLMatrix(Matrix):
             raise TypeError
         if other.shape[0] != self.shape[1]:
             raise MatrixError
+        if self.dtype.kind != 'c' and other.dtype.kind == 'c':
+            return self @ other.real + 1j * (self @ other.imag)
         x = numpy.ascontiguousarray(other.T, dtype=self.dtype)
         y = numpy.empty(x.shape[:-1] + self.shape[:1], dtype=self.dtype)
         if other.ndim == 1:
@@ -210,9 +224,10 @@ class MKLMatrix(Matrix):
             return self.data, (numpy.arange(self.shape[0]).repeat(self.rowptr[1:]-self.rowptr[:-1]), self.colidx-1)
         raise NotImplementedError('cannot export MKLMatrix to {!r}'.format(form))
 
+    @_columnwise
     def _solver_fgmres(self, rhs, atol, maxiter=0, restart=150, precon=None, ztol=1e-12, preconargs={}, **args):
-        if self.dtype.kind == 'c':
-            raise MatrixError("MKL's fgmres does not support complex data")
+        if self.dtype != numpy.float64:
+            raise MatrixError("MKL's fgmres supports only double precision real data")
         rci = c_int(0)
         n = c_int(len(rhs))
         b = numpy.array(rhs, dtype=numpy.float64, copy=False)
@@ -264,6 +279,9 @@ class MKLMatrix(Matrix):
         log.debug('performed {} fgmres iterations, {} restarts'.format(ipar[3], ipar[3]//ipar[14]))
         return x
 
+    def _lowprecision(self, dtype):
+        return MKLMatrix(self.data.astype(dtype), self.rowptr, self.colidx, self.shape[1])
+
     def _precon_direct(self, **args):
         return Pardiso(mtype=dict(f=11, c=13)[self.dtype.kind], a=self.data, ia=self.rowptr, ja=self.colidx, **args)
 
@@ -11,6 +11,20 @@ def assemble(data, index, shape):
     return NumpyMatrix(array)
 
 
+def assemble_csr(data, indices, indptr, shape):
+    return csr_assembler(indices, indptr, shape)(data)
+
+
+def csr_assembler(indices, indptr, shape):
+    index = numpy.arange(shape[0]).repeat(numpy.diff(indptr)), numpy.asarray(indices)
+
+    def assemble(data):
+        array = numpy.zeros(shape, dtype=data.dtype)
+        array[index] = data
+        return NumpyMatrix(array)
+    return assemble
+
+
 class NumpyMatrix(Matrix):
     '''matrix based on numpy array'''
 
@@ -70,6 +84,9 @@ class NumpyMatrix(Matrix):
     def _precon_direct(self):
         return functools.partial(numpy.linalg.solve, self.core)
 
+    def _lowprecision(self, dtype):
+        return NumpyMatrix(self.core.astype(dtype))
+
     def _submatrix(self, rows, cols):
         return NumpyMatrix(self.core[numpy.ix_(rows, cols)])
 
@@ -1,4 +1,4 @@
-from ._base import Matrix, MatrixError, BackendNotAvailable
+from ._base import Matrix, MatrixError, BackendNotAvailable, _columnwise
 from .. import numeric
 import treelog as log
 import numpy
@@ -9,7 +9,17 @@ except ImportError:
 
 
 def assemble(data, index, shape):
-    return ScipyMatrix(scipy.sparse.csr_matrix((data, index), shape))
+    # The assembly input is sorted and free of duplicates, which allows us to
+    # form the csr structure directly rather than via coo conversion.
+    return assemble_csr(data, index[1], numpy.searchsorted(index[0], numpy.arange(shape[0]+1)), shape)
+
+
+def assemble_csr(data, indices, indptr, shape):
+    return csr_assembler(indices, indptr, shape)(data)
+
+
+def csr_assembler(indices, indptr, shape):
+    return lambda data: ScipyMatrix(scipy.sparse.csr_matrix((data, indices, indptr), shape))
 
 
 class ScipyMatrix(Matrix):
@@ -71,6 +81,7 @@ class ScipyMatrix(Matrix):
     _solver_gmres = lambda self, rhs, atol, **kwargs: self._solver_scipy(rhs, 'gmres', atol, callback_type='pr_norm', **kwargs)
     _solver_lgmres = lambda self, rhs, atol, **kwargs: self._solver_scipy(rhs, 'lgmres', atol, **kwargs)
 
+    @_columnwise
     def _solver_scipy(self, rhs, method, atol, callback=None, precon=None, preconargs={}, **solverargs):
         solverfun = getattr(scipy.sparse.linalg, method)
         if precon is not None:
@@ -99,6 +110,9 @@ class ScipyMatrix(Matrix):
     def _precon_spilu0(self, **kwargs):
         return self._precon_spilu(fill_factor=1., **kwargs)
 
+    def _lowprecision(self, dtype):
+        return ScipyMatrix(self.core.astype(dtype))
+
     def _submatrix(self, rows, cols):
         return ScipyMatrix(self.core[rows, :][:, cols])
 
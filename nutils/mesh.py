@@ -6,7 +6,7 @@ accompanying geometry function. Meshes can either be generated on the fly, e.g.
 provided at this point.
 """
 
-from . import topology, function, _util as util, element, numeric, transform, transformseq, warnings, types, cache
+from . import topology, function, _util as util, element, numeric, transform, transformseq, warnings, types, cache, version
 from .elementseq import References
 from .transform import TransformItem
 from .topology import Topology
@@ -20,6 +20,11 @@ import math
 import treelog as log
 import io
 import contextlib
+import mmap
+import hashlib
+import json
+import shutil
+import warnings as _builtin_warnings
 _ = numpy.newaxis
 
 # MESH GENERATORS
@@ -299,7 +304,9 @@ def parsegmsh(mshdata):
     """Gmsh parser
 
     Parser for Gmsh data in ``msh2`` or ``msh4`` format. See the `Gmsh manual
-    <http://geuz.org/gmsh/doc/texinfo/gmsh.html>`_ for details.
+    <http://geuz.org/gmsh/doc/texinfo/gmsh.html>`_ for details. Data in
+    ``msh4.1`` format, either ascii or binary, is parsed natively, memory
+    mapping the file if possible; other versions require the meshio module.
 
     Parameters
     ----------
@@ -312,62 +319,15 @@ def parsegmsh(mshdata):
         Keyword arguments for :func:`simplex`
     """
 
-    try:
-        from meshio import gmsh
-    except ImportError as e:
-        raise Exception('parsegmsh requires the meshio module to be installed') from e
-
-    msh = gmsh.main.read_buffer(mshdata)
-
-    if not msh.cell_sets:
-        # Old versions of the gmsh file format repeat elements that have multiple
-        # tags. To support this we edit the meshio data to bring it in the same
-        # form as the new files by deduplicating cells and creating cell_sets.
-        renums = []
-        for icell, cells in enumerate(msh.cells):
-            keep = (cells.data[1:] != cells.data[:-1]).any(axis=1)
-            if keep.all():
-                renum = numpy.arange(len(cells.data))
-            else:
-                msh.cells[icell] = type(cells)(cells.type, cells.data[numpy.hstack([True, keep])])
-                renum = numpy.hstack([0, keep.cumsum()])
-            renums.append(renum)
-        for name, (itag, nd) in msh.field_data.items():
-            msh.cell_sets[name] = [renum[data == itag] for data, renum in zip(msh.cell_data['gmsh:physical'], renums)]
-
-    # Coords is a 2d float-array such that coords[inode,idim] == coordinate.
-    coords = msh.points
-
-    # Nodes is a dictionary that maps a topological dimension to a 2d int-array
-    # dictionary such that nodes[nd][ielem,ilocal] == inode, where ilocal < nd+1
-    # for linear geometries or larger for higher order geometries. Since meshio
-    # stores nodes by simplex type and cell, simplex types are mapped to
-    # dimensions and gathered, after which cells are concatenated under the
-    # assumption that there is only one simplex type per dimension.
-    nodes = {('ver', 'lin', 'tri', 'tet').index(typename[:3]): numpy.concatenate(datas, axis=0)
-             for typename, datas in util.gather((cells.type, cells.data) for cells in msh.cells)}
-
-    # Identities is a 2d [master, slave] int-aray that pairs matching nodes on
-    # periodic walls. For the topological connectivity, all slaves in the nodes
-    # arrays will be replaced by their master counterpart.
-    identities = numpy.zeros((0, 2), dtype=int) if not msh.gmsh_periodic \
-        else numpy.concatenate([d for a, b, c, d in msh.gmsh_periodic], axis=0)
-
-    # It may happen that meshio provides periodicity relations for nodes that
-    # have no associated coordinate, typically because they are not part of any
-    # physical group. We need to filter these out to avoid errors further down.
-    mask = identities < len(coords)
-    keep = mask.any(axis=1)
-    assert mask[keep].all()
-    identities = identities[keep]
-
-    # Tags is a list of (nd, name, ndelems) tuples that define topological groups
-    # per dimension. Since meshio associates group names with cells, which are
-    # concatenated in nodes, element ids are offset and concatenated to match.
-    tags = [(nd, name, numpy.concatenate([selection
-                                          + sum(len(cells.data) for cells in msh.cells[:icell] if cells.type == msh.cells[icell].type)  # offset into nodes
-                                          for icell, selection in enumerate(msh.cell_sets[name]) if len(selection)]))
-            for name, (itag, nd) in msh.field_data.items()]
+    if isinstance(mshdata, io.IOBase) and mshdata.seekable():
+        header = mshdata.read(64)
+        mshdata.seek(-len(header), io.SEEK_CUR)
+    else:
+        header = b''
+    if re.match(rb'\$MeshFormat\r?\n4\.1 [01] [48]\r?\n', header):
+        coords, nodes, identities, tags = _parsemsh41(mshdata)
+    else:
+        coords, nodes, identities, tags = _parsegmsh_meshio(mshdata)
 
     # determine the dimension of the topology
     ndims = max(nodes)
@@ -446,13 +406,258 @@ def parsegmsh(mshdata):
     return dict(nodes=vnodes, cnodes=cnodes, coords=coords, tags=vtags, btags=btags, ptags=ptags)
 
 
+# Gmsh element types: number of dimensions, number of nodes and the node
+# ordering that is expected by parsegmsh (following meshio's conventions).
+_gmsh_element_types = {
+    15: (0, 1, None),  # point
+    1: (1, 2, None),  # 2-node line
+    8: (1, 3, None),  # 3-node line
+    26: (1, 4, None),  # 4-node line
+    27: (1, 5, None),  # 5-node line
+    2: (2, 3, None),  # 3-node triangle
+    9: (2, 6, None),  # 6-node triangle
+    21: (2, 10, None),  # 10-node triangle
+    23: (2, 15, None),  # 15-node triangle
+    4: (3, 4, None),  # 4-node tetrahedron
+    11: (3, 10, (0, 1, 2, 3, 4, 5, 6, 7, 9, 8)),  # 10-node tetrahedron
+}
+
+
+class _MshSection:
+    # Sequential reader of the numeric data of a msh section, which is either
+    # binary (read directly from the underlying buffer) or ascii (parsed into
+    # a float array, which represents the integers in a msh file exactly).
+
+    def __init__(self, data, start, stop, binary, byteorder, datasize):
+        if binary:
+            self._data = data
+            self._pos = start
+            self._types = dict(i=numpy.dtype(byteorder+'i4'), n=numpy.dtype(byteorder+'u'+str(datasize)), d=numpy.dtype(byteorder+'f8'))
+        else:
+            # numpy.fromstring in text mode, which unlike the deprecated binary
+            # mode is supported, parses the section without creating an object
+            # per number. It merely warns if it cannot parse the data to its
+            # end, which we turn into an error.
+            with _builtin_warnings.catch_warnings():
+                _builtin_warnings.simplefilter('error', DeprecationWarning)
+                try:
+                    self._data = numpy.fromstring(data[start:stop], dtype=float, sep=' ')
+                except DeprecationWarning:
+                    raise ValueError('invalid data in msh section') from None
+            self._pos = 0
+            self._types = None
+
+    def read(self, type, count):
+        if self._types:
+            dtype = self._types[type]
+            values = numpy.frombuffer(self._data, dtype=dtype, count=count, offset=self._pos)
+            self._pos += count * dtype.itemsize
+        else:
+            values = self._data[self._pos:self._pos+count]
+            if len(values) < count:
+                raise ValueError('unexpected end of msh section')
+            self._pos += count
+        # Always copy, such that the returned arrays do not keep a memory mapped
+        # buffer alive beyond the lifetime of the map.
+        return values.astype(float if type == 'd' else int)
+
+    def readint(self, type):
+        return int(self.read(type, 1)[0])
+
+
+def _parsemsh41(mshdata):
+    # Parse msh 4.1 data, binary or ascii, returning the same data as
+    # _parsegmsh_meshio. If the data is backed by a file it is memory mapped
+    # for the duration of the parse, and all numeric data is read directly
+    # into arrays.
+
+    if not mshdata.tell():
+        try:
+            data = mmap.mmap(mshdata.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            pass
+        else:
+            with data:
+                return _parsemsh41data(data)
+    return _parsemsh41data(mshdata.read())
+
+
+def _parsemsh41data(data):
+    # Parse the msh 4.1 data from a bytes-like object that supports find.
+
+    sections = {}
+    pos = 0
+    while True:
+        start = data.find(b'$', pos)
+        if start == -1:
+            break
+        eol = data.find(b'\n', start)
+        name = bytes(data[start+1:eol]).strip()
+        stop = data.find(b'$End' + name, eol)
+        if stop == -1:
+            raise ValueError('msh section {} is not terminated'.format(name.decode()))
+        sections[name.decode()] = eol + 1, stop
+        pos = stop + 4 + len(name)
+
+    start, stop = sections['MeshFormat']
+    eol = data.find(b'\n', start)
+    version, filetype, datasize = bytes(data[start:eol]).split()
+    binary = filetype == b'1'
+    byteorder = '<' if not binary or numpy.frombuffer(data, dtype='<i4', count=1, offset=eol+1)[0] == 1 else '>'
+    section = lambda name: _MshSection(data, *sections[name], binary, byteorder, int(datasize))
+
+    # Physical names, as a mapping from (dim, physical tag) to name, in order.
+    physicalnames = {}
+    if 'PhysicalNames' in sections:
+        start, stop = sections['PhysicalNames']
+        for line in bytes(data[start:stop]).decode().splitlines()[1:]:
+            dim, tag, name = line.split(maxsplit=2)
+            physicalnames[int(dim), int(tag)] = name.strip().strip('"')
+
+    # Physical tags per (dim, entity tag).
+    entities = {}
+    if 'Entities' in sections:
+        reader = section('Entities')
+        for dim, count in enumerate(reader.read('n', 4)):
+            for i in range(count):
+                tag = reader.readint('i')
+                reader.read('d', 3 if dim == 0 else 6)  # bounding box
+                entities[dim, tag] = reader.read('i', reader.readint('n')).tolist()
+                if dim:
+                    reader.read('i', reader.readint('n'))  # bounding entities
+
+    # Coordinates, and a map from node tags to node indices.
+    reader = section('Nodes')
+    nblocks, nnodes, minnodetag, maxnodetag = reader.read('n', 4)
+    nodetags = []
+    coords = []
+    for iblock in range(nblocks):
+        dim, tag, parametric = reader.read('i', 3)
+        count = reader.readint('n')
+        nodetags.append(reader.read('n', count))
+        coords.append(reader.read('d', count * (3 + (dim if parametric else 0))).reshape(count, -1)[:, :3])
+    nodetags = numpy.concatenate(nodetags) if nodetags else numpy.zeros((0,), dtype=int)
+    coords = numpy.concatenate(coords) if coords else numpy.zeros((0, 3))
+    nodeindex = numpy.full(maxnodetag + 2, -1)  # the last entry maps out-of-range tags to -1
+    nodeindex[nodetags] = numpy.arange(len(nodetags))
+
+    # Nodes per dimension, concatenated over element blocks, and the elements
+    # per physical group.
+    reader = section('Elements')
+    nblocks, nelems, minelemtag, maxelemtag = reader.read('n', 4)
+    nodes = {}
+    offsets = {}
+    selections = {name: [] for name in physicalnames.values()}
+    for iblock in range(nblocks):
+        dim, tag, elemtype = reader.read('i', 3)
+        count = reader.readint('n')
+        try:
+            nd, nelemnodes, order = _gmsh_element_types[elemtype]
+        except KeyError:
+            raise ValueError('unsupported gmsh element type {}'.format(elemtype)) from None
+        elemnodes = nodeindex[reader.read('n', count * (1 + nelemnodes)).reshape(count, 1 + nelemnodes)[:, 1:]]
+        if order:
+            elemnodes = elemnodes[:, order]
+        nodes.setdefault(nd, []).append(elemnodes)
+        offset = offsets.get(nd, 0)
+        offsets[nd] = offset + count
+        for physicaltag in entities.get((dim, tag), ()):
+            name = physicalnames.get((dim, physicaltag))
+            if name is not None:
+                selections[name].append(numpy.arange(offset, offset + count))
+    nodes = {nd: numpy.concatenate(n) for nd, n in nodes.items()}
+    tags = [(nd, name, numpy.concatenate(selections[name]) if selections[name] else numpy.zeros((0,), dtype=int))
+            for (nd, tag), name in physicalnames.items()]
+
+    # Periodic node identities as (slave, master) pairs.
+    identities = [numpy.zeros((0, 2), dtype=int)]
+    if 'Periodic' in sections:
+        reader = section('Periodic')
+        for i in range(reader.readint('n')):
+            reader.read('i', 3)
+            reader.read('d', reader.readint('n'))  # affine transformation
+            pairs = reader.read('n', reader.readint('n') * 2).reshape(-1, 2)
+            identities.append(nodeindex[numpy.minimum(pairs, maxnodetag + 1)])
+    identities = numpy.concatenate(identities)
+    identities = identities[(identities != -1).all(axis=1)]
+
+    return coords, nodes, identities, tags
+
+
+def _parsegmsh_meshio(mshdata):
+    # Parse msh data via meshio, returning the coordinates, a dictionary of
+    # nodes per dimension, an array of periodic node identities and a list of
+    # tagged element groups.
+
+    try:
+        from meshio import gmsh
+    except ImportError as e:
+        raise Exception('parsegmsh requires the meshio module to be installed') from e
+
+    msh = gmsh.main.read_buffer(mshdata)
+
+    if not msh.cell_sets:
+        # Old versions of the gmsh file format repeat elements that have multiple
+        # tags. To support this we edit the meshio data to bring it in the same
+        # form as the new files by deduplicating cells and creating cell_sets.
+        renums = []
+        for icell, cells in enumerate(msh.cells):
+            keep = (cells.data[1:] != cells.data[:-1]).any(axis=1)
+            if keep.all():
+                renum = numpy.arange(len(cells.data))
+            else:
+                msh.cells[icell] = type(cells)(cells.type, cells.data[numpy.hstack([True, keep])])
+                renum = numpy.hstack([0, keep.cumsum()])
+            renums.append(renum)
+        for name, (itag, nd) in msh.field_data.items():
+            msh.cell_sets[name] = [renum[data == itag] for data, renum in zip(msh.cell_data['gmsh:physical'], renums)]
+
+    # Coords is a 2d float-array such that coords[inode,idim] == coordinate.
+    coords = msh.points
+
+    # Nodes is a dictionary that maps a topological dimension to a 2d int-array
+    # dictionary such that nodes[nd][ielem,ilocal] == inode, where ilocal < nd+1
+    # for linear geometries or larger for higher order geometries. Since meshio
+    # stores nodes by simplex type and cell, simplex types are mapped to
+    # dimensions and gathered, after which cells are concatenated under the
+    # assumption that there is only one simplex type per dimension.
+    nodes = {('ver', 'lin', 'tri', 'tet').index(typename[:3]): numpy.concatenate(datas, axis=0)
+             for typename, datas in util.gather((cells.type, cells.data) for cells in msh.cells)}
+
+    # Identities is a 2d [master, slave] int-aray that pairs matching nodes on
+    # periodic walls. For the topological connectivity, all slaves in the nodes
+    # arrays will be replaced by their master counterpart.
+    identities = numpy.zeros((0, 2), dtype=int) if not msh.gmsh_periodic \
+        else numpy.concatenate([d for a, b, c, d in msh.gmsh_periodic], axis=0)
+
+    # It may happen that meshio provides periodicity relations for nodes that
+    # have no associated coordinate, typically because they are not part of any
+    # physical group. We need to filter these out to avoid errors further down.
+    mask = identities < len(coords)
+    keep = mask.any(axis=1)
+    assert mask[keep].all()
+    identities = identities[keep]
+
+    # Tags is a list of (nd, name, ielems) tuples that define topological groups
+    # per dimension. Since meshio associates group names with cells, which are
+    # concatenated in nodes, element ids are offset and concatenated to match.
+    tags = [(nd, name, numpy.concatenate([selection
+                                          + sum(len(cells.data) for cells in msh.cells[:icell] if cells.type == msh.cells[icell].type)  # offset into nodes
+                                          for icell, selection in enumerate(msh.cell_sets[name]) if len(selection)]))
+            for name, (itag, nd) in msh.field_data.items()]
+
+    return coords, nodes, identities, tags
+
+
 @log.withcontext
 def gmsh(fname, name='gmsh', *, space='X'):
     """Gmsh parser
 
     Parser for Gmsh files in `.msh` format. Only files with physical groups are
     supported. See the `Gmsh manual
-    <http://geuz.org/gmsh/doc/texinfo/gmsh.html>`_ for details.
+    <http://geuz.org/gmsh/doc/texinfo/gmsh.html>`_ for details. If caching is
+    enabled, the processed arrays are stored in the cache directory keyed by the
+    file contents, such that subsequent runs skip both parsing and processing.
 
     Parameters
     ----------
@@ -470,12 +675,21 @@ def gmsh(fname, name='gmsh', *, space='X'):
     """
 
     with util.binaryfile(fname) as f:
-        return simplex(name=name, **parsegmsh(f), space=space)
+        arrays = _cached_arrays(_gmsh_arrays, f, key=lambda: types.nutils_hash(f))
+    return _simplex_topology(arrays, space)
+
+
+def _gmsh_arrays(mshdata):
+    return _simplex_arrays(**parsegmsh(mshdata))
 
 
 def simplex(nodes, cnodes, coords, tags, btags, ptags, name='simplex', *, space='X'):
     '''Simplex topology.
 
+    If caching is enabled, the connectivity and the element and edge indices of
+    all groups are stored in the cache directory keyed by the arguments, such
+    that subsequent calls only construct the topologies.
+
     Parameters
     ----------
     nodes : :class:`numpy.ndarray`
@@ -509,7 +723,20 @@ def simplex(nodes, cnodes, coords, tags, btags, ptags, name='simplex', *, space=
         Geometry function.
     '''
 
-    nverts = len(coords)
+    arrays = _cached_arrays(_simplex_arrays, nodes, cnodes, coords, tags, btags, ptags)
+    return _simplex_topology(arrays, space)
+
+
+def _simplex_arrays(nodes, cnodes, coords, tags, btags, ptags):
+    # Process the arguments of `simplex` into a dictionary of arrays, from which
+    # `_simplex_topology` constructs the topology and its groups. Groups are
+    # keyed by (kind, vname, name) where vname is None for groups of the full
+    # topology; edge groups are stored as (nedges x 4) arrays of element, edge,
+    # opposite element and opposite edge, the latter two -1 for boundaries.
+
+    nodes = numpy.asarray(nodes)
+    cnodes = numpy.asarray(cnodes)
+    coords = numpy.asarray(coords)
     nelems, ncnodes = cnodes.shape
     ndims = nodes.shape[1] - 1
     degree = 1 if ncnodes == ndims+1 else int((ncnodes * math.factorial(ndims))**(1/ndims))-1
@@ -519,88 +746,292 @@ def simplex(nodes, cnodes, coords, tags, btags, ptags, name='simplex', *, space=
     assert ncnodes == comb(ndims + degree, degree), 'number of coordinate nodes does not correspond to uniformly refined simplex'
 
     transforms = transformseq.IndexTransforms(ndims=ndims, length=nelems)
-    topo = topology.SimplexTopology(space, nodes, transforms, transforms)
+    connectivity = topology.SimplexTopology('X', nodes, transforms, transforms).connectivity
+
+    def edgegroups(elems_edges, keep):
+        # Split the (element, edge) pairs in boundary and interface groups of the
+        # elements selected by `keep`, with edges that are shared by a selected
+        # and an unselected element oriented towards the former.
+        ielem, iedge = numpy.asarray(elems_edges, dtype=int).reshape(-1, 2).T
+        ioppelem = connectivity[ielem, iedge]
+        hasopp = ioppelem != -1
+        ioppedge = numpy.where(hasopp, numpy.equal(connectivity[ioppelem], ielem[:, _]).argmax(axis=1), -1)
+        keepelem = keep[ielem]
+        keepopp = hasopp & keep[ioppelem]
+        flip = keepopp & ~keepelem
+        ielem, ioppelem = numpy.where(flip, ioppelem, ielem), numpy.where(flip, ielem, ioppelem)
+        iedge, ioppedge = numpy.where(flip, ioppedge, iedge), numpy.where(flip, iedge, ioppedge)
+        table = numpy.stack([ielem, iedge, ioppelem, ioppedge], axis=1)
+        return table[keepelem ^ keepopp], table[keepelem & keepopp]
+
+    if ptags:
+        # positions in the flattened nodes array, sorted by node number
+        pindices = numpy.argsort(nodes.ravel(), kind='stable')
+        pnodes = nodes.ravel()[pindices]
+
+    def pointgroup(inodes, keep):
+        inodes = numpy.asarray(inodes, dtype=int)
+        starts = numpy.searchsorted(pnodes, inodes, side='left')
+        counts = numpy.searchsorted(pnodes, inodes, side='right') - starts
+        ielems, ivertices = divmod(pindices[numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())], ndims+1)
+        return numpy.stack([ielems, ivertices], axis=1)[keep[ielems]]
+
+    def groups(vname, keep):
+        for bname, elems_edges in btags.items():
+            btable, itable = edgegroups(elems_edges, keep)
+            if len(btable):
+                yield ('bgroup', vname, bname), btable
+            if len(itable):
+                yield ('igroup', vname, bname), itable
+        for pname, inodes in ptags.items():
+            yield ('pgroup', vname, pname), pointgroup(inodes, keep)
+
+    arrays = dict(nodes=nodes, cnodes=cnodes, coords=coords, connectivity=connectivity)
+    arrays.update(groups(None, numpy.ones(nelems, dtype=bool)))
+    for vname, ielems in tags.items():
+        ielems = numpy.asarray(ielems, dtype=int)
+        arrays['vgroup', None, vname] = ielems
+        if len(ielems) != nelems or not numpy.equal(ielems, numpy.arange(nelems)).all():
+            keep = numpy.zeros(nelems, dtype=bool)
+            keep[ielems] = True
+            arrays.update(groups(vname, keep))
+    return arrays
+
+
+def _simplex_topology(arrays, space):
+    # Construct the topology and geometry from the arrays of `_simplex_arrays`.
+
+    nodes = arrays['nodes']
+    cnodes = arrays['cnodes']
+    coords = arrays['coords']
+    nverts = len(coords)
+    nelems, ncnodes = cnodes.shape
+    ndims = nodes.shape[1] - 1
+    degree = 1 if ncnodes == ndims+1 else int((ncnodes * math.factorial(ndims))**(1/ndims))-1
+
+    transforms = transformseq.IndexTransforms(ndims=ndims, length=nelems)
+    topo = topology.SimplexTopology(space, nodes, transforms, transforms, connectivity=arrays['connectivity'])
     coeffs = element.getsimplex(ndims).get_poly_coeffs('lagrange', degree=degree)
     basis = function.PlainBasis([coeffs] * nelems, cnodes, nverts, topo.f_index, topo.f_coords)
     geom = (basis[:, _] * coords).sum(0)
 
-    connectivity = topo.connectivity
-
-    bgroups = {}
-    igroups = {}
-    for name, elems_edges in btags.items():
-        bitems = [], [], None
-        iitems = [], [], []
-        for ielem, iedge in elems_edges:
-            ioppelem = connectivity[ielem, iedge]
-            simplices, transforms, opposites = bitems if ioppelem == -1 else iitems
-            simplices.append(tuple(nodes[ielem][:iedge])+tuple(nodes[ielem][iedge+1:]))
-            transforms.append(topo.transforms[ielem] + (transform.SimplexEdge(ndims, iedge),))
-            if opposites is not None:
-                opposites.append(topo.transforms[ioppelem] + (transform.SimplexEdge(ndims, tuple(connectivity[ioppelem]).index(ielem)),))
-        for groups, (simplices, transforms, opposites) in (bgroups, bitems), (igroups, iitems):
-            if simplices:
-                transforms = transformseq.PlainTransforms(tuple(transforms), ndims, ndims-1)
-                opposites = transforms if opposites is None else transformseq.PlainTransforms(tuple(opposites), ndims, ndims-1)
-                groups[name] = topology.SimplexTopology(space, numpy.asarray(simplices), transforms, opposites)
-
-    pgroups = {}
-    if ptags:
-        ptrans = [transform.Point(types.arraydata(offset)) for offset in numpy.eye(ndims+1)[:, 1:]]
-        pmap = {inode: numpy.array(numpy.equal(nodes, inode).nonzero()).T for inode in set.union(*map(set, ptags.values()))}
-        for pname, inodes in ptags.items():
-            ptransforms = transformseq.PlainTransforms(tuple((*topo.transforms[ielem], ptrans[ivertex]) for inode in inodes for ielem, ivertex in pmap[inode]), ndims, 0)
-            preferences = References.uniform(element.getsimplex(0), len(ptransforms))
-            pgroups[pname] = topology.TransformChainsTopology(space, preferences, ptransforms, ptransforms)
+    etrans = tuple(element.getsimplex(ndims).edge_transforms)
+    ptrans = tuple(transform.Point(types.arraydata(offset)) for offset in numpy.eye(ndims+1)[:, 1:])
+
+    def edgegroup(table):
+        e, i, oe, oi = numpy.asarray(table).T
+        simplices = nodes[e][numpy.not_equal(numpy.arange(ndims+1), i[:, _])].reshape(len(e), ndims)
+        transforms = transformseq.ArrayTransforms(topo.transforms, types.arraydata(numpy.stack([e, i], axis=1)), (etrans,))
+        opposites = transformseq.ArrayTransforms(topo.transforms, types.arraydata(numpy.stack([oe, oi], axis=1)), (etrans,)) if numpy.greater_equal(oe, 0).all() else transforms
+        return topology.SimplexTopology(space, simplices, transforms, opposites)
+
+    def pointgroup(table):
+        ptransforms = transformseq.ArrayTransforms(topo.transforms, types.arraydata(numpy.asarray(table)), (ptrans,)) if len(table) else transformseq.EmptyTransforms(ndims, 0)
+        preferences = References.uniform(element.getsimplex(0), len(ptransforms))
+        return topology.TransformChainsTopology(space, preferences, ptransforms, ptransforms)
+
+    tables = {}
+    for key, table in arrays.items():
+        if isinstance(key, tuple):
+            kind, vname, name = key
+            tables.setdefault((kind, vname), {})[name] = table
+    bgroups = {name: edgegroup(table) for name, table in tables.get(('bgroup', None), {}).items()}
+    igroups = {name: edgegroup(table) for name, table in tables.get(('igroup', None), {}).items()}
+    pgroups = {name: pointgroup(table) for name, table in tables.get(('pgroup', None), {}).items()}
 
     vgroups = {}
-    for name, ielems in tags.items():
+    for name, ielems in tables.get(('vgroup', None), {}).items():
         if len(ielems) == nelems and numpy.equal(ielems, numpy.arange(nelems)).all():
             vgroups[name] = topo.withgroups(bgroups=bgroups, igroups=igroups, pgroups=pgroups)
             continue
         transforms = topo.transforms[ielems]
         vtopo = topology.SimplexTopology(space, nodes[ielems], transforms, transforms)
-        keep = numpy.zeros(nelems, dtype=bool)
-        keep[ielems] = True
-        vbgroups = {}
-        vigroups = {}
-        for bname, elems_edges in btags.items():
-            bitems = [], [], []
-            iitems = [], [], []
-            for ielem, iedge in elems_edges:
-                ioppelem = connectivity[ielem, iedge]
-                if ioppelem == -1:
-                    keepopp = False
-                else:
-                    keepopp = keep[ioppelem]
-                    ioppedge = tuple(connectivity[ioppelem]).index(ielem)
-                if keepopp and keep[ielem]:
-                    simplices, transforms, opposites = iitems
-                elif keepopp or keep[ielem]:
-                    simplices, transforms, opposites = bitems
-                    if keepopp:
-                        ielem, iedge, ioppelem, ioppedge = ioppelem, ioppedge, ielem, iedge
-                else:
-                    continue
-                simplices.append(tuple(nodes[ielem][:iedge])+tuple(nodes[ielem][iedge+1:]))
-                transforms.append(topo.transforms[ielem] + (transform.SimplexEdge(ndims, iedge),))
-                if ioppelem != -1:
-                    opposites.append(topo.transforms[ioppelem] + (transform.SimplexEdge(ndims, ioppedge),))
-            for groups, (simplices, transforms, opposites) in (vbgroups, bitems), (vigroups, iitems):
-                if simplices:
-                    transforms = transformseq.PlainTransforms(tuple(transforms), ndims, ndims-1)
-                    opposites = transformseq.PlainTransforms(tuple(opposites), ndims, ndims-1) if len(opposites) == len(transforms) else transforms
-                    groups[bname] = topology.SimplexTopology(space, numpy.asarray(simplices), transforms, opposites)
-        vpgroups = {}
-        for pname, inodes in ptags.items():
-            ptransforms = transformseq.PlainTransforms(tuple((*topo.transforms[ielem], ptrans[ivertex]) for inode in inodes for ielem, ivertex in pmap[inode] if keep[ielem]), ndims, 0)
-            preferences = References.uniform(element.getsimplex(0), len(ptransforms))
-            vpgroups[pname] = topology.TransformChainsTopology(space, preferences, ptransforms, ptransforms)
-        vgroups[name] = vtopo.withgroups(bgroups=vbgroups, igroups=vigroups, pgroups=vpgroups)
+        vgroups[name] = vtopo.withgroups(
+            bgroups={bname: edgegroup(table) for bname, table in tables.get(('bgroup', name), {}).items()},
+            igroups={bname: edgegroup(table) for bname, table in tables.get(('igroup', name), {}).items()},
+            pgroups={pname: pointgroup(table) for pname, table in tables.get(('pgroup', name), {}).items()})
 
     return topo.withgroups(vgroups=vgroups, bgroups=bgroups, igroups=igroups, pgroups=pgroups), geom
 
 
+def _cached_arrays(func, *args, key=None):
+    # Call `func` to obtain a dictionary of arrays and store these in the cache
+    # directory as one .npy file per array, with a json index of the dictionary
+    # keys, such that subsequent calls load the arrays by memory mapping. The
+    # cache entry is keyed by the name of `func`, the nutils version and
+    # source, and `key`, which defaults to the hash of the arguments. The
+    # directory is written atomically, rather than locked, such that concurrent
+    # processes at worst process the same data twice.
+
+    cachedir = cache.caching.current
+    if cachedir is None:
+        return func(*args)
+    h = hashlib.sha1('nutils.mesh.{}:{}\0'.format(func.__name__, version).encode())
+    h.update(util.source_hash())
+    try:
+        if key is not None:
+            h.update(key())
+        else:
+            _hash_arrays(h, args)
+    except (TypeError, ValueError):
+        return func(*args)
+    path = cachedir / 'mesh' / h.hexdigest()
+    try:
+        keys = json.loads((path / 'index.json').read_text())
+        arrays = {tuple(key) if isinstance(key, list) else key: numpy.load(path / '{}.npy'.format(i), mmap_mode='r') for i, key in enumerate(keys)}
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.debug('[mesh {}] failed to load: {}'.format(path.name, e))
+    else:
+        log.debug('[mesh {}] load'.format(path.name))
+        return arrays
+    with cache.disable():
+        arrays = func(*args)
+    tmppath = path.with_name('{}.{}.tmp'.format(path.name, os.getpid()))
+    try:
+        tmppath.mkdir(parents=True, exist_ok=True)
+        for i, array in enumerate(arrays.values()):
+            numpy.save(tmppath / '{}.npy'.format(i), numpy.asarray(array), allow_pickle=False)
+        (tmppath / 'index.json').write_text(json.dumps(list(arrays)))
+    except OSError as e:
+        log.debug('[mesh {}] failed to store: {}'.format(path.name, e))
+        shutil.rmtree(tmppath, ignore_errors=True)
+        return arrays
+    try:
+        os.replace(tmppath, path)
+    except OSError:  # stored concurrently by another process
+        shutil.rmtree(tmppath, ignore_errors=True)
+    else:
+        log.debug('[mesh {}] store'.format(path.name))
+    return arrays
+
+
+def _hash_arrays(h, obj):
+    # Update hash `h` with nested dictionaries, sequences and arrays.
+
+    if isinstance(obj, dict):
+        h.update(b'd%d\0' % len(obj))
+        for key, value in obj.items():
+            h.update(b'%s\0' % str(key).encode())
+            _hash_arrays(h, value)
+    elif isinstance(obj, (list, tuple)) and not all(isinstance(item, (int, numpy.integer)) for item in obj):
+        h.update(b't%d\0' % len(obj))
+        for item in obj:
+            _hash_arrays(h, item)
+    else:
+        array = numpy.ascontiguousarray(obj)
+        h.update('a{}{}\0'.format(array.dtype.str, array.shape).encode())
+        h.update(array.view(numpy.uint8).ravel() if array.size else b'')
+
+
+def refinesimplex(nodes, cnodes, coords, tags, btags, ptags):
+    '''Uniformly refined simplex mesh.
+
+    Refines the arguments of :func:`simplex` by splitting every simplex into
+    ``2**ndims`` children, following the child transforms of the reference
+    element, and numbering the edge midpoints as new nodes. Unlike
+    :attr:`nutils.topology.Topology.refined`, the resulting topology is flat:
+    its elements are not derived from the coarse elements, such that evaluation
+    costs the same as for a topology that is imported directly. Only linear
+    geometries are supported.
+
+    Parameters
+    ----------
+    nodes : :class:`numpy.ndarray`
+        Vertex indices as (nelems x ndims+1) integer array.
+    cnodes : :class:`numpy.ndarray`
+        Coordinate indices as (nelems x ndims+1) integer array.
+    coords : :class:`numpy.ndarray`
+        Coordinates as (nverts x ndims) float array.
+    tags : :class:`dict`
+        Dictionary of name->element numbers.
+    btags : :class:`dict`
+        Dictionary of name->edges, where edges is a (nedges x 2) integer array
+        containing pairs of element number and edge number.
+    ptags : :class:`dict`
+        Dictionary of name->node numbers referencing the ``nodes`` table.
+
+    Returns
+    -------
+    :class:`dict`:
+        Keyword arguments for :func:`simplex` of the refined mesh.
+    parents : :class:`numpy.ndarray`
+        Coarse element number per refined element. The children of every coarse
+        element are numbered consecutively, in the order of the child
+        transforms of the reference element.
+    interpolation : :class:`numpy.ndarray`
+        Pairs of coarse coordinate indices as (nverts x 2) integer array, such
+        that every refined coordinate is the average of the corresponding pair.
+        This defines the prolongation of linear fields from the coarse to the
+        refined mesh.
+    '''
+
+    nodes = numpy.asarray(nodes)
+    cnodes = numpy.asarray(cnodes)
+    coords = numpy.asarray(coords)
+    nelems, nverts = nodes.shape
+    ndims = nverts - 1
+    if cnodes.shape != nodes.shape:
+        raise NotImplementedError('refinement of higher order geometries is not supported')
+
+    # The refinement pattern: every child vertex is the midpoint of a pair of
+    # parent vertices, or a parent vertex itself, in which case the pair
+    # consists of twice the same vertex.
+    ref = element.getsimplex(ndims)
+    pairs = []
+    for ctrans in ref.child_transforms:
+        points = ctrans.apply(ref.vertices)
+        bary = numpy.concatenate([1 - points.sum(axis=1, keepdims=True), points], axis=1)
+        pairs.append([numpy.greater(b, .25).nonzero()[0][[0, -1]] for b in bary])
+    pairs = numpy.array(pairs)  # nchildren x nverts x 2
+    nchildren = len(pairs)
+    ismid = numpy.not_equal(pairs[..., 0], pairs[..., 1])
+
+    def refinetable(table, offset):
+        # Return the refined table, with midpoints numbered from `offset` on, and
+        # the pairs of coarse indices that span the midpoints.
+        ends = numpy.sort(table[:, pairs], axis=-1)  # nelems x nchildren x nverts x 2
+        keys = ends[..., 0] * (table.max()+1) + ends[..., 1]
+        mids, index, inverse = numpy.unique(keys[:, ismid], return_index=True, return_inverse=True)
+        refined = ends[..., 0].copy()
+        refined[:, ismid] = offset + inverse.reshape(nelems, -1)
+        return refined.reshape(nelems * nchildren, nverts), ends[:, ismid].reshape(-1, 2)[index]
+
+    rnodes = refinetable(nodes, nodes.max()+1 if nelems else 0)[0]
+    rcnodes, mids = refinetable(cnodes, len(coords))
+    interpolation = numpy.concatenate([numpy.arange(len(coords)).repeat(2).reshape(-1, 2), mids])
+    rcoords = coords[interpolation].mean(axis=1)
+
+    # Sort the vertices of the refined simplices, permuting the coordinate
+    # indices alongside.
+    perm = numpy.argsort(rnodes, axis=1)
+    rnodes = numpy.take_along_axis(rnodes, perm, axis=1)
+    rcnodes = numpy.take_along_axis(rcnodes, perm, axis=1)
+    iperm = numpy.argsort(perm, axis=1)
+
+    # The faces of the children that lie on parent edge i, as (child, vertex)
+    # pairs where the vertex is the one opposite the face.
+    onedge = numpy.not_equal(pairs[:, :, :, _], numpy.arange(nverts)).all(axis=2)  # nchildren x nverts x nedges
+    faces = numpy.array([[(ichild, ivert) for ichild in range(nchildren) for ivert in range(nverts) if onedge[ichild, numpy.arange(nverts) != ivert, iedge].all()] for iedge in range(nverts)])
+
+    def refineedges(elems_edges):
+        ielem, iedge = numpy.asarray(elems_edges, dtype=int).reshape(-1, 2).T
+        ichild, ivert = faces[iedge].transpose(2, 0, 1)
+        rielem = ielem[:, _] * nchildren + ichild
+        return numpy.stack([rielem, iperm[rielem, ivert]], axis=-1).reshape(-1, 2)
+
+    parents = numpy.arange(nelems).repeat(nchildren)
+    refined = dict(
+        nodes=rnodes,
+        cnodes=rcnodes,
+        coords=rcoords,
+        tags={name: (numpy.asarray(ielems, dtype=int)[:, _] * nchildren + numpy.arange(nchildren)).ravel() for name, ielems in tags.items()},
+        btags={name: refineedges(elems_edges) for name, elems_edges in btags.items()},
+        ptags=dict(ptags))
+    return refined, parents, interpolation
+
+
 def fromfunc(func, nelems, ndims, degree=1):
     'piecewise'
 
@@ -569,6 +569,160 @@ def invmap(indices, length, missing=-1):
     return invmap
 
 
+def csr_rows(indptr, indices, rows):
+    '''Concatenate rows of a compressed sparse row table.
+
+    Return the concatenation of ``indices[indptr[row]:indptr[row+1]]`` for all
+    ``row`` in ``rows``, without looping over the rows.
+
+    >>> csr_rows(indptr=[0, 2, 3, 5], indices=[4, 1, 0, 2, 3], rows=[2, 0])
+    array([2, 3, 4, 1])
+
+    Args
+    ----
+    indptr : :class:`int` array_like
+        Row pointers of the table.
+    indices : array_like
+        Entries of the table.
+    rows : :class:`int` array_like
+        The rows to concatenate.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+    '''
+
+    indptr = numpy.asarray(indptr, dtype=int)
+    rows = numpy.asarray(rows, dtype=int)
+    starts = indptr[rows]
+    counts = indptr[rows+1] - starts
+    offsets = numpy.cumsum(counts) - counts
+    return numpy.asarray(indices)[numpy.repeat(starts - offsets, counts) + numpy.arange(counts.sum())]
+
+
+def _cuthill_mckee_levels(indptr, indices, start, visited):
+    # Generate the breadth-first levels of the graph starting from node
+    # `start`, with the nodes of every level sorted first by the position of
+    # their parent in the previous level and then by degree, in keeping with
+    # the Cuthill-McKee ordering. The `visited` mask is updated in place.
+    degree = indptr[1:] - indptr[:-1]
+    visited[start] = True
+    level = numpy.array([start])
+    while len(level):
+        yield level
+        counts = degree[level]
+        offsets = numpy.cumsum(counts)
+        neighbours = indices[numpy.arange(offsets[-1]) + numpy.repeat(indptr[level] - offsets + counts, counts)]
+        parents = numpy.repeat(numpy.arange(len(level)), counts)
+        keep = ~visited[neighbours]
+        neighbours = neighbours[keep]
+        parents = parents[keep]
+        neighbours = neighbours[numpy.lexsort([degree[neighbours], parents])]
+        _, first = numpy.unique(neighbours, return_index=True)
+        level = neighbours[numpy.sort(first)]
+        visited[level] = True
+
+
+def reverse_cuthill_mckee(indptr, indices):
+    '''Bandwidth reducing permutation of a symmetric sparse graph.
+
+    Compute the reverse Cuthill-McKee ordering of the nodes of a graph given in
+    compressed sparse row format, processing every connected component from a
+    pseudo-peripheral starting node. The returned permutation ``perm`` lists
+    the old node numbers in their new order, i.e. ``perm[new] == old``.
+
+    >>> reverse_cuthill_mckee(indptr=[0, 2, 4, 6, 8], indices=[2, 3, 2, 3, 0, 1, 0, 1])
+    array([1, 3, 2, 0])
+
+    Args
+    ----
+    indptr : :class:`int` array_like
+        Row pointers of the adjacency matrix, of length ``nnodes+1``.
+    indices : :class:`int` array_like
+        Column indices of the adjacency matrix. The adjacency must be symmetric.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+    '''
+
+    indptr = numpy.asarray(indptr, dtype=int)
+    indices = numpy.asarray(indices, dtype=int)
+    return _cuthill_mckee(indptr, indices, numpy.zeros(len(indptr)-1, dtype=bool))[::-1]
+
+
+def _cuthill_mckee(indptr, indices, visited):
+    # Return the Cuthill-McKee ordering of all nodes that are not marked in
+    # the `visited` mask, processing every connected component from a
+    # pseudo-peripheral starting node. The `visited` mask is updated in place.
+    degree = indptr[1:] - indptr[:-1]
+    order = []
+    while not visited.all():
+        unvisited, = (~visited).nonzero()
+        start = unvisited[numpy.argmin(degree[unvisited])]
+        # find a pseudo-peripheral starting node by repeatedly restarting from
+        # the node of minimum degree in the last level
+        levels = list(_cuthill_mckee_levels(indptr, indices, start, visited.copy()))
+        while True:
+            candidate = levels[-1][numpy.argmin(degree[levels[-1]])]
+            candidate_levels = list(_cuthill_mckee_levels(indptr, indices, candidate, visited.copy()))
+            if len(candidate_levels) <= len(levels):
+                break
+            start, levels = candidate, candidate_levels
+        order.extend(_cuthill_mckee_levels(indptr, indices, start, visited))
+    return numpy.concatenate(order) if order else numpy.zeros(0, dtype=int)
+
+
+def partition_graph(indptr, indices, nparts):
+    '''Partition the nodes of a symmetric sparse graph.
+
+    Divide the nodes of a graph given in compressed sparse row format over
+    ``nparts`` parts of (nearly) equal size, such that few edges connect
+    different parts. The graph is bisected recursively, splitting the
+    Cuthill-McKee ordering of every subgraph at the size ratio of the parts on
+    either side. Since the ordering traverses the breadth-first levels of a
+    pseudo-peripheral node, the split approximately follows a level set, which
+    keeps the parts compact. The returned array lists the part of every node.
+
+    >>> partition_graph(indptr=[0, 1, 3, 5, 7, 8], indices=[1, 0, 2, 1, 3, 2, 4, 3], nparts=2)
+    array([0, 0, 1, 1, 1])
+
+    Args
+    ----
+    indptr : :class:`int` array_like
+        Row pointers of the adjacency matrix, of length ``nnodes+1``.
+    indices : :class:`int` array_like
+        Column indices of the adjacency matrix. The adjacency must be symmetric.
+    nparts : :class:`int`
+        The number of parts.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+    '''
+
+    indptr = numpy.asarray(indptr, dtype=int)
+    indices = numpy.asarray(indices, dtype=int)
+    if nparts < 1:
+        raise ValueError('nparts requires a positive integer argument')
+    nnodes = len(indptr) - 1
+    parts = numpy.zeros(nnodes, dtype=int)
+    stack = [(numpy.arange(nnodes), 0, nparts)]
+    while stack:
+        nodes, offset, n = stack.pop()
+        if n == 1 or len(nodes) == 0:
+            parts[nodes] = offset
+            continue
+        visited = numpy.ones(nnodes, dtype=bool)
+        visited[nodes] = False
+        order = _cuthill_mckee(indptr, indices, visited)
+        nleft = n // 2
+        split = (len(nodes) * nleft) // n
+        stack.append((order[:split], offset, nleft))
+        stack.append((order[split:], offset + nleft, n - nleft))
+    return parts
+
+
 def levicivita(n: int, dtype=float):
     'n-dimensional Levi-Civita symbol.'
     if n < 2:
@@ -109,40 +109,78 @@ def shzeros(shape, dtype=float):
 
 
 class range:
-    '''a shared range-like iterable that yields every index exactly once'''
+    '''a shared range-like iterable that yields every index exactly once
 
-    def __init__(self, stop):
+    The range is divided in ``nblocks`` contiguous blocks of (nearly) equal
+    size, of which every process claims the indices of its own block, as set by
+    :meth:`claim`, in increasing order. A process that exhausts its block takes
+    over the upper half of the largest remaining block. This way every process
+    handles few contiguous stretches of the range, while the load remains
+    balanced.'''
+
+    def __init__(self, stop, nblocks=1):
         self._stop = stop
-        self._index = multiprocessing.RawValue('i', 0)
+        bounds = [stop * i // nblocks for i in builtins.range(nblocks+1)]
+        self._starts = multiprocessing.RawArray('q', bounds[:-1])
+        self._stops = multiprocessing.RawArray('q', bounds[1:])
+        self._iblock = 0
+        self._nclaimed = multiprocessing.RawValue('q', 0)
         self._lock = multiprocessing.Lock()  # lock to avoid race conditions in incrementing index
 
+    def claim(self, iblock):
+        '''continue iterating from block ``iblock``'''
+
+        self._iblock = iblock % len(self._starts)
+
     def __iter__(self):
         return self
 
     def __next__(self):
         with self._lock:
-            iiter = self._index.value  # claim next value
-            if iiter >= self._stop:
-                raise StopIteration
-            self._index.value = iiter + 1
+            iblock = self._iblock
+            if self._starts[iblock] >= self._stops[iblock]:  # block exhausted, split the largest remaining block
+                remaining = [stop - start for start, stop in zip(self._starts, self._stops)]
+                ivictim = max(builtins.range(len(remaining)), key=remaining.__getitem__)
+                if remaining[ivictim] <= 0:
+                    raise StopIteration
+                mid = self._stops[ivictim] - (remaining[ivictim] + 1) // 2
+                self._starts[iblock] = mid
+                self._stops[iblock] = self._stops[ivictim]
+                self._stops[ivictim] = mid
+            iiter = self._starts[iblock]  # claim next value
+            self._starts[iblock] = iiter + 1
+            self._nclaimed.value += 1
         return iiter
 
+    @property
+    def nclaimed(self):
+        '''the number of indices claimed by all processes'''
+
+        return self._nclaimed.value
+
 
 @contextlib.contextmanager
 def ctxrange(name, nitems):
-    '''fork and yield shared range-like counter with percentage-style logging'''
+    '''fork and yield shared range-like counter with percentage-style logging
+
+    The range is divided in contiguous blocks, one for every process, such
+    that loops over elements in a locality preserving order, such as the order
+    formed by :meth:`nutils.topology.Topology.partition`, hand whole partitions
+    to processes.'''
 
-    rng = range(nitems)  # shared range, must be created pre-fork
-    with fork(nitems), treelog.iter.wrap(_pct(name, nitems), rng) as wrprng:
+    nprocs = max(1, min(nitems, maxprocs.current))
+    rng = range(nitems, nprocs)  # shared range, must be created pre-fork
+    with fork(nprocs) as procid, treelog.iter.wrap(_pct(name, rng), rng) as wrprng:
+        rng.claim(procid)
         yield wrprng
 
 
-def _pct(name, n):
+def _pct(name, rng):
     '''helper function for ctxrange'''
 
-    i = yield name + ' 0%'
+    yield name + ' 0%'
     while True:
-        i = yield name + ' {:.0f}%'.format(100*(i+1)/n)
+        yield name + ' {:.0f}%'.format(100*rng.nclaimed/rng._stop)
 
 
 def _wait(pid):
@@ -843,7 +843,7 @@ def _parse_lhs_cons(constrain, targets, argobjs, arguments):
 def _derivative(residual, target, jacobian=None):
     argobjs = _argobjs(residual)
     if jacobian is None:
-        jacobian = tuple(evaluable.derivative(res, argobjs[t]).simplified for res in residual for t in target)
+        jacobian = tuple(block.simplified for block in evaluable.derivative_blocks(residual, [argobjs[t] for t in target]))
     elif len(jacobian) != len(residual) * len(target):
         raise ValueError('jacobian has incorrect length')
     elif not all(evaluable.equalshape(jacobian[i*len(target)+j].shape, res.shape + argobjs[t].shape) for i, res in enumerate(residual) for j, t in enumerate(target)):
@@ -150,6 +150,37 @@ class Transforms(types.Singleton):
 
         raise NotImplementedError
 
+    def indices_with_tails(self, transs):
+        '''Return the indices of ``trans[:n]`` and the tails ``trans[n:]`` in bulk.
+
+        Equivalent to calling :meth:`index_with_tail` for every transform in
+        ``transs``. Subclasses may implement this more efficiently.
+
+        Parameters
+        ----------
+        transs : sequence of :class:`tuple`\\s of :class:`nutils.transform.TransformItem` objects
+            The transforms to find up to possibly empty tails.
+
+        Returns
+        -------
+        indices : :class:`numpy.ndarray`
+            The indices of ``transs`` without tails in this sequence.
+        tails : :class:`tuple` of :class:`tuple`\\s of :class:`nutils.transform.TransformItem` objects
+            The tails of ``transs``.
+
+        Raises
+        ------
+        :class:`ValueError`
+            if any of ``transs`` is not found.
+        '''
+
+        indices = numpy.empty(len(transs), dtype=int)
+        tails = []
+        for i, trans in enumerate(transs):
+            indices[i], tail = self.index_with_tail(trans)
+            tails.append(tail)
+        return indices, tuple(tails)
+
     def __iter__(self):
         '''Implement ``iter(self)``.'''
 
@@ -306,6 +337,57 @@ class Transforms(types.Singleton):
 
         yield self
 
+    def affine(self, target=None):
+        '''Return the composed affine maps of this sequence relative to ``target``.
+
+        Every transform in this sequence, with the head that is contained in
+        ``target`` removed, forms a chain of affine transform items that
+        composes into a single map :math:`x ↦ A x + b`. The returned
+        :class:`AffineMaps` object stores these maps, along with the index of
+        the head in ``target``, and computes them on first access, in bulk when
+        indexed with a slice or an array, in terms of the maps of the parent
+        transforms where possible. The object is cached on this sequence per
+        ``target`` such that repeated evaluation of a transform reduces to a
+        lookup.
+
+        Parameters
+        ----------
+        target : :class:`Transforms`, optional
+            The target sequence. If ``None`` the maps are formed relative to the
+            root coordinate system.
+
+        Returns
+        -------
+        :class:`AffineMaps`
+        '''
+
+        try:
+            return self._affine_maps[target]
+        except KeyError:
+            maps = self._affine_maps[target] = AffineMaps(self, target)
+            return maps
+
+    @cached_property
+    def _affine_maps(self):
+        return {}
+
+    def _affine_items(self, target, indices):
+        # Return the indices in `target`, linear parts and offsets of the maps
+        # of the transforms `indices` by composing their tails. Subclasses
+        # override this to derive the maps in bulk from the cached maps of the
+        # parent transforms.
+        todims = self.todims if target is None else target.fromdims
+        itarget = numpy.zeros(len(indices), dtype=int)
+        linear = numpy.empty((len(indices), todims, self.fromdims))
+        offset = numpy.empty((len(indices), todims))
+        for i, index in enumerate(indices.tolist()):
+            if target is None:
+                tail = self[index]
+            else:
+                itarget[i], tail = target.index_with_tail(self[index])
+            linear[i], offset[i] = _compose(tail, self.fromdims)
+        return itarget, linear, offset
+
 
 class EmptyTransforms(Transforms):
     '''An empty sequence.'''
@@ -424,6 +506,11 @@ class IndexTransforms(Transforms):
             return root.index - self._offset, trans[1:]
         raise ValueError
 
+    def _affine_items(self, target, indices):
+        if target is not None:
+            return super()._affine_items(target, indices)
+        return numpy.zeros(len(indices), dtype=int), numpy.broadcast_to(numpy.eye(self.fromdims), (len(indices), self.fromdims, self.fromdims)), numpy.zeros((len(indices), self.fromdims))
+
 
 class Axis(types.Singleton):
     '''Base class for axes of :class:`~nutils.topology.StructuredTopology`.'''
@@ -572,6 +659,32 @@ class StructuredTransforms(Transforms):
     def __len__(self):
         return util.product(map(len, self._axes))
 
+    @cached_property
+    def _ctransforms_affine(self):
+        return _stack_items(self._ctransforms.ravel())
+
+    def _affine_items(self, target, indices):
+        if target is not None or not self._axes:
+            return super()._affine_items(target, indices)
+        n = len(indices)
+        # Decompose indices into indices per dimension on the nrefined level
+        # and into child indices per refinement, as in `__getitem__`.
+        axisindices = numpy.empty((len(self._axes), n), dtype=int)
+        for idim, axis in reversed(tuple(enumerate(self._axes))):
+            indices, rem = divmod(indices, len(axis))
+            axisindices[idim] = (axis.i + rem) % axis.mod if axis.mod else axis.i + rem
+        ichildren = []
+        for i in range(self._nrefine):
+            axisindices, r = divmod(axisindices, 2)
+            ichildren.insert(0, numpy.ravel_multi_index(tuple(r), self._ctransforms.shape))
+        # The index transforms are identities.
+        maps = numpy.zeros(n, dtype=int), numpy.broadcast_to(self._root.linear, (n, *self._root.linear.shape)), numpy.broadcast_to(self._root.offset, (n, self._root.todims))
+        clinear, coffset = self._ctransforms_affine
+        for ichild in ichildren:
+            maps = _compose_items(maps, clinear[ichild], coffset[ichild])
+        elinear, eoffset = _compose(self._etransforms, self.fromdims)
+        return _compose_items(maps, elinear, numpy.broadcast_to(eoffset, (n, len(eoffset))))
+
     def index_with_tail(self, trans):
         if len(trans) < 1 + len(self._axes) + self._nrefine + len(self._etransforms):
             raise ValueError
@@ -643,6 +756,9 @@ class MaskedTransforms(Transforms):
         else:
             return int(index), tail
 
+    def _affine_items(self, target, indices):
+        return self._parent.affine(target)[self._indices[indices]]
+
 
 class ReorderedTransforms(Transforms):
     '''A reordered :class:`Transforms` object.
@@ -682,6 +798,9 @@ class ReorderedTransforms(Transforms):
         parent_index, tail = self._parent.index_with_tail(trans)
         return int(self._rindices[parent_index]), tail
 
+    def _affine_items(self, target, indices):
+        return self._parent.affine(target)[self._indices[indices]]
+
 
 class DerivedTransforms(Transforms):
     '''A sequence of derived transforms.
@@ -750,6 +869,15 @@ class DerivedTransforms(Transforms):
         iderived = self._derived_transforms(self._parent_references[iparent]).index(tail[0])
         return self._offsets[iparent]+iderived, tail[1:]
 
+    def _affine_items(self, target, indices):
+        iparents = numpy.searchsorted(self._offsets, indices, side='right')-1
+        try:
+            maps = self._parent.affine(target)[iparents]
+        except ValueError:  # target is finer than parent
+            return super()._affine_items(target, indices)
+        items = [self._derived_transforms(self._parent_references[iparent])[index - self._offsets[iparent]] for iparent, index in zip(iparents.tolist(), indices.tolist())]
+        return _compose_items(maps, *_stack_items(items))
+
 
 class UniformDerivedTransforms(Transforms):
     '''A sequence of refined transforms from a uniform sequence of references.
@@ -808,6 +936,165 @@ class UniformDerivedTransforms(Transforms):
         iderived = self._derived_transforms.index(tail[0])
         return iparent*len(self._derived_transforms) + iderived, tail[1:]
 
+    @cached_property
+    def _derived_affine(self):
+        return _stack_items(self._derived_transforms)
+
+    def _affine_items(self, target, indices):
+        iparents, iderived = divmod(indices, len(self._derived_transforms))
+        try:
+            maps = self._parent.affine(target)[iparents]
+        except ValueError:  # target is finer than parent
+            return super()._affine_items(target, indices)
+        linear, offset = self._derived_affine
+        return _compose_items(maps, linear[iderived], offset[iderived])
+
+
+class ArrayTransforms(Transforms):
+    '''A sequence of derived transforms stored as an integer array.
+
+    Every transform in this sequence is a transform of ``root`` followed by one
+    transform item per level, selected by the rows of ``indices``::
+
+        (root[index[0]] + tuple(items[i] for items, i in zip(levels, index[1:])) for index in indices)
+
+    Compared to :class:`PlainTransforms`, this avoids storing a tuple of
+    transform items per transform, and supports vectorized indexing, lookup,
+    refinement and edges.
+
+    Parameters
+    ----------
+    root : :class:`Transforms`
+        The transforms to derive from.
+    indices : two-dimensional array of :class:`int`\\s
+        The index of the ``root`` transform followed by the indices of the
+        transform items of all levels, one row per transform.
+    levels : :class:`tuple` of :class:`tuple`\\s of :class:`nutils.transform.TransformItem` objects
+        The transform items to select from per level, typically the child or
+        edge transforms of a reference.
+    '''
+
+    def __init__(self, root: Transforms, indices: types.arraydata, levels: Tuple[Tuple[transform.TransformItem, ...], ...]):
+        assert isinstance(root, Transforms), f'root={root!r}'
+        assert isinstance(indices, types.arraydata) and indices.dtype == int and indices.ndim == 2 and indices.shape[1] == len(levels) + 1, f'indices={indices!r}'
+        assert isinstance(levels, tuple) and all(isinstance(items, tuple) and items and all(isinstance(item, transform.TransformItem) for item in items) for items in levels), f'levels={levels!r}'
+        fromdims = root.fromdims
+        for items in levels:
+            if set(item.todims for item in items) != {fromdims} or len(set(item.fromdims for item in items)) != 1:
+                raise ValueError('invalid dimensions of transform items')
+            fromdims = items[0].fromdims
+        self._root = root
+        self._indices = numpy.asarray(indices)
+        self._levels = levels
+        self._shape = len(root), *map(len, levels)
+        if numpy.less(self._indices, 0).any() or numpy.greater_equal(self._indices, self._shape).any():
+            raise ValueError('index out of range')
+        super().__init__(root.todims, fromdims)
+
+    @cached_property
+    def _lookups(self):
+        return tuple({item: i for i, item in enumerate(items)} for items in self._levels)
+
+    @cached_property
+    def _sorted(self):
+        keys = numpy.ravel_multi_index(self._indices.T, self._shape) if len(self._indices) else numpy.zeros(0, dtype=int)
+        order = numpy.argsort(keys, kind='stable')
+        return types.frozenarray(keys[order], copy=False), types.frozenarray(order, copy=False)
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, index):
+        if numeric.isint(index):
+            iroot, *ilevels = self._indices[numeric.normdim(len(self), index.__index__())].tolist()
+            return self._root[iroot] + tuple(items[i] for items, i in zip(self._levels, ilevels))
+        if numeric.isintarray(index):
+            if index.ndim != 1:
+                raise IndexError('invalid index')
+            if numpy.any(numpy.less(index, 0)) or numpy.any(numpy.greater_equal(index, len(self))):
+                raise IndexError('index out of range')
+            if len(numpy.unique(index)) != len(index):
+                raise ValueError('repeating an element is not allowed')
+        elif numeric.isboolarray(index):
+            if index.shape != (len(self),):
+                raise IndexError('mask has invalid shape')
+        elif not isinstance(index, slice):
+            raise IndexError('invalid index')
+        indices = self._indices[index]
+        if len(indices) == 0:
+            return EmptyTransforms(self.todims, self.fromdims)
+        if len(indices) == len(self) and numpy.equal(indices, self._indices).all():
+            return self
+        return ArrayTransforms(self._root, types.arraydata(indices), self._levels)
+
+    def index_with_tail(self, trans):
+        key, tail = self._root.index_with_tail(trans)
+        fromdims = self._root.fromdims
+        for items, lookup in zip(self._levels, self._lookups):
+            # Bring the tail in the form of the transforms of this level, as in
+            # :class:`UniformDerivedTransforms`.
+            tail = (transform.uppermost if items[0].fromdims == fromdims else transform.canonical)(tail)
+            if not tail or tail[0] not in lookup:
+                raise ValueError('{!r} not in sequence of transforms'.format(trans))
+            key = key * len(items) + lookup[tail[0]]
+            tail = tail[1:]
+            fromdims = items[0].fromdims
+        sortedkeys, order = self._sorted
+        i = sortedkeys.searchsorted(key)
+        if i == len(sortedkeys) or sortedkeys[i] != key:
+            raise ValueError('{!r} not in sequence of transforms'.format(trans))
+        return int(order[i]), tail
+
+    def indices_with_tails(self, transs):
+        keys, tails = self._root.indices_with_tails(transs)
+        fromdims = self._root.fromdims
+        for items, lookup in zip(self._levels, self._lookups):
+            canonicalize = transform.uppermost if items[0].fromdims == fromdims else transform.canonical
+            tails = tuple(map(canonicalize, tails))
+            try:
+                ilevel = numpy.fromiter((lookup[tail[0]] for tail in tails), dtype=int, count=len(tails))
+            except (KeyError, IndexError):
+                raise ValueError('transform not in sequence of transforms')
+            keys = keys * len(items) + ilevel
+            tails = tuple(tail[1:] for tail in tails)
+            fromdims = items[0].fromdims
+        sortedkeys, order = self._sorted
+        i = numpy.searchsorted(sortedkeys, keys)
+        if numpy.greater_equal(i, len(sortedkeys)).any() or numpy.not_equal(sortedkeys[numpy.minimum(i, len(sortedkeys)-1)], keys).any():
+            raise ValueError('transform not in sequence of transforms')
+        return order[i], tails
+
+    @cached_property
+    def _levels_affine(self):
+        return tuple(map(_stack_items, self._levels))
+
+    def _affine_items(self, target, indices):
+        iroots, *ilevels = self._indices[indices].T
+        try:
+            maps = self._root.affine(target)[iroots]
+        except ValueError:  # target is finer than root
+            return super()._affine_items(target, indices)
+        for (linear, offset), i in zip(self._levels_affine, ilevels):
+            maps = _compose_items(maps, linear[i], offset[i])
+        return maps
+
+    def refined(self, references):
+        if not len(self) or not references.isuniform or references.ndims != self.fromdims:
+            return super().refined(references)
+        return self._derived(references[0].child_transforms)
+
+    def edges(self, references):
+        if not len(self) or not references.isuniform or references.ndims != self.fromdims:
+            return super().edges(references)
+        return self._derived(references[0].edge_transforms)
+
+    def _derived(self, items):
+        # Append a level of `items` to every transform, ordered first by
+        # transform, then by item.
+        n = len(items)
+        indices = numpy.concatenate([numpy.repeat(self._indices, n, axis=0), numpy.tile(numpy.arange(n), len(self))[:, numpy.newaxis]], axis=1)
+        return ArrayTransforms(self._root, types.arraydata(indices), self._levels + (tuple(items),))
+
 
 class ChainedTransforms(Transforms):
     '''A sequence of chained :class:`Transforms` objects.
@@ -875,6 +1162,17 @@ class ChainedTransforms(Transforms):
             offset += len(item)
         raise ValueError
 
+    def _affine_items(self, target, indices):
+        outer = numpy.searchsorted(self._offsets, indices, side='right') - 1
+        todims = self.todims if target is None else target.fromdims
+        itarget = numpy.empty(len(indices), dtype=int)
+        linear = numpy.empty((len(indices), todims, self.fromdims))
+        offset = numpy.empty((len(indices), todims))
+        for i in numpy.unique(outer).tolist():
+            select = outer == i
+            itarget[select], linear[select], offset[select] = self._items[i].affine(target)[indices[select] - self._offsets[i]]
+        return itarget, linear, offset
+
     def refined(self, references):
         return chain((item.refined(references[start:stop]) for item, start, stop in zip(self._items, self._offsets[:-1], self._offsets[1:])), self.todims, self.fromdims)
 
@@ -885,6 +1183,87 @@ class ChainedTransforms(Transforms):
         yield from self._items
 
 
+class AffineMaps:
+    '''Composed affine maps of a sequence of transforms.
+
+    Lazily evaluated affine maps of ``source`` relative to ``target``, as
+    returned by :meth:`Transforms.affine`. Indexing with an integer returns the
+    index in ``target``, the linear part and the offset of the map of the
+    corresponding transform; slicing or indexing with an integer array returns
+    stacked arrays of the same. The maps are stored in preallocated arrays and
+    computed on first access, in bulk for all transforms of a slice or array.
+
+    Parameters
+    ----------
+    source : :class:`Transforms`
+        The sequence of transforms to compose.
+    target : :class:`Transforms`, optional
+        The target sequence, or ``None`` for the root coordinate system.
+    '''
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        todims = source.todims if target is None else target.fromdims
+        self._index = numpy.empty(len(source), dtype=int)
+        self._linear = numpy.empty((len(source), todims, source.fromdims))
+        self._offset = numpy.empty((len(source), todims))
+        self._computed = numpy.zeros(len(source), dtype=bool)
+
+    def __len__(self):
+        return len(self.source)
+
+    def __getitem__(self, index):
+        if numeric.isint(index):
+            index = numeric.normdim(len(self), index.__index__())
+            if not self._computed[index]:
+                self._compute(numpy.array([index]))
+        else:
+            indices = numpy.arange(len(self))[index]
+            self._compute(numpy.unique(indices[~self._computed[indices]]))
+        return _readonly(self._index[index]), _readonly(self._linear[index]), _readonly(self._offset[index])
+
+    def _compute(self, indices):
+        if not len(indices):
+            return
+        if self.target == self.source:
+            self._index[indices] = indices
+            self._linear[indices] = numpy.eye(self.source.fromdims)
+            self._offset[indices] = 0
+        else:
+            self._index[indices], self._linear[indices], self._offset[indices] = self.source._affine_items(self.target, indices)
+        self._computed[indices] = True
+
+
+def _compose(items, fromdims):
+    # Compose a chain of transform items into a single affine map.
+    linear = numpy.eye(fromdims)
+    offset = numpy.zeros(fromdims)
+    for item in reversed(items):
+        linear = item.linear @ linear
+        offset = item.linear @ offset + item.offset
+    return linear, offset
+
+
+def _stack_items(items):
+    # Stack the linear parts and offsets of a nonempty sequence of transform
+    # items.
+    return numpy.array([item.linear for item in items], dtype=float), numpy.array([item.offset for item in items], dtype=float)
+
+
+def _compose_items(maps, linear, offset):
+    # Compose stacked affine maps, as returned by `AffineMaps`, with stacked
+    # linear parts and offsets of transform items.
+    index, maplinear, mapoffset = maps
+    return index, maplinear @ linear, numpy.einsum('nij,nj->ni', maplinear, offset) + mapoffset
+
+
+def _readonly(array):
+    array = numpy.asarray(array)
+    array.flags.writeable = False
+    return array
+
+
 def chain(items, todims, fromdims):
     '''Return the chained transforms sequence of ``items``.
 
@@ -3,6 +3,8 @@ from nutils.testing import TestCase, parametrize
 import random
 import itertools
 import numpy
+import nutils_poly as poly
+from unittest import mock
 
 
 class basisTest(TestCase):
@@ -45,6 +47,12 @@ class basis(basisTest):
         self.basis = self.domain.basis(self.btype, degree=self.degree)
         self.gauss = 'gauss{}'.format(2*self.degree)
 
+    def test_coefficient_classes(self):
+        classes = self.basis.coefficient_classes
+        self.assertEqual(classes.shape, (self.basis.nelems,))
+        for ielem in range(self.basis.nelems):
+            self.assertAllAlmostEqual(self.basis.unique_coefficients[classes[ielem]], self.basis.get_coefficients(ielem))
+
     @parametrize.enable_if(lambda btype, degree, boundary, **params: btype != 'discont' and degree != 0 and not boundary)
     def test_continuity(self):
         topos = dict(interfaces=self.domain.interfaces)
@@ -171,6 +179,19 @@ class structured(basisTest):
         self.assertPartitionOfUnity(topo=self.domain, basis=basis)
         self.assertPolynomial(topo=self.domain, geom=self.geom, basis=basis, degree=2)
 
+    def test_coefficients(self):
+        # the basis is evaluated per dimension; verify against the tensor
+        # product coefficients
+        basis = self.domain.basis('spline', degree=(1, 2), knotmultiplicities=[None, [3, 2, 1, 3]])
+        smpl = self.domain.sample('gauss', 3)
+        values = smpl.eval(basis)
+        for ielem in range(len(self.domain)):
+            with self.subTest(ielem=ielem):
+                points = smpl.points[ielem].coords
+                expected = numpy.zeros((len(points), len(basis)))
+                expected[:, basis.get_dofs(ielem)] = poly.eval_outer(basis.get_coefficients(ielem), points)
+                self.assertAllAlmostEqual(values[smpl.getindex(ielem)], expected)
+
     def test_continuity(self):
         # test refinement of knotmultiplicities[0] -> [3,1,3]
         basis = self.domain.basis('spline', degree=2, continuity=0)
@@ -264,6 +285,54 @@ class structured_rect1d_periodic_knotmultiplicities(basisTest):
         self.assertAllAlmostEqual(psampled, rsampled)
 
 
+class renumbered(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.domain, self.geom = mesh.unitsquare(4, 'triangle')
+        self.basis = self.domain.basis('std', degree=2)
+        # scramble the dofs to obtain a wide band
+        self.scrambled = function.PermutedBasis(self.basis, numpy.random.RandomState(0).permutation(len(self.basis)))
+        self.renumbered = self.scrambled.renumbered()
+
+    def bandwidth(self, basis):
+        return max(numpy.ptp(basis.get_dofs(ielem)) for ielem in range(len(self.domain)))
+
+    def test_values(self):
+        smpl = self.domain.sample('gauss', 4)
+        values, renumbered = smpl.eval([self.basis, self.renumbered])
+        self.assertAllEqual(values[:, self.scrambled.permutation[self.renumbered.permutation]], renumbered)
+
+    def test_bandwidth(self):
+        self.assertLess(self.bandwidth(self.renumbered), self.bandwidth(self.scrambled) / 2)
+
+    def test_support(self):
+        for dof in range(len(self.renumbered)):
+            for ielem in self.renumbered.get_support(dof):
+                self.assertIn(dof, self.renumbered.get_dofs(ielem))
+
+    def test_solve(self):
+        target = (self.geom**2).sum(-1)
+        for basis in self.basis, self.renumbered:
+            with self.subTest(basis.__class__.__name__):
+                projection = self.domain.projection(target, onto=basis, geometry=self.geom, degree=4)
+                error2 = self.domain.integral((target-projection)**2 * function.J(self.geom), degree=4).eval()
+                self.assertAlmostEqual(error2, 0, places=20)
+
+    def test_dof_pairs(self):
+        desired = sorted({(i, j) for ielem in range(len(self.domain)) for i in self.basis.get_dofs(ielem) for j in self.basis.get_dofs(ielem)})
+        for chunksize in 1, 50, 2**20:
+            with self.subTest(chunksize=chunksize), mock.patch.object(function, '_dof_pairs_chunksize', chunksize):
+                rows, cols = function._dof_pairs(*self.basis._elem_dofs, len(self.basis))
+                self.assertEqual(list(zip(rows.tolist(), cols.tolist())), desired)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            function.PermutedBasis(self.basis, numpy.zeros(len(self.basis), dtype=int))
+        with self.assertRaises(ValueError):
+            self.basis.renumbered('foo')
+
+
 @parametrize
 class unstructured_topology(TestCase):
 
@@ -1,4 +1,4 @@
-from nutils import evaluable, sparse, numeric, _util as util, types, sample
+from nutils import evaluable, sparse, numeric, _util as util, types, sample, cache, parallel
 from nutils.testing import TestCase, parametrize
 import nutils_poly as poly
 import numpy
@@ -9,9 +9,17 @@ import warnings as _builtin_warnings
 import collections
 import sys
 import unittest
+from unittest import mock
 import functools
 import operator
 import logging
+import json
+import pathlib
+import pickle
+import tempfile
+import tracemalloc
+import subprocess
+import os
 
 
 @parametrize
@@ -853,6 +861,16 @@ class derivative(TestCase):
         func = evaluable.IntToFloat(evaluable.BoolToInt(evaluable.Greater(arg, evaluable.zeros(()))))
         self.assertTrue(evaluable.iszero(evaluable.derivative(func, arg)))
 
+    def test_blocks(self):
+        a = evaluable.Argument('a', (evaluable.constant(2),), float)
+        b = evaluable.Argument('b', (), float)
+        shared = evaluable.Sin(a * b)
+        funcs = evaluable.Sum(shared * a), evaluable.Exp(shared) * b, evaluable.Sum(a)
+        blocks = evaluable.derivative_blocks(funcs, (a, b))
+        self.assertEqual(len(blocks), 6)
+        for block, (func, var) in zip(blocks, itertools.product(funcs, (a, b))):
+            self.assertEqual(block, evaluable.derivative(func, var))
+
 
 class asciitree(TestCase):
 
@@ -1061,6 +1079,252 @@ class combine_loop_concatenates(TestCase):
         self.assertEqual(actual, desired)
 
 
+class fuse_pointwise(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a = evaluable.Argument('a', (evaluable.constant(3),))
+        self.b = evaluable.Argument('b', (evaluable.constant(3),))
+        self.args = dict(a=numpy.array([1., 2., 3.]), b=numpy.array([.5, .1, .2]))
+
+    def test_chain(self):
+        f = evaluable.Exp(self.a * self.b + evaluable.Sin(self.a)) * self.b
+        fused = evaluable._fuse_pointwise(f)
+        self.assertIsInstance(fused, evaluable._FusedPointwise)
+        self.assertEqual(set(fused._fused_args), {self.a, self.b})
+        self.assertEqual(fused.ntemporaries, 3)
+        a, b = self.args['a'], self.args['b']
+        self.assertAllAlmostEqual(fused.eval(**self.args), numpy.exp(a * b + numpy.sin(a)) * b)
+
+    def test_shared(self):
+        g = evaluable.Exp(self.a * self.b)
+        f = evaluable.Tuple((evaluable.Sin(g) + self.a, evaluable.Cos(g)))
+        fused = evaluable._fuse_pointwise(f)
+        first, second = fused
+        self.assertIsInstance(first, evaluable._FusedPointwise)
+        self.assertIsInstance(second, evaluable.Cos)
+        self.assertIsInstance(second.args[0], evaluable._FusedPointwise)
+        self.assertIn(second.args[0], first._fused_args)
+        a, b = self.args['a'], self.args['b']
+        actual = fused.eval(**self.args)
+        self.assertAllAlmostEqual(actual[0], numpy.sin(numpy.exp(a * b)) + a)
+        self.assertAllAlmostEqual(actual[1], numpy.cos(numpy.exp(a * b)))
+
+    def test_ufunc(self):
+        self.assertIs(evaluable.Sin._ufunc, numpy.sin)
+        self.assertIs(evaluable.Add._ufunc, numpy.add)
+        self.assertIsNone(evaluable.Real._ufunc)
+
+
+class eval_sparse(TestCase):
+
+    def test_parallel_blocks(self):
+        index = evaluable.loop_index('i', 6)
+        dofs = evaluable.Take(evaluable.constant(numpy.array([3, 1, 4, 1, 5, 0])), index)
+        func = evaluable.loop_sum(evaluable.Inflate(evaluable.IntToFloat(index), dofs, evaluable.constant(6)), index)
+        serial, = evaluable.eval_sparse((func,))
+        with parallel.maxprocs(3), mock.patch.object(evaluable, '_min_sort_block', 2):
+            data, = evaluable.eval_sparse((func,))
+        self.assertEqual(sorted(data.tolist()), sorted(serial.tolist()))
+        # every block holds the entries of two consecutive loop iterations
+        for iblock, block in enumerate([data[0:2], data[2:4], data[4:6]]):
+            self.assertEqual(sorted(block['value'].tolist()), [2. * iblock, 2. * iblock + 1])
+            self.assertEqual(block['index']['i0'].tolist(), sorted(block['index']['i0']))
+        self.assertEqual(sparse.dedup(data).tolist(), sparse.dedup(serial).tolist())
+
+    def test_parallel_small(self):
+        index = evaluable.loop_index('i', 6)
+        func = evaluable.loop_sum(evaluable.Inflate(evaluable.IntToFloat(index), index, evaluable.constant(6)), index)
+        serial, = evaluable.eval_sparse((func,))
+        with parallel.maxprocs(3), mock.patch.object(parallel, 'ctxrange', wraps=parallel.ctxrange) as ctxrange:
+            data, = evaluable.eval_sparse((func,))
+        self.assertNotIn('sorting', [call.args[0] for call in ctxrange.call_args_list])
+        self.assertEqual(data.tolist(), serial.tolist())
+
+    def test_parallel_chunks(self):
+        index = evaluable.loop_index('i', 4)
+        values = evaluable.IntToFloat(evaluable.Take(evaluable.constant(numpy.array([[0, 1], [2, 3], [4, 5], [6, 7]]).T), index))
+        dofs = evaluable.Take(evaluable.constant(numpy.array([[3, 2], [2, 1], [1, 0], [0, 3]]).T), index)
+        func = evaluable.loop_sum(evaluable.Inflate(values, dofs, evaluable.constant(4)), index)
+        serial, = evaluable.eval_sparse((func,))
+        with parallel.maxprocs(2), mock.patch.object(evaluable, '_min_sort_block', 2):
+            data, = evaluable.eval_sparse((func,))
+        self.assertEqual(sorted(data.tolist()), sorted(serial.tolist()))
+        self.assertEqual(sorted(data[:4]['value'].tolist()), [0., 1., 2., 3.])
+        self.assertEqual(sorted(data[4:]['value'].tolist()), [4., 5., 6., 7.])
+
+
+class Stats(TestCase):
+
+    def test_allocated(self):
+        stats = evaluable._Stats()
+        a = numpy.zeros((10, 10))
+        with stats:
+            stats.allocated((a, a[:5]))
+        with stats:
+            stats.allocated(numpy.zeros(2))
+        self.assertEqual(stats.ncalls, 2)
+        self.assertEqual(stats.nbytes, 816)
+        self.assertEqual(stats.maxbytes, 800)
+
+    def test_eval_withtimes(self):
+        func = evaluable.Sin(evaluable.Argument('a', (evaluable.constant(3),)))
+        stats = collections.defaultdict(evaluable._Stats)
+        func.eval_withtimes(stats, a=numpy.arange(3.))
+        self.assertEqual(stats[func].nbytes, 24)
+        self.assertEqual(stats[func].maxbytes, 24)
+
+    def test_allocated_args(self):
+        stats = evaluable._Stats()
+        a = numpy.zeros((10, 10))
+        with stats:
+            stats.allocated((a.T, numpy.zeros(4).reshape(2, 2)), (a,))
+        self.assertEqual(stats.nbytes, 32)
+
+    @unittest.skipIf(sys.version_info < (3, 9), 'tracemalloc.reset_peak is not available')
+    def test_tracemalloc(self):
+        tracemalloc.start()
+        try:
+            outer = evaluable._Stats()
+            inner = evaluable._Stats()
+            with outer:
+                with inner:
+                    a = numpy.ones(2**16)
+                    del a
+                b = numpy.ones(2**10)
+                del b
+        finally:
+            tracemalloc.stop()
+        self.assertGreaterEqual(inner.peakbytes, 2**19)
+        self.assertGreaterEqual(outer.peakbytes, 2**19)
+
+
+class Trace(TestCase):
+
+    def test_invalid_environment(self):
+        result = subprocess.run([sys.executable, '-c', 'from nutils import evaluable; print(evaluable.trace)'],
+                                env=dict(os.environ, NUTILS_TRACE='abc'), stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        self.assertEqual(result.stdout.strip(), '0')
+        self.assertIn('ignoring environment variable NUTILS_TRACE', result.stderr)
+
+    def test_loopsum(self):
+        index = evaluable.loop_index('i', 100)
+        func = evaluable.loop_sum(evaluable.Sin(evaluable.IntToFloat(index)), index)
+        times = collections.defaultdict(evaluable._Stats)
+        with evaluable._Trace(10) as trace:
+            value = func.eval_withtimes(times)
+        self.assertAlmostEqual(value, numpy.sin(numpy.arange(100)).sum())
+        events = trace.as_dict(times)['traceEvents']
+        iterations = [event['args']['index'] for event in events if event['name'] == 'LoopSum i']
+        self.assertEqual(iterations, list(range(0, 100, 10)))
+        self.assertEqual(sum(event['name'] == 'Sin' for event in events), 10)
+        self.assertTrue(all(event['ph'] == 'X' and event['dur'] >= 0 for event in events))
+        self.assertEqual(json.loads(json.dumps(trace.as_dict(times))), trace.as_dict(times))
+
+    def test_loopconcatenate_parallel(self):
+        index = evaluable.loop_index('i', 100)
+        sin = evaluable.Sin(evaluable.IntToFloat(index))
+        func, = evaluable.loop_concatenate_combined([evaluable.InsertAxis(sin, evaluable.constant(1))], index)
+        times = collections.defaultdict(evaluable._Stats)
+        with parallel.maxprocs(2), evaluable._Trace(10) as trace:
+            value = func.eval_withtimes(times)
+        self.assertAllAlmostEqual(value, numpy.sin(numpy.arange(100)))
+        events = trace.as_dict(times)['traceEvents']
+        iterations = [event['args']['index'] for event in events if event['name'] == 'LoopConcatenate i']
+        self.assertEqual(sorted(iterations), list(range(0, 100, 10)))
+        self.assertEqual(sum(event['name'] == 'Sin' for event in events), 10)
+        self.assertEqual(len({event['pid'] for event in events}), 2)
+        self.assertEqual(sum(event['name'] == 'process_name' for event in events), 2)
+        loop, = [value for value in times.values() if isinstance(value, dict)]
+        self.assertEqual(loop[sin].ncalls, 100)
+
+
+class rewrite_stats(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stats = evaluable.RewriteStats()
+        self.func = evaluable.Transpose(evaluable.Transpose(evaluable.Argument('a', (evaluable.constant(2), evaluable.constant(3))), (1, 0)), (1, 0))
+
+    def test_rule(self):
+        simplified = self.stats._record_rule('Transpose', '_simplified', self.func._simplified)
+        self.assertEqual(simplified, evaluable.Argument('a', (evaluable.constant(2), evaluable.constant(3))))
+        self.stats._record_rule('Argument', '_simplified', simplified._simplified)
+        self.assertEqual(self.stats.as_dict()['rules'][0]['ncalls'], 1)
+        self.assertEqual({(rule['type'], rule['nrewrites']) for rule in self.stats.as_dict()['rules']}, {('Transpose', 1), ('Argument', 0)})
+
+    def test_pass(self):
+        simplified = self.stats._record_pass('simplified', lambda value: self.stats._record_pass('simplified', evaluable.simplified, value), self.func)
+        self.assertEqual(simplified, self.func.simplified)
+        passes, = self.stats.as_dict()['passes']
+        self.assertEqual(passes['ncalls'], 1)
+        self.assertEqual(passes['nodes_before'], len(self.func.dependencies) + 1)
+        self.assertEqual(passes['nodes_after'], len(simplified.dependencies) + 1)
+
+    def test_export(self):
+        self.stats._record_pass('simplified', evaluable.simplified, self.func)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = pathlib.Path(tmpdir) / 'stats.json'
+            self.stats.write_json(path)
+            self.assertEqual(json.loads(path.read_text()), self.stats.as_dict())
+        with self.assertLogs('nutils', logging.INFO) as cm:
+            self.stats.log()
+        self.assertIn('simplified', cm.output[0])
+
+
+class optimized_for_numpy_cache(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cachedir = pathlib.Path(self.enter_context(tempfile.TemporaryDirectory()))
+        self.enter_context(cache.enable(cachedir))
+        self.evaluable_cache = cachedir / 'evaluable'
+        self.func = evaluable.Exp(evaluable.Argument('a', (evaluable.constant(3),)) * evaluable.constant(2.))
+
+    def optimize(self):
+        # bypass the in-memory caching of the property
+        return type(self.func)._optimized_for_numpy_persistent.func(self.func)
+
+    def test_store(self):
+        optimized = self.optimize()
+        self.assertEqual(optimized, self.func._optimized_for_numpy_uncached())
+        self.assertEqual(len(list(self.evaluable_cache.iterdir())), 1)
+
+    def test_load(self):
+        self.optimize()
+        cachefile, = self.evaluable_cache.iterdir()
+        stored = evaluable.constant(numpy.array([1., 2., 3.]))
+        cachefile.write_bytes(pickle.dumps(stored))
+        self.assertEqual(self.optimize(), stored)
+
+    def test_corrupt(self):
+        self.optimize()
+        cachefile, = self.evaluable_cache.iterdir()
+        cachefile.write_bytes(b'corrupt')
+        self.assertEqual(self.optimize(), self.func._optimized_for_numpy_uncached())
+        self.assertNotEqual(cachefile.read_bytes(), b'corrupt')
+
+    def test_unwritable(self):
+        self.evaluable_cache.write_bytes(b'')  # a file blocks creation of the directory
+        with self.assertLogs('nutils', logging.DEBUG) as cm:
+            self.assertEqual(self.optimize(), self.func._optimized_for_numpy_uncached())
+        self.assertTrue(any('failed to store' in line for line in cm.output))
+
+    def test_source(self):
+        self.optimize()
+        with mock.patch.object(util, 'source_hash', return_value=b'modified'):
+            self.optimize()
+        self.assertEqual(len(list(self.evaluable_cache.iterdir())), 2)
+
+    def test_eval_sparse(self):
+        evaluable.eval_sparse((self.func,), a=numpy.array([1., 2., 3.]))
+        self.assertEqual(len(list(self.evaluable_cache.iterdir())), 1)
+
+    def test_internal(self):
+        self.func.optimized_for_numpy
+        self.assertFalse(self.evaluable_cache.exists())
+
+
 class EvaluableConstant(TestCase):
 
     def test_evalf(self):
@@ -1112,6 +1376,25 @@ class Einsum(TestCase):
         ret = evaluable.einsum('ij,jk,kl->il', evaluable.constant(arg1), evaluable.constant(arg2), evaluable.constant(arg3))
         self.assertAllEqual(ret.eval(), arg1 @ arg2 @ arg3)
 
+    def test_contraction_path(self):
+        args = [numpy.linspace(0, 1, 64*64).reshape(64, 64)**i for i in range(1, 4)]
+        ret = evaluable.Einsum(tuple(map(evaluable.Argument, 'abc', [tuple(map(evaluable.constant, arg.shape)) for arg in args])), ((0, 1), (1, 2), (2, 3)), (0, 3))
+        self.assertAllAlmostEqual(ret.eval(a=args[0], b=args[1], c=args[2]), args[0] @ args[1] @ args[2])
+        self.assertIsNotNone(ret._contraction_path)
+        small = evaluable.Einsum(tuple(evaluable.constant(numpy.ones(shape)) for shape in [(2, 3), (3, 3), (3, 2)]), ((0, 1), (1, 2), (2, 3)), (0, 3))
+        self.assertIsNone(small._contraction_path)
+
+    def test_absorb_outer_product(self):
+        a = numpy.linspace(0, 1, 32*32).reshape(32, 32)
+        b = a**2
+        w = numpy.linspace(1, 2, 32*32).reshape(32, 32)
+        outer = evaluable.Einsum((evaluable.constant(a), evaluable.constant(b)), ((2, 0), (3, 1)), (0, 1, 2, 3))
+        ret = evaluable.Einsum((outer, evaluable.constant(w)), ((0, 1, 2, 3), (2, 3)), (0, 1))
+        optimized = ret.optimized_for_numpy
+        self.assertIsInstance(optimized, evaluable.Einsum)
+        self.assertEqual(len(optimized.args), 3)
+        self.assertAllAlmostEqual(optimized.eval(), numpy.einsum('pi,qj,pq->ij', a, b, w))
+
     def test_wrong_args(self):
         arg = numpy.arange(6).reshape(2, 3)
         with self.assertRaisesRegex(ValueError, 'number of arguments does not match format string'):
@@ -1303,3 +1586,37 @@ class Poly(TestCase):
             evaluable.PolyGrad(eval_coeffs, 2).eval(ncoeffs=numpy.array(6)),
             poly.grad(const_coeffs, 2),
         )
+
+    def test_polyval_tabulated(self):
+        coeffs = numpy.arange(3*4*3, dtype=float).reshape(3, 4, 3) / 10
+        points = numpy.array([[0.], [.5], [1.]])
+        index = evaluable.Argument('index', (), int)
+        f = evaluable.Polyval(evaluable.PolyGrad(evaluable.get(evaluable.constant(coeffs), 0, index), 1), evaluable.constant(points))
+        optimized = f.optimized_for_numpy
+        self.assertFalse(any(isinstance(dep, evaluable.Polyval) for dep in optimized.dependencies))
+        for i in range(-3, 3):
+            with self.subTest(index=i):
+                numpy.testing.assert_allclose(optimized.eval(index=numpy.array(i)), poly.eval_outer(poly.grad(coeffs[i], 1), points))
+
+    def test_polyval_not_tabulated(self):
+        coeffs = numpy.arange(3*4*3, dtype=float).reshape(3, 4, 3) / 10
+        index = evaluable.Argument('index', (), int)
+        points = evaluable.Argument('points', (evaluable.constant(2), evaluable.constant(1)))
+        f = evaluable.Polyval(evaluable.get(evaluable.constant(coeffs), 0, index), points)
+        self.assertTrue(any(isinstance(dep, evaluable.Polyval) for dep in (f.optimized_for_numpy, *f.optimized_for_numpy.dependencies)))
+
+    def test_polyval_factorized(self):
+        vars = poly.MulVar.Right, poly.MulVar.Left, poly.MulVar.Right
+        coeffs_left = numpy.arange(2*3, dtype=float).reshape(2, 3) / 5
+        coeffs_right = numpy.arange(2*6, dtype=float).reshape(2, 6)[::-1] / 7
+        points = numpy.linspace(0, 1, 4*3).reshape(4, 3)
+        coeffs = evaluable.PolyMul(evaluable.Argument('left', (evaluable.constant(2), evaluable.constant(3))), evaluable.Argument('right', (evaluable.constant(2), evaluable.constant(6))), vars)
+        for nderivs in range(2):
+            with self.subTest(nderivs=nderivs):
+                f = evaluable.Polyval(evaluable.PolyGrad(coeffs, 3) if nderivs else coeffs, evaluable.Argument('points', (evaluable.constant(4), evaluable.constant(3))))
+                optimized = f.optimized_for_numpy
+                self.assertFalse(any(isinstance(dep, evaluable.PolyMul) for dep in optimized.dependencies))
+                desired = poly.mul(coeffs_left, coeffs_right, vars)
+                if nderivs:
+                    desired = poly.grad(desired, 3)
+                numpy.testing.assert_allclose(optimized.eval(left=coeffs_left, right=coeffs_right, points=points), poly.eval_outer(desired, points))
@@ -1083,6 +1083,14 @@ class CommonBasis:
         for ielem in range(self.checknelems):
             self.assertEqual(self.basis.get_ndofs(ielem), len(self.checkdofs[ielem]))
 
+    def test_elem_dofs(self):
+        self.assertEqual(self.basis.elem_dofs_indptr.tolist(), numpy.cumsum([0, *map(len, self.checkdofs)]).tolist())
+        self.assertEqual(self.basis.elem_dofs_indices.tolist(), list(itertools.chain.from_iterable(self.checkdofs)))
+
+    def test_dof_elems(self):
+        self.assertEqual(self.basis.dof_elems_indptr.tolist(), numpy.cumsum([0, *map(len, self.checksupp)]).tolist())
+        self.assertEqual(self.basis.dof_elems_indices.tolist(), list(itertools.chain.from_iterable(self.checksupp)))
+
     def test_dofs_array(self):
         for mask in itertools.product(*[[False, True]]*self.checknelems):
             mask = numpy.array(mask, dtype=bool)
@@ -1265,6 +1273,19 @@ class PrunedBasis(CommonBasis, TestCase):
         super().setUp()
 
 
+class PermutedBasis(CommonBasis, TestCase):
+
+    def setUp(self):
+        self.checktransforms = transformseq.IndexTransforms(0, 4)
+        index, coords = self.mk_index_coords(0, self.checktransforms)
+        parent = function.PlainBasis([[[1.]], [[2.], [3.]], [[4.], [5.]], [[6.]]], [[0], [2, 3], [1, 3], [2]], 4, index, coords)
+        self.basis = function.PermutedBasis(parent, [2, 0, 3, 1])
+        self.checkcoeffs = [[[1.]], [[2.], [3.]], [[4.], [5.]], [[6.]]]
+        self.checkdofs = [[1], [0, 2], [3, 2], [0]]
+        self.checkndofs = 4
+        super().setUp()
+
+
 class StructuredBasis1D(CommonBasis, TestCase):
 
     def setUp(self):
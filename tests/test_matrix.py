@@ -1,5 +1,8 @@
 import numpy
 import pickle
+import tempfile
+import os
+from unittest import mock
 from nutils import matrix, sparse, testing, warnings
 
 
@@ -150,6 +153,17 @@ class backend(testing.TestCase):
                 lhs = self.matrix.solve(rhs, lhs0=lhs0)
                 res = numpy.linalg.norm(self.matrix @ lhs - rhs, axis=0)
                 self.assertLess(numpy.max(res), 1e-9)
+        for args in self.solve_args:
+            with self.subTest(args.get('solver', 'arnoldi')):
+                lhs = self.matrix.solve(rhs, **args)
+                res = numpy.linalg.norm(self.matrix @ lhs - rhs, axis=0)
+                self.assertLess(numpy.max(res), args.get('atol', 1e-9))
+
+    def test_multisolve_dependent(self):
+        rhs = numpy.arange(self.matrix.shape[0])[:, numpy.newaxis].repeat(3, axis=1) * [1, 2, -1]
+        lhs = self.matrix.solve(rhs, precon='diag', atol=1e-8)
+        res = numpy.linalg.norm(self.matrix @ lhs - rhs, axis=0)
+        self.assertLess(numpy.max(res), 1e-8)
 
     def test_singular(self):
         singularmatrix = matrix.assemble(numpy.arange(self.n)-self.n//2, numpy.arange(self.n)[numpy.newaxis].repeat(2, 0), shape=(self.n, self.n))
@@ -158,6 +172,24 @@ class backend(testing.TestCase):
             with self.subTest(args.get('solver', 'direct')), self.assertRaises(matrix.MatrixError):
                 lhs = singularmatrix.solve(rhs, **args)
 
+    def test_mixedprecision_fallback(self):
+        # the off-diagonal perturbation is lost in single precision, rendering
+        # the low precision factorization singular
+        eps = 3e-8
+        mat = matrix.assemble(numpy.array([1, 1, 1, 1+eps]), numpy.array([[0, 0, 1, 1], [0, 1, 0, 1]]), shape=(2, 2))
+        rhs = numpy.array([2, 2+eps])
+        lhs = mat.solve(rhs, solver='direct', mixedprecision=True)
+        numpy.testing.assert_allclose(lhs, [1, 1], rtol=1e-6)
+        self.assertIs(mat._cached_lowprecision, False)
+        with mock.patch.object(mat, '_lowprecision', side_effect=AssertionError('low precision factorization repeated')):
+            lhs = mat.solve(rhs, solver='direct', mixedprecision=True)
+        numpy.testing.assert_allclose(lhs, [1, 1], rtol=1e-6)
+
+    def test_mixedprecision_complex_rhs(self):
+        rhs = numpy.arange(self.matrix.shape[0]) * (1 - 2j)
+        lhs = self.matrix.solve(rhs, solver='direct', atol=1e-8, mixedprecision=True)
+        self.assertLess(numpy.linalg.norm(self.matrix @ lhs - rhs), 1e-8)
+
     def test_solve_repeated(self):
         rhs = numpy.arange(self.matrix.shape[0])
         for args in self.solve_args:
@@ -206,6 +238,51 @@ class backend(testing.TestCase):
             self.assertIsInstance(mat, NumpyMatrix)
             numpy.testing.assert_equal(mat.export('dense'), self.exact)
 
+    def test_assemblyplan(self):
+        data = sparse.fromarray(self.exact)
+        data = numpy.concatenate([data, data[::-1]])  # unsorted, with duplicates
+        index = sparse.indices(data)
+        plan = matrix.AssemblyPlan(index, self.matrix.shape)
+        self.assertEqual(plan.nnz, self.n**2)
+        for scale in 1, 2:
+            with self.subTest(scale=scale):
+                mat = plan(sparse.values(data) * scale)
+                self.assertIsInstance(mat, type(self.matrix))
+                numpy.testing.assert_equal(mat.export('dense'), self.exact * 2 * scale)
+
+    def test_assemblyplan_sorted(self):
+        data, index = self.matrix.export('coo')
+        plan = matrix.AssemblyPlan(index, self.matrix.shape)
+        self.assertEqual(plan.nnz, len(data))
+        numpy.testing.assert_equal(plan(data).export('dense'), self.exact)
+        values = data.copy()
+        mat = plan(values)
+        values[:] = 0  # refill in place for the next assembly
+        numpy.testing.assert_equal(mat.export('dense'), self.exact)
+
+    def test_assemblyplan_invalid(self):
+        plan = matrix.AssemblyPlan(([0, 1], [1, 0]), shape=(2, 2))
+        with self.assertRaises(matrix.MatrixError):
+            plan(numpy.ones(3))
+
+    def test_save_load(self):
+        path = self.enter_context(tempfile.TemporaryDirectory())
+        matrix.save(path, self.matrix)
+        for mmap in True, False:
+            with self.subTest(mmap=mmap):
+                mat = matrix.load(path, mmap=mmap)
+                self.assertIsInstance(mat, type(self.matrix))
+                numpy.testing.assert_equal(mat.export('dense'), self.exact)
+                rhs = numpy.arange(self.n)
+                numpy.testing.assert_allclose(mat.solve(rhs), self.matrix.solve(rhs))
+
+    def test_load_invalid(self):
+        path = self.enter_context(tempfile.TemporaryDirectory())
+        matrix.save(path, self.matrix)
+        numpy.save(os.path.join(path, 'indptr.npy'), numpy.arange(self.n))
+        with self.assertRaises(matrix.MatrixError):
+            matrix.load(path)
+
     def test_diagonal(self):
         self.assertAllEqual(self.matrix.diagonal(), numpy.diag(self.exact))
 
@@ -214,18 +291,21 @@ backend('numpy',
         backend='numpy',
         solve_args=[{},
                     dict(solver='direct', atol=1e-8),
+                    dict(solver='direct', atol=1e-8, mixedprecision=True),
                     dict(atol=1e-5, precon='diag')])
 
 backend('numpy:complex',
         backend='numpy',
         complex=True,
         solve_args=[{},
-                    dict(solver='direct', atol=1e-8)])
+                    dict(solver='direct', atol=1e-8),
+                    dict(solver='direct', atol=1e-8, mixedprecision=True)])
 
 backend('scipy',
         backend='scipy',
         solve_args=[{},
                     dict(solver='direct', atol=1e-8),
+                    dict(solver='direct', atol=1e-8, mixedprecision=True),
                     dict(atol=1e-5, precon='diag', truncate=5),
                     dict(solver='gmres', atol=1e-5, restart=100, precon='spilu0'),
                     dict(solver='gmres', atol=1e-5, precon='splu'),
@@ -236,13 +316,16 @@ backend('scipy:complex',
         backend='scipy',
         complex=True,
         solve_args=[{},
-                    dict(solver='direct', atol=1e-8)])
+                    dict(solver='direct', atol=1e-8),
+                    dict(solver='direct', atol=1e-8, mixedprecision=True)])
 
 backend('mkl',
         backend='mkl',
         solve_args=[{},
                     dict(solver='direct', atol=1e-8),
+                    dict(solver='direct', atol=1e-8, mixedprecision=True),
                     dict(solver='direct', symmetric=True, atol=1e-8),
+                    dict(solver='direct', symmetric=True, atol=1e-8, mixedprecision=True),
                     dict(atol=1e-5, precon='diag', truncate=5),
                     dict(solver='fgmres', atol=1e-8),
                     dict(solver='fgmres', atol=1e-8, precon='diag')])
@@ -252,4 +335,5 @@ backend('mkl:complex',
         complex=True,
         solve_args=[{},
                     dict(solver='direct', atol=1e-8),
+                    dict(solver='direct', atol=1e-8, mixedprecision=True),
                     dict(solver='direct', symmetric=True, atol=1e-8)])
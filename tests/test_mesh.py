@@ -1,7 +1,11 @@
-from nutils import mesh, function, element, transform, topology
+from nutils import mesh, function, element, transform, topology, cache, _util as util
 from nutils.testing import TestCase, parametrize, requires
 import pathlib
+import io
+import logging
+import tempfile
 import numpy
+from unittest import mock
 
 
 @parametrize
@@ -88,6 +92,232 @@ for ndims in 2, 3:
             gmsh(ndims=ndims, version=version, degree=degree)
 
 
+class gmshbinary(TestCase):
+
+    def test_parse(self):
+        path = pathlib.Path(__file__).parent/'test_mesh'
+        with (path/'mesh2d_p2_v4_binary.msh').open('rb') as f:
+            binary = mesh.parsegmsh(f)
+        with (path/'mesh2d_p2_v4.msh').open('rb') as f:
+            ascii = mesh.parsegmsh(f)
+        for name in 'nodes', 'cnodes', 'coords':
+            self.assertAllEqual(binary[name], ascii[name])
+        for name in 'tags', 'ptags':
+            self.assertEqual(binary[name].keys(), ascii[name].keys())
+            for tag in ascii[name]:
+                self.assertAllEqual(binary[name][tag], ascii[name][tag])
+        # the binary file was written by meshio, which retains only the first
+        # physical group of every entity, dropping the 'extra' group
+        for tag in 'neumann', 'dirichlet', 'iface':
+            self.assertAllEqual(binary['btags'][tag], ascii['btags'][tag])
+
+    def test_memorymapped(self):
+        path = pathlib.Path(__file__).parent/'test_mesh'/'mesh2d_p2_v4_binary.msh'
+        with path.open('rb') as f:
+            mapped = mesh.parsegmsh(f)
+        with path.open('rb') as f:
+            buffered = mesh.parsegmsh(io.BufferedReader(io.BytesIO(f.read())))
+        for name in 'nodes', 'cnodes', 'coords':
+            self.assertAllEqual(mapped[name], buffered[name])
+
+
+class gmshascii(TestCase):
+
+    @requires('meshio')
+    def test_parse(self):
+        path = pathlib.Path(__file__).parent/'test_mesh'
+        for name in 'mesh2d_p1_v4', 'mesh2d_p2_v4', 'mesh3d_p2_v4', 'mesh3dmani_p2_v4':
+            with self.subTest(name), (path/(name+'.msh')).open('rb') as f:
+                coords, nodes, identities, tags = mesh._parsemsh41(f)
+                f.seek(0)
+                desired_coords, desired_nodes, desired_identities, desired_tags = mesh._parsegmsh_meshio(f)
+                self.assertAllEqual(coords, desired_coords)
+                self.assertEqual(nodes.keys(), desired_nodes.keys())
+                for nd in nodes:
+                    self.assertAllEqual(nodes[nd], desired_nodes[nd])
+                self.assertAllEqual(identities, desired_identities)
+                self.assertEqual(sorted((nd, tag) for nd, tag, elems in tags), sorted((nd, tag) for nd, tag, elems in desired_tags))
+                desired_tags = {(nd, tag): elems for nd, tag, elems in desired_tags}
+                for nd, tag, elems in tags:
+                    self.assertAllEqual(elems, desired_tags[nd, tag])
+
+    def test_memorymapped(self):
+        path = pathlib.Path(__file__).parent/'test_mesh'/'mesh2d_p2_v4.msh'
+        with path.open('rb') as f:
+            mapped = mesh.parsegmsh(f)
+        with path.open('rb') as f:
+            buffered = mesh.parsegmsh(io.BufferedReader(io.BytesIO(f.read())))
+        for name in 'nodes', 'cnodes', 'coords':
+            self.assertAllEqual(mapped[name], buffered[name])
+
+    def test_invalid(self):
+        path = pathlib.Path(__file__).parent/'test_mesh'/'mesh2d_p1_v4.msh'
+        data = path.read_bytes().replace(b'$Nodes\n', b'$Nodes\nx ', 1)
+        with self.assertRaisesRegex(ValueError, 'invalid data in msh section'):
+            mesh.parsegmsh(io.BufferedReader(io.BytesIO(data)))
+
+
+class simplex(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.domain, self.geom = self.simplex()
+
+    def simplex(self):
+        # unit square of two triangles, with the diagonal tagged from the
+        # side of the second triangle
+        nodes = numpy.array([[0, 1, 2], [1, 2, 3]])
+        coords = numpy.array([[0., 0.], [1., 0.], [0., 1.], [1., 1.]])
+        return mesh.simplex(nodes=nodes, cnodes=nodes, coords=coords,
+            tags={'lower': numpy.array([0]), 'upper': numpy.array([1])},
+            btags={'left': numpy.array([[0, 1]]), 'top': numpy.array([[1, 0]]), 'diag': numpy.array([[1, 2]])},
+            ptags={'corner': numpy.array([1])})
+
+    def test_boundary(self):
+        self.assertEqual(len(self.domain.boundary['left']), 1)
+        self.assertEqual(len(self.domain.boundary['top']), 1)
+        self.assertAllAlmostEqual(self.domain.boundary['left'].integral(self.geom[1] * function.J(self.geom), degree=1).eval(), .5)
+        self.assertAllAlmostEqual(self.domain.boundary['top'].integral(self.geom[0] * function.J(self.geom), degree=1).eval(), .5)
+
+    def test_interface(self):
+        iface = self.domain.interfaces['diag']
+        self.assertEqual(len(iface), 1)
+        self.assertAllAlmostEqual(iface.sample('bezier', 2).eval(self.geom), iface.sample('bezier', 2).eval(function.opposite(self.geom)))
+        self.assertAllAlmostEqual(iface.integral(self.geom.normal() * function.J(self.geom), degree=1).eval(), [-1, -1])
+
+    def test_subdomain_boundary(self):
+        for name, normal in ('lower', [1, 1]), ('upper', [-1, -1]):
+            with self.subTest(name):
+                diag = self.domain[name].boundary['diag']
+                self.assertEqual(len(diag), 1)
+                self.assertAllAlmostEqual(diag.integral(self.geom.normal() * function.J(self.geom), degree=1).eval(), normal)
+                with self.assertRaises(KeyError):
+                    self.domain[name].interfaces['diag']
+
+    def test_points(self):
+        self.assertAllAlmostEqual(self.domain.points['corner'].sample('gauss', 1).eval(self.geom), [[1, 0]] * 2)
+        self.assertAllAlmostEqual(self.domain['upper'].points['corner'].sample('gauss', 1).eval(self.geom), [[1, 0]])
+
+
+class refinesimplex(simplex):
+
+    def simplex(self):
+        # unit square of two triangles, refined into eight
+        nodes = numpy.array([[0, 1, 2], [1, 2, 3]])
+        coords = numpy.array([[0., 0.], [1., 0.], [0., 1.], [1., 1.]])
+        self.coarse = dict(nodes=nodes, cnodes=nodes, coords=coords,
+            tags={'lower': numpy.array([0]), 'upper': numpy.array([1])},
+            btags={'left': numpy.array([[0, 1]]), 'top': numpy.array([[1, 0]]), 'diag': numpy.array([[1, 2]])},
+            ptags={'corner': numpy.array([1])})
+        refined, self.parents, self.interpolation = mesh.refinesimplex(**self.coarse)
+        return mesh.simplex(**refined)
+
+    def test_boundary(self):
+        self.assertEqual(len(self.domain.boundary['left']), 2)
+        self.assertEqual(len(self.domain.boundary['top']), 2)
+        self.assertAllAlmostEqual(self.domain.boundary['left'].integral(self.geom[1] * function.J(self.geom), degree=1).eval(), .5)
+        self.assertAllAlmostEqual(self.domain.boundary['top'].integral(self.geom[0] * function.J(self.geom), degree=1).eval(), .5)
+
+    def test_interface(self):
+        iface = self.domain.interfaces['diag']
+        self.assertEqual(len(iface), 2)
+        self.assertAllAlmostEqual(iface.sample('bezier', 2).eval(self.geom), iface.sample('bezier', 2).eval(function.opposite(self.geom)))
+        self.assertAllAlmostEqual(iface.integral(self.geom.normal() * function.J(self.geom), degree=1).eval(), [-1, -1])
+
+    def test_subdomain_boundary(self):
+        for name, normal in ('lower', [1, 1]), ('upper', [-1, -1]):
+            with self.subTest(name):
+                diag = self.domain[name].boundary['diag']
+                self.assertEqual(len(diag), 2)
+                self.assertAllAlmostEqual(diag.integral(self.geom.normal() * function.J(self.geom), degree=1).eval(), normal)
+
+    def test_children(self):
+        coarse, geom = mesh.simplex(**self.coarse)
+        self.assertAllEqual(self.parents, numpy.arange(2).repeat(4))
+        self.assertAllAlmostEqual(self.domain.sample('gauss', 1).eval(self.geom), coarse.refined.sample('gauss', 1).eval(geom))
+
+    def test_interpolation(self):
+        self.assertAllEqual(self.interpolation[:4], numpy.arange(4).repeat(2).reshape(4, 2))
+        self.assertAllEqual(numpy.sort(self.interpolation[4:], axis=0), [[0, 1], [0, 2], [1, 2], [1, 3], [2, 3]])
+
+    def test_tetrahedron(self):
+        nodes = numpy.array([[0, 1, 2, 3]])
+        coords = numpy.array([[0., 0., 0.], [1., 0., 0.], [0., 1., 0.], [0., 0., 1.]])
+        args = dict(nodes=nodes, cnodes=nodes, coords=coords, tags={}, btags={'x': numpy.array([[0, 1]])}, ptags={})
+        for i in range(2):
+            args, parents, interpolation = mesh.refinesimplex(**args)
+        domain, geom = mesh.simplex(**args)
+        self.assertEqual(len(domain), 64)
+        self.assertEqual(len(domain.boundary), 64)
+        self.assertAllAlmostEqual(domain.integral(function.J(geom), degree=1).eval(), 1/6)
+        self.assertAllAlmostEqual(domain.boundary['x'].integral(geom[0] * function.J(geom), degree=1).eval(), 0)
+        self.assertAllAlmostEqual(domain.boundary['x'].integral(function.J(geom), degree=1).eval(), .5)
+
+    def test_higherorder(self):
+        with self.assertRaises(NotImplementedError):
+            mesh.refinesimplex(nodes=numpy.array([[0, 1]]), cnodes=numpy.array([[0, 1, 2]]), coords=numpy.array([[0.], [.5], [1.]]), tags={}, btags={}, ptags={})
+
+
+class simplexcache(simplex):
+
+    def setUp(self):
+        cachedir = pathlib.Path(self.enter_context(tempfile.TemporaryDirectory()))
+        self.enter_context(cache.enable(cachedir))
+        self.mesh_cache = cachedir / 'mesh'
+        self.simplex()  # store
+        super().setUp()  # load
+
+    def test_store(self):
+        cachepath, = self.mesh_cache.iterdir()
+        self.assertTrue((cachepath / 'index.json').is_file())
+
+    def assertMapped(self, array):
+        while not isinstance(array, numpy.memmap):
+            self.assertIsInstance(array, numpy.ndarray)
+            array = array.base
+
+    def test_mmap(self):
+        self.assertMapped(self.domain.basetopo.simplices)
+        self.assertMapped(self.domain.basetopo.connectivity)
+        self.assertAllEqual(self.domain.basetopo.connectivity, [[1, -1, -1], [-1, -1, 0]])
+
+    def test_corrupt(self):
+        cachepath, = self.mesh_cache.iterdir()
+        (cachepath / '0.npy').write_bytes(b'corrupt')
+        domain, geom = self.simplex()
+        self.assertAllEqual(domain.basetopo.simplices, [[0, 1, 2], [1, 2, 3]])
+
+    def test_source(self):
+        with mock.patch.object(util, 'source_hash', return_value=b'modified'):
+            self.simplex()
+        self.assertEqual(len(list(self.mesh_cache.iterdir())), 2)
+
+
+class gmshcache(TestCase):
+
+    def test_load(self):
+        path = pathlib.Path(__file__).parent/'test_mesh'/'mesh2d_p2_v4.msh'
+        with tempfile.TemporaryDirectory() as cachedir, cache.enable(cachedir):
+            stored, geom = mesh.gmsh(path)
+            loaded, geom = mesh.gmsh(path)
+            self.assertEqual(len(list(pathlib.Path(cachedir, 'mesh').iterdir())), 1)
+        self.assertIsInstance(loaded.basetopo.simplices.base, numpy.memmap)
+        self.assertAllEqual(loaded.basetopo.simplices, stored.basetopo.simplices)
+        for name in 'neumann', 'dirichlet', 'extra':
+            self.assertEqual(len(loaded.boundary[name]), len(stored.boundary[name]))
+        self.assertEqual(len(loaded['left'].boundary['iface']), len(stored['left'].boundary['iface']))
+        self.assertAllAlmostEqual(loaded.integrate(function.J(geom), degree=1), 2)
+
+    def test_unwritable(self):
+        path = pathlib.Path(__file__).parent/'test_mesh'/'mesh2d_p2_v4.msh'
+        with tempfile.TemporaryDirectory() as cachedir, cache.enable(cachedir):
+            with mock.patch('numpy.save', side_effect=OSError('no space left on device')), self.assertLogs('nutils', logging.DEBUG) as cm:
+                topo, geom = mesh.gmsh(path)
+            self.assertEqual(list(pathlib.Path(cachedir, 'mesh').iterdir()), [])
+        self.assertTrue(any('failed to store' in line for line in cm.output))
+        self.assertAllAlmostEqual(topo.integrate(function.J(geom), degree=1), 2)
+
+
 @parametrize
 class gmshmanifold(TestCase):
 
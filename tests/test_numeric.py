@@ -148,6 +148,82 @@ class invmap(TestCase):
         self.assertAllEqual(invmap, [9, 1, 9, 0, 9])
 
 
+class reverse_cuthill_mckee(TestCase):
+
+    def bandwidth(self, indptr, indices, perm):
+        renumber = numeric.invmap(perm, length=len(perm))
+        rows = numpy.arange(len(perm)).repeat(numpy.diff(indptr))
+        return numpy.abs(renumber[rows] - renumber[indices]).max()
+
+    def scrambled_path(self, n, seed):
+        scramble = numpy.random.RandomState(seed).permutation(n)
+        edges = numpy.concatenate([[scramble[:-1], scramble[1:]], [scramble[1:], scramble[:-1]]], axis=1)
+        edges = edges[:, numpy.lexsort(edges[::-1])]
+        return edges[0].searchsorted(numpy.arange(n+1)), edges[1]
+
+    def test_path(self):
+        indptr, indices = self.scrambled_path(20, seed=0)
+        perm = numeric.reverse_cuthill_mckee(indptr, indices)
+        self.assertAllEqual(numpy.sort(perm), numpy.arange(20))
+        self.assertEqual(self.bandwidth(indptr, indices, perm), 1)
+
+    def test_disconnected(self):
+        indptr1, indices1 = self.scrambled_path(10, seed=1)
+        indptr2, indices2 = self.scrambled_path(5, seed=2)
+        indptr = numpy.concatenate([indptr1, indptr2[1:] + indptr1[-1], [indptr1[-1] + indptr2[-1]]])
+        indices = numpy.concatenate([indices1, indices2 + 10])
+        perm = numeric.reverse_cuthill_mckee(indptr, indices)
+        self.assertAllEqual(numpy.sort(perm), numpy.arange(16))
+        self.assertEqual(self.bandwidth(indptr, indices, perm), 1)
+
+    def test_empty(self):
+        self.assertAllEqual(numeric.reverse_cuthill_mckee([0], []), [])
+
+
+class partition_graph(TestCase):
+
+    def scrambled_path(self, n, seed):
+        scramble = numpy.random.RandomState(seed).permutation(n)
+        edges = numpy.concatenate([[scramble[:-1], scramble[1:]], [scramble[1:], scramble[:-1]]], axis=1)
+        edges = edges[:, numpy.lexsort(edges[::-1])]
+        return scramble, edges[0].searchsorted(numpy.arange(n+1)), edges[1]
+
+    def test_path(self):
+        scramble, indptr, indices = self.scrambled_path(20, seed=0)
+        for nparts in 1, 2, 3, 4:
+            with self.subTest(nparts=nparts):
+                parts = numeric.partition_graph(indptr, indices, nparts)
+                self.assertEqual(sorted(numpy.bincount(parts, minlength=nparts)), sorted(numpy.diff(numpy.arange(nparts+1) * 20 // nparts)))
+                # every part is a contiguous stretch of the path
+                self.assertEqual(numpy.not_equal(parts[scramble[1:]], parts[scramble[:-1]]).sum(), nparts - 1)
+
+    def test_grid(self):
+        n = 16
+        ielems = numpy.arange(n*n).reshape(n, n)
+        pairs = numpy.concatenate([[ielems[1:].ravel(), ielems[:-1].ravel()], [ielems[:, 1:].ravel(), ielems[:, :-1].ravel()]], axis=1)
+        rows, cols = numpy.concatenate([pairs, pairs[::-1]], axis=1)
+        order = numpy.lexsort([cols, rows])
+        parts = numeric.partition_graph(rows[order].searchsorted(numpy.arange(n*n+1)), cols[order], 4)
+        self.assertAllEqual(numpy.bincount(parts), [64] * 4)
+        self.assertLessEqual(numpy.not_equal(parts[pairs[0]], parts[pairs[1]]).sum(), 4 * n)
+
+    def test_disconnected(self):
+        parts = numeric.partition_graph([0, 1, 2, 2, 3, 4], [1, 0, 4, 3], 2)
+        self.assertEqual(sorted(numpy.bincount(parts)), [2, 3])
+
+    def test_more_parts_than_nodes(self):
+        parts = numeric.partition_graph([0, 1, 2], [1, 0], 3)
+        self.assertEqual(len(set(parts.tolist())), 2)
+        self.assertTrue(numpy.less(parts, 3).all())
+
+    def test_empty(self):
+        self.assertAllEqual(numeric.partition_graph([0], [], 2), [])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            numeric.partition_graph([0], [], 0)
+
+
 class istype(TestCase):
 
     def test_isint(self):
@@ -57,6 +57,28 @@ class Test(testing.TestCase):
         self.assertEqual(min(a), 0)
         self.assertEqual(max(a), 2 if canfork else 0)
 
+    def test_range_blocks(self):
+        r = parallel.range(12, 3)
+        r.claim(1)
+        self.assertEqual([next(r) for i in range(4)], [4, 5, 6, 7])
+        # block 1 is exhausted, take over the upper half of block 0
+        self.assertEqual(next(r), 2)
+        r.claim(2)
+        self.assertEqual(list(r), [8, 9, 10, 11, 1, 0, 3])
+
+    def test_range_procs(self):
+        a = parallel.shempty([32], dtype=int)
+        a[:] = -1
+        r = parallel.range(len(a), 3)
+        with parallel.fork() as procid:
+            r.claim(procid)
+            for i in r:
+                a[i] = procid
+                time.sleep(.01)
+        self.assertEqual(min(a), 0)
+        self.assertEqual(max(a), 2 if canfork else 0)
+        self.assertEqual(a[0], 0)
+
     def test_ctxrange(self):
         a = parallel.shzeros([32], dtype=int)
         with parallel.ctxrange('test', len(a)) as r:
@@ -1,4 +1,4 @@
-from nutils import element, mesh, topology, function, transformseq, evaluable, transform, _util as util
+from nutils import element, mesh, topology, function, transformseq, evaluable, transform, parallel, _util as util
 from nutils.testing import TestCase, parametrize
 from nutils.elementseq import References
 import numpy
@@ -10,6 +10,7 @@ import base64
 import itertools
 import os
 import unittest
+from unittest import mock
 
 
 def as_rounded_list(data):
@@ -1044,6 +1045,169 @@ trimmedhierarchical('2d', ndims=2)
 trimmedhierarchical('3d', ndims=3)
 
 
+@parametrize
+class hierarchicalbasis(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        domain, self.geom = mesh.rectilinear([numpy.linspace(0, 1, 5)]*2)
+        if self.trimmed:
+            domain = domain.trim(1.8 - self.geom.sum(), maxrefine=4)
+        self.domain = domain.refined_by([])
+
+    def assertBasisEqual(self, domain):
+        basis = domain.basis(self.btype, degree=2)
+        fresh = topology.HierarchicalTopology(domain.basetopo, domain._indices_per_level).basis(self.btype, degree=2)
+        self.assertEqual(basis.ndofs, fresh.ndofs)
+        for ielem in range(len(domain)):
+            self.assertAllEqual(basis.get_dofs(ielem), fresh.get_dofs(ielem))
+            self.assertAllAlmostEqual(basis.get_coefficients(ielem), fresh.get_coefficients(ielem))
+
+    def test_incremental(self):
+        domain = self.domain
+        domain.basis(self.btype, degree=2)
+        for refine in [0, 5], [1, 2, 17], [3, 30]:
+            domain = domain.refined_by(refine)
+            self.assertBasisEqual(domain)
+
+    def test_refined_by_all(self):
+        domain = self.domain.refined_by([0, 5]).refined_by([1, 2, 17])
+        refined = domain.refined_by(range(len(domain)))
+        self.assertEqual([i.tolist() for i in refined._indices_per_level], [i.tolist() for i in domain.refined._indices_per_level])
+        self.assertBasisEqual(refined)
+
+    def test_coefficient_tables(self):
+        # The polynomials are derived from the coefficient tables of the level
+        # bases, at a cost that does not scale with the number of elements.
+        domain = self.domain.refined_by([0, 5]).refined_by([1, 2, 17])
+        with mock.patch.object(function.Basis, 'get_coefficients', side_effect=AssertionError('coefficients evaluated per element')):
+            basis = domain.basis(self.btype, degree=2)
+        fresh = topology.HierarchicalTopology(domain.basetopo, domain._indices_per_level).basis(self.btype, degree=2)
+        for ielem in range(len(domain)):
+            self.assertAllAlmostEqual(basis.get_coefficients(ielem), fresh.get_coefficients(ielem))
+
+    def test_refined(self):
+        domain = self.domain.refined_by([0, 5]).refined_by([1, 2])
+        if not self.trimmed:
+            self.assertEqual(len(domain.refined), 4 * len(domain))
+        self.assertAlmostEqual(domain.refined.integrate(function.J(self.geom), degree=1), domain.integrate(function.J(self.geom), degree=1))
+
+
+for btype in 'h-std', 'th-std', 'h-spline', 'th-spline':
+    hierarchicalbasis(btype, btype=btype, trimmed=False)
+hierarchicalbasis('th-std-trimmed', btype='th-std', trimmed=True)
+
+
+@parametrize
+class hierarchicalrefinement(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.coarse = self.topo()
+        self.fine = self.coarse.refined
+        self.refinement = topology.HierarchicalTopology._refinement(self.coarse)
+        self.assertIsNotNone(self.refinement)
+
+    def test_children(self):
+        children, parents, child_transforms = self.refinement
+        for index in range(len(self.coarse)):
+            trans = self.coarse.transforms[index]
+            expect = sorted(self.fine.transforms.index(trans+(ctrans,)) for ctrans, cref in self.coarse.references[index].children if cref)
+            self.assertEqual(children(numpy.array([index])).tolist(), expect)
+
+    def test_parents(self):
+        children, parents, child_transforms = self.refinement
+        indices, ichild = parents(numpy.arange(len(self.fine)))
+        for index, (parent, child) in enumerate(zip(indices, ichild)):
+            self.assertEqual(self.fine.transforms[index], self.coarse.transforms[parent]+(child_transforms[child],))
+
+
+def _subset_topo():
+    topo, geom = mesh.rectilinear([3, 3])
+    return topo.subset(topo[:2], newboundary='x')
+
+
+hierarchicalrefinement('structured', topo=lambda: mesh.rectilinear([3, 2])[0])
+hierarchicalrefinement('periodic', topo=lambda: mesh.rectilinear([3, 2], periodic=[0])[0].refined)
+hierarchicalrefinement('sliced', topo=lambda: mesh.rectilinear([4, 3])[0][1:, 1:])
+hierarchicalrefinement('simplex', topo=lambda: mesh.unitsquare(2, 'triangle')[0])
+hierarchicalrefinement('subset', topo=_subset_topo)
+
+
+@parametrize
+class partition(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.topo, self.geom = self.mesh()
+
+    def test_parts(self):
+        for nparts in 1, 2, 3:
+            with self.subTest(nparts=nparts):
+                parts = self.topo.partition(nparts)
+                self.assertEqual(len(parts), nparts)
+                self.assertEqual(sorted(numpy.concatenate(parts).tolist()), list(range(len(self.topo))))
+                for part in parts:
+                    self.assertEqual(part.tolist(), sorted(part))
+                sizes = [len(part) for part in parts]
+                self.assertLessEqual(max(sizes) - min(sizes), 1)
+
+    @parametrize.enable_if(lambda convex, **params: convex)
+    def test_connected(self):
+        # the bisection of these meshes follows a single level set
+        ielems, jelems = self.topo._element_pairs()
+        for part in self.topo.partition(2):
+            inpart = numpy.zeros(len(self.topo), dtype=bool)
+            inpart[part] = True
+            keep = inpart[ielems] & inpart[jelems]
+            reached = numpy.zeros(len(self.topo), dtype=bool)
+            reached[part[0]] = True
+            for i in range(len(part)):
+                reached[jelems[keep & reached[ielems]]] = True
+                reached[ielems[keep & reached[jelems]]] = True
+            self.assertAllEqual(reached, inpart)
+
+    def test_integrate(self):
+        sample = self.topo.sample('gauss', 2)
+        partitioned = sample.take_elements(numpy.concatenate(self.topo.partition(3)))
+        self.assertAllAlmostEqual(partitioned.integrate(function.J(self.geom)), sample.integrate(function.J(self.geom)))
+
+    def test_integrate_parallel(self):
+        basis = self.topo.basis('discont', degree=1)
+        integrand = function.outer(basis) * function.J(self.geom)
+        sample = self.topo.sample('gauss', 2)
+        desired = sample.integrate(integrand).export('dense')
+        partitioned = sample.take_elements(numpy.concatenate(self.topo.partition(3)))
+        with parallel.maxprocs(3):
+            actual = partitioned.integrate(integrand).export('dense')
+            self.assertAllAlmostEqual(self.topo.integrate(integrand, degree=2).export('dense'), desired)
+        self.assertAllAlmostEqual(actual, desired)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.topo.partition(0)
+        with self.assertRaises(ValueError):
+            self.topo.partition(1.)
+
+    def test_numpy_integer(self):
+        self.assertEqual(len(self.topo.partition(numpy.int64(2))), 2)
+
+    def test_cached(self):
+        parts = self.topo.partition(2)
+        with mock.patch.object(type(self.topo), '_element_pairs', side_effect=AssertionError('partition recomputed')):
+            self.assertIs(self.topo.partition(2), parts)
+            self.assertIs(self.topo.partition(numpy.int64(2)), parts)
+
+
+partition('structured', mesh=lambda: mesh.rectilinear([4, 3]), convex=True)
+partition('periodic', mesh=lambda: mesh.rectilinear([4, 3], periodic=[0]), convex=True)
+partition('simplex', mesh=lambda: mesh.unitsquare(4, 'triangle'), convex=False)
+partition('hierarchical', mesh=lambda: (lambda topo, geom: (topo.refined_by([0, 5]), geom))(*mesh.rectilinear([4, 3])), convex=True)
+partition('boundary', mesh=lambda: (lambda topo, geom: (topo.boundary, geom))(*mesh.rectilinear([4, 3])), convex=False)
+partition('hierarchical:boundary', mesh=lambda: (lambda topo, geom: (topo.refined_by([0, 5]).boundary, geom))(*mesh.rectilinear([4, 3])), convex=False)
+partition('hierarchical:interfaces', mesh=lambda: (lambda topo, geom: (topo.refined_by([0, 5]).interfaces, geom))(*mesh.rectilinear([4, 3])), convex=False)
+
+
 @parametrize
 class multipatch_hyperrect(TestCase, TopologyAssertions):
 
@@ -145,6 +145,53 @@ class Common:
             self.assertEqual(refined.index(trans), i)
 
 
+    def test_affine(self):
+        maps = self.seq.affine()
+        self.assertIs(self.seq.affine(), maps)
+        points = numpy.linspace(0, 1, 3*self.checkfromdims).reshape(3, self.checkfromdims)
+        for i, trans in enumerate(self.check):
+            index, linear, offset = maps[i]
+            self.assertEqual(index, 0)
+            self.assertFalse(linear.flags.writeable)
+            self.assertAllAlmostEqual(points @ linear.T + offset, transform.apply(trans, points))
+
+    def test_affine_lazy(self):
+        maps = nutils.transformseq.AffineMaps(self.seq, None)
+        if not len(maps):
+            return
+        index, linear, offset = maps[-1]
+        self.assertEqual(numpy.flatnonzero(maps._computed).tolist(), [len(maps)-1])
+        self.assertAllEqual(maps[len(maps)-1][1], linear)
+        index, linear, offset = maps[numpy.array([[0], [0]], dtype=int)]
+        self.assertEqual(numpy.flatnonzero(maps._computed).tolist(), sorted({0, len(maps)-1}))
+        self.assertEqual(index.shape, (2, 1))
+        self.assertEqual(linear.shape, (2, 1, self.seq.todims, self.checkfromdims))
+        self.assertEqual(offset.shape, (2, 1, self.seq.todims))
+
+    def test_affine_self(self):
+        index, linear, offset = self.seq.affine(self.seq)[:]
+        self.assertAllEqual(index, numpy.arange(len(self.check)))
+        self.assertAllEqual(linear, numpy.eye(self.checkfromdims)[numpy.newaxis].repeat(len(self.check), axis=0))
+        self.assertAllEqual(offset, numpy.zeros((len(self.check), self.checkfromdims)))
+
+    def test_affine_refined(self):
+        refined = self.seq.refined(self.checkrefs)
+        index, linear, offset = refined.affine(self.seq)[:]
+        ctransforms = [(i, ctrans) for i, ref in enumerate(self.checkrefs) for ctrans in ref.child_transforms]
+        self.assertAllEqual(index, [i for i, ctrans in ctransforms])
+        for linear_i, offset_i, (_, ctrans) in zip(linear, offset, ctransforms):
+            self.assertAllAlmostEqual(linear_i, ctrans.linear)
+            self.assertAllAlmostEqual(offset_i, ctrans.offset)
+        maps = refined.affine()
+        points = numpy.linspace(0, 1, 3*self.checkfromdims).reshape(3, self.checkfromdims)
+        index, linear, offset = maps[::-1]
+        for linear_i, offset_i, trans in zip(linear, offset, reversed(tuple(refined))):
+            self.assertAllAlmostEqual(points @ linear_i.T + offset_i, transform.apply(trans, points))
+        for i, trans in enumerate(refined):
+            index, linear, offset = maps[i]
+            self.assertAllAlmostEqual(points @ linear.T + offset, transform.apply(trans, points))
+
+
 class Edges:
 
     def test_edges(self):
@@ -258,6 +305,43 @@ class UniformDerivedTransforms(TestCase, Common, Edges):
         self.checkfromdims = 1
 
 
+class ArrayTransforms(TestCase, Common, Edges):
+    def setUp(self):
+        super().setUp()
+        self.seq = nutils.transformseq.ArrayTransforms(nutils.transformseq.PlainTransforms(((x1, i10), (x1, i11)), 1, 1), types.arraydata([[1, 0], [0, 1], [1, 1]]), ((c0, c1),))
+        self.check = (x1, i11, c0), (x1, i10, c1), (x1, i11, c1)
+        self.checkmissing = (l1, i10), (x1, i10), (x1, i11), (x1, i10, c0), (r1, i10)
+        self.checkrefs = References.uniform(line, 3)
+        self.checktodims = 1
+        self.checkfromdims = 1
+
+    def test_indices_with_tails(self):
+        indices, tails = self.seq.indices_with_tails(((x1, i10, c1), (x1, i11, c0, e1), (x1, i11, c1)))
+        self.assertAllEqual(indices, [1, 0, 2])
+        self.assertEqual(tails, ((), (e1,), ()))
+
+    def test_indices_with_tails_missing(self):
+        with self.assertRaises(ValueError):
+            self.seq.indices_with_tails(((x1, i10, c1), (x1, i10, c0)))
+
+    def test_refined_array(self):
+        self.assertIsInstance(self.seq.refined(self.checkrefs), nutils.transformseq.ArrayTransforms)
+
+
+class ArrayTransformsEdges(TestCase, Common, Edges):
+    def setUp(self):
+        super().setUp()
+        self.seq = nutils.transformseq.ArrayTransforms(nutils.transformseq.IndexTransforms(2, 2), types.arraydata([[0, 0, 1], [1, 3, 0], [0, 2, 3]]), (square.child_transforms, square.edge_transforms))
+        self.check = (i20, c00, e01), (i21, c11, e00), (i20, c10, e11)
+        self.checkmissing = (i20,), (i20, c00, e00), (i22, c00, e01)
+        self.checkrefs = References.uniform(line, 3)
+        self.checktodims = 2
+        self.checkfromdims = 1
+
+    def test_edges_array(self):
+        self.assertIsInstance(self.seq.edges(self.checkrefs), nutils.transformseq.ArrayTransforms)
+
+
 class ChainedTransforms(TestCase, Common, Edges):
     def setUp(self):
         super().setUp()
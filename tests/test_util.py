@@ -77,6 +77,14 @@ class binaryfile(TestCase):
             util.binaryfile(None)
 
 
+class source_hash(TestCase):
+
+    def test_digest(self):
+        self.assertEqual(len(util.source_hash()), 20)
+        util.source_hash.cache_clear()
+        self.assertEqual(util.source_hash(), util.source_hash())
+
+
 class single_or_multiple(TestCase):
 
     def test_function(self):